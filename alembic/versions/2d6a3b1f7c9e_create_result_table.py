@@ -0,0 +1,39 @@
+"""Create result table
+
+Revision ID: 2d6a3b1f7c9e
+Revises: 4b1d4c4d9a2e
+Create Date: 2015-01-19 11:02:37.441205
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2d6a3b1f7c9e'
+down_revision = '4b1d4c4d9a2e'
+
+from alembic import op
+import sqlalchemy as sa
+import datetime
+
+
+def make_timestamp():
+    now = datetime.datetime.utcnow()
+    return now.isoformat()
+
+
+def upgrade():
+    op.create_table(
+    'result',
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('created', sa.Text, default=make_timestamp),
+    sa.Column('updated', sa.Text, default=make_timestamp),
+    sa.Column('app_id', sa.Integer, sa.ForeignKey('app.id', ondelete='CASCADE'), nullable=False),
+    sa.Column('task_id', sa.Integer, sa.ForeignKey('task.id', ondelete='CASCADE'), nullable=False, unique=True),
+    sa.Column('n_answers', sa.Integer, default=0),
+    sa.Column('info', sa.Text),
+    )
+    op.create_index('result_app_id_id_idx', 'result', ['app_id', 'id'])
+
+
+def downgrade():
+    op.drop_index('result_app_id_id_idx', 'result')
+    op.drop_table('result')
@@ -0,0 +1,22 @@
+"""Add task_id index to task_run
+
+Revision ID: 3f1c7e2a9b4d
+Revises: 5a0e1d6c3b7f
+Create Date: 2015-03-02 11:20:41.532118
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3f1c7e2a9b4d'
+down_revision = '5a0e1d6c3b7f'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_index('task_run_task_id_idx', 'task_run', ['task_id'])
+
+
+def downgrade():
+    op.drop_index('task_run_task_id_idx', 'task_run')
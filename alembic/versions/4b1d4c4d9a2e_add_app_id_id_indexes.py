@@ -0,0 +1,24 @@
+"""Add (app_id, id) indexes to task and task_run
+
+Revision ID: 4b1d4c4d9a2e
+Revises: 38a8a6299086
+Create Date: 2015-01-12 10:14:52.118347
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4b1d4c4d9a2e'
+down_revision = '38a8a6299086'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_index('task_app_id_id_idx', 'task', ['app_id', 'id'])
+    op.create_index('task_run_app_id_id_idx', 'task_run', ['app_id', 'id'])
+
+
+def downgrade():
+    op.drop_index('task_app_id_id_idx', 'task')
+    op.drop_index('task_run_app_id_id_idx', 'task_run')
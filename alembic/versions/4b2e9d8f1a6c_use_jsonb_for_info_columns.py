@@ -0,0 +1,37 @@
+"""Use JSONB for the info columns, with GIN indexes
+
+Revision ID: 4b2e9d8f1a6c
+Revises: 3f1c7e2a9b4d
+Create Date: 2015-03-09 10:12:37.204511
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4b2e9d8f1a6c'
+down_revision = '3f1c7e2a9b4d'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+tables = ['app', 'user', 'task', 'task_run', 'result']
+indexed = ['app', 'user', 'task', 'task_run']
+
+
+def upgrade():
+    for table in tables:
+        query = ('ALTER TABLE "%s" ALTER COLUMN info TYPE JSONB '
+                 'USING info::jsonb' % table)
+        op.execute(query)
+    for table in indexed:
+        op.create_index('%s_info_idx' % table, table, ['info'],
+                        postgresql_using='gin')
+
+
+def downgrade():
+    for table in indexed:
+        op.drop_index('%s_info_idx' % table, table)
+    for table in tables:
+        query = ('ALTER TABLE "%s" ALTER COLUMN info TYPE TEXT '
+                 'USING info::text' % table)
+        op.execute(query)
@@ -0,0 +1,49 @@
+"""Add info_hash column to task
+
+Revision ID: 5a0e1d6c3b7f
+Revises: 2d6a3b1f7c9e
+Create Date: 2015-01-26 16:40:05.732810
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5a0e1d6c3b7f'
+down_revision = '2d6a3b1f7c9e'
+
+from alembic import op
+import sqlalchemy as sa
+import json
+from hashlib import md5
+
+
+def make_info_hash(info):
+    if info is None:
+        info = {}
+    return md5(json.dumps(info, sort_keys=True)).hexdigest()
+
+
+def upgrade():
+    op.add_column('task', sa.Column('info_hash', sa.Text))
+    conn = op.get_bind()
+    task = sa.sql.table('task', sa.sql.column('id', sa.Integer),
+                        sa.sql.column('info', sa.Text),
+                        sa.sql.column('info_hash', sa.Text))
+    # Hash the existing tasks in batches, following the primary key
+    last_id = 0
+    while True:
+        rows = conn.execute(sa.select([task.c.id, task.c.info])
+                            .where(task.c.id > last_id)
+                            .order_by(task.c.id).limit(1000)).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            info = json.loads(row.info) if row.info else None
+            conn.execute(task.update().where(task.c.id == row.id)
+                         .values(info_hash=make_info_hash(info)))
+        last_id = rows[-1].id
+    op.create_index('task_app_id_info_hash_idx', 'task', ['app_id', 'info_hash'])
+
+
+def downgrade():
+    op.drop_index('task_app_id_info_hash_idx', 'task')
+    op.drop_column('task', 'info_hash')
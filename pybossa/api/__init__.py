@@ -23,6 +23,7 @@ This package adds GET, POST, PUT and DELETE methods for:
     * categories,
     * tasks,
     * task_runs,
+    * results,
     * users,
     * global_stats,
     * vmcp
@@ -30,28 +31,41 @@ This package adds GET, POST, PUT and DELETE methods for:
 """
 
 import json
+import itertools
+from collections import OrderedDict
 from flask import Blueprint, request, abort, Response, \
     current_app, make_response
 from flask.ext.login import current_user
 from werkzeug.exceptions import NotFound
 from pybossa.util import jsonpify, crossdomain, get_user_id_or_ip
+from pybossa.util import make_etag, timestamp_to_datetime
+from pybossa.util import conditional_response, add_cache_headers
 import pybossa.model as model
 from pybossa.core import db, csrf, ratelimits, sentinel
 from itsdangerous import URLSafeSerializer
 from pybossa.ratelimit import ratelimit
-from pybossa.cache.apps import n_tasks
+import pybossa.cache.apps as cached_apps
+import pybossa.cache.users as cached_users
 import pybossa.sched as sched
 from pybossa.error import ErrorStatus
 from global_stats import GlobalStatsAPI
 from task import TaskAPI
 from task_run import TaskRunAPI
+from result import ResultAPI
 from app import AppAPI
 from category import CategoryAPI
 from vmcp import VmcpAPI
 from user import UserAPI
 from token import TokenAPI
 from sqlalchemy.sql import text
-from pybossa.core import project_repo, task_repo
+from sqlalchemy.exc import DBAPIError
+from pybossa.core import project_repo, task_repo, auditlog_repo
+from pybossa.auth import require
+from pybossa.progress import JobProgress
+from pybossa.model.app import App
+from pybossa.model.auditlog import tasks_update_log
+from pybossa.model.task import Task
+from pybossa.importers import batches, delete_cached_stats
 
 blueprint = Blueprint('api', __name__)
 
@@ -59,6 +73,12 @@ cors_headers = ['Content-Type', 'Authorization']
 
 error = ErrorStatus()
 
+BULK_TASKS_BATCH_SIZE = 1000
+# Projects whose user progress can be requested at once
+USER_PROGRESS_MAX_APPS = 100
+# Kinds of the background jobs of a project whose progress can be requested
+PROJECT_JOBS = ('delete_tasks', 'redundancy', 'ckan_export', 'results')
+
 
 @blueprint.route('/')
 @crossdomain(origin='*', headers=cors_headers)
@@ -91,6 +111,7 @@ register_api(AppAPI, 'api_app', '/app', pk='id', pk_type='int')
 register_api(CategoryAPI, 'api_category', '/category', pk='id', pk_type='int')
 register_api(TaskAPI, 'api_task', '/task', pk='id', pk_type='int')
 register_api(TaskRunAPI, 'api_taskrun', '/taskrun', pk='id', pk_type='int')
+register_api(ResultAPI, 'api_result', '/result', pk='id', pk_type='int')
 register_api(UserAPI, 'api_user', '/user', pk='id', pk_type='int')
 register_api(GlobalStatsAPI, 'api_globalstats', '/globalstats')
 register_api(VmcpAPI, 'api_vmcp', '/vmcp')
@@ -164,16 +185,234 @@ def user_progress(app_id=None, short_name=None):
             app = project_repo.get(app_id)
 
         if app:
-            # For now, keep this version, but wait until redis cache is used here for task_runs too
-            query_attrs = dict(app_id=app.id)
-            if current_user.is_anonymous():
-                query_attrs['user_ip'] = request.remote_addr or '127.0.0.1'
-            else:
-                query_attrs['user_id'] = current_user.id
-            taskrun_count = task_repo.count_task_runs_with(**query_attrs)
-            tmp = dict(done=taskrun_count, total=n_tasks(app.id))
-            return Response(json.dumps(tmp), mimetype="application/json")
+            user = get_user_id_or_ip()
+            # Any new task or task run of the project changes its updated
+            # timestamp, so the progress is not counted again until then
+            etag = make_etag('userprogress', app.id, app.updated,
+                             user['user_id'], user['user_ip'])
+            last_modified = timestamp_to_datetime(app.updated)
+            response = conditional_response(etag, last_modified, private=True)
+            if response is not None:
+                return response
+            tmp = cached_users.user_progress([app.id], **user)[app.id]
+            response = Response(json.dumps(tmp), mimetype="application/json")
+            return add_cache_headers(response, etag, last_modified,
+                                     private=True)
         else:
             return abort(404)
     else:  # pragma: no cover
         return abort(404)
+
+
+@jsonpify
+@blueprint.route('/userprogress')
+@crossdomain(origin='*', headers=cors_headers)
+@ratelimit(limit=ratelimits.get('LIMIT'), per=ratelimits.get('PER'))
+def users_progress():
+    """API endpoint for the user progress in many projects at once.
+
+    Return a JSON list with the progress of the user in every project of
+    the app_ids argument (comma separated, up to USER_PROGRESS_MAX_APPS):
+        [{'app_id': 1, 'done': 10, 'total': 100}, ...]
+
+    """
+    try:
+        app_ids = [int(app_id) for app_id in
+                   request.args.get('app_ids', '').split(',') if app_id]
+    except ValueError:
+        return abort(400)
+    if not app_ids or len(app_ids) > USER_PROGRESS_MAX_APPS:
+        return abort(400)
+    projects = project_repo.filter_by(criterion=App.id.in_(app_ids),
+                                      fields=['id'])
+    found = set(project.id for project in projects)
+    app_ids = [app_id for app_id in app_ids if app_id in found]
+    progress = cached_users.user_progress(app_ids, **get_user_id_or_ip())
+    data = [dict(progress[app_id], app_id=app_id) for app_id in app_ids]
+    return Response(json.dumps(data), mimetype="application/json")
+
+
+@jsonpify
+@blueprint.route('/app/<int:app_id>/import/<job_id>')
+@crossdomain(origin='*', headers=cors_headers)
+@ratelimit(limit=ratelimits.get('LIMIT'), per=ratelimits.get('PER'))
+def import_progress(app_id, job_id):
+    """API endpoint for the progress of a task import.
+
+    Return a JSON object with the state of the import (queued, running, done
+    or failed) and the number of rows parsed, inserted and skipped. Only the
+    owners of the project and admins can see it.
+
+    """
+    try:
+        app = project_repo.get(app_id)
+        if app is None:
+            raise NotFound
+        require.app.update(app)
+        progress = JobProgress(sentinel.master, 'import', job_id).get()
+        if progress is None or progress.get('app_id') != app.id:
+            raise NotFound
+        progress['id'] = job_id
+        return Response(json.dumps(progress), mimetype="application/json")
+    except Exception as e:
+        return error.format_exception(e, target='app', action='GET')
+
+
+@jsonpify
+@blueprint.route('/app/<int:app_id>/job/<kind>')
+@crossdomain(origin='*', headers=cors_headers)
+@ratelimit(limit=ratelimits.get('LIMIT'), per=ratelimits.get('PER'))
+def job_progress(app_id, kind):
+    """API endpoint for the progress of a background job of a project.
+
+    Return a JSON object with the state of the last job of the given kind
+    (one of PROJECT_JOBS) and its counters. The CKAN exports of the tasks
+    and the task runs are told apart by the type argument. Only the owners
+    of the project and admins can see it.
+
+    """
+    try:
+        if kind not in PROJECT_JOBS:
+            raise NotFound
+        app = project_repo.get(app_id)
+        if app is None:
+            raise NotFound
+        require.app.update(app)
+        identifier = app.id
+        if kind == 'ckan_export':
+            identifier = '%s:%s' % (app.id, request.args.get('type', 'task'))
+        progress = JobProgress(sentinel.master, kind, identifier).get()
+        if progress is None or progress.get('app_id') != app.id:
+            raise NotFound
+        progress['kind'] = kind
+        return Response(json.dumps(progress), mimetype="application/json")
+    except Exception as e:
+        return error.format_exception(e, target='app', action='GET')
+
+
+@jsonpify
+@csrf.exempt
+@blueprint.route('/app/<int:app_id>/tasks', methods=['PUT'])
+@crossdomain(origin='*', headers=cors_headers)
+@ratelimit(limit=ratelimits.get('LIMIT'), per=ratelimits.get('PER'))
+def update_tasks(app_id):
+    """API endpoint to update many tasks of a project at once.
+
+    The body is a JSON object with the new priority_0, n_answers and/or state
+    of the tasks in "set", and either their "task_ids" or a "filter" with the
+    attributes that the tasks must have. Return the number of updated tasks.
+    Only the owners of the project and admins can do it.
+
+    """
+    try:
+        app = project_repo.get(app_id)
+        if app is None:
+            raise NotFound
+        require.app.update(app)
+        data = json.loads(request.data)
+        filters = data.get('filter') or {}
+        for key in filters:
+            if key not in Task.__table__.columns.keys() or key == 'app_id':
+                raise AttributeError(key)
+        values, task_ids = data.get('set'), data.get('task_ids')
+        n = task_repo.update_tasks(app, values, task_ids=task_ids, **filters)
+        auditlog_repo.save(tasks_update_log(app, current_user, values, n,
+                                            'api', task_ids=task_ids,
+                                            filters=filters))
+        cached_apps.delete_app(app.short_name)
+        cached_apps.delete_n_completed_tasks(app.id)
+        cached_apps.delete_overall_progress(app.id)
+        return Response(json.dumps(dict(updated=n)),
+                        mimetype="application/json")
+    except Exception as e:
+        return error.format_exception(e, target='task', action='PUT')
+
+
+@jsonpify
+@csrf.exempt
+@blueprint.route('/task/bulk', methods=['POST'])
+@crossdomain(origin='*', headers=cors_headers)
+@ratelimit(limit=ratelimits.get('LIMIT'), per=ratelimits.get('PER'))
+def create_tasks():
+    """API endpoint to create many tasks at once.
+
+    The body is a JSON array of tasks, or a task per line (NDJSON). Every task
+    has the app_id of its project, and the user must be allowed to create
+    tasks in all the projects, which is checked once per project. The tasks
+    are inserted in batches within a single transaction, and their ids are
+    returned in the same order.
+
+    """
+    try:
+        tasks_data = _bulk_tasks_data(request.stream)
+        indexes_by_app = OrderedDict()
+        for i, task_data in enumerate(tasks_data):
+            indexes_by_app.setdefault(task_data['app_id'], []).append(i)
+        for app_id in indexes_by_app:
+            if project_repo.get(app_id) is None:
+                raise NotFound
+            require.task.create(Task(app_id=app_id))
+        ids = [None] * len(tasks_data)
+        with model.bulk_operation():
+            # All the batches are inserted in a single transaction
+            try:
+                for app_id, indexes in indexes_by_app.items():
+                    for batch in batches(indexes, BULK_TASKS_BATCH_SIZE):
+                        batch_ids = task_repo.insert_tasks_returning_ids(
+                            app_id, [tasks_data[i] for i in batch],
+                            commit=False)
+                        for i, task_id in zip(batch, batch_ids):
+                            ids[i] = task_id
+                db.session.commit()
+            except DBAPIError:
+                db.session.rollback()
+                raise
+        for app_id in indexes_by_app:
+            delete_cached_stats(app_id)
+        return Response(json.dumps(dict(created=len(ids), ids=ids)),
+                        mimetype="application/json")
+    except Exception as e:
+        return error.format_exception(e, target='task', action='POST')
+
+
+def _bulk_tasks_data(stream):
+    """Return the tasks of the body of a bulk creation request, reading a
+    NDJSON body line by line, and raising an error if any of them is not
+    valid, so no task is created"""
+    lines = (line for line in stream if line.strip())
+    first = next(lines, '').strip()
+    if first.startswith('['):
+        tasks_data = json.loads(first + ''.join(lines))
+        for task_data in tasks_data:
+            _check_bulk_task(task_data)
+        return tasks_data
+    tasks_data = []
+    for line in itertools.chain([first] if first else [], lines):
+        task_data = json.loads(line)
+        _check_bulk_task(task_data)
+        tasks_data.append(task_data)
+    return tasks_data
+
+
+def _check_bulk_task(task_data):
+    if not isinstance(task_data, dict):
+        raise ValueError('Every task must be a JSON object')
+    columns = Task.__table__.columns
+    for key, value in task_data.iteritems():
+        if key not in columns.keys() or key in ('id', 'info_hash'):
+            raise AttributeError(key)
+        if key == 'info' or (value is None and columns[key].nullable):
+            continue
+        python_type = columns[key].type.python_type
+        if python_type is float:
+            python_type = (int, long, float)
+        elif python_type is int:
+            python_type = (int, long)
+        elif python_type in (str, unicode):
+            python_type = basestring
+        if not isinstance(value, python_type) or isinstance(value, bool):
+            raise ValueError('Wrong value for %s: %r' % (key, value))
+    if not isinstance(task_data.get('app_id'), int):
+        raise ValueError('Every task must have the app_id of its project')
+    if task_data.get('state', 'ongoing') not in ('ongoing', 'completed'):
+        raise ValueError('state must be ongoing or completed')
@@ -22,6 +22,7 @@ This package adds GET, POST, PUT and DELETE methods for any class:
     * projects,
     * tasks,
     * task_runs,
+    * results,
     * users,
     * etc.
 
@@ -29,8 +30,10 @@ This package adds GET, POST, PUT and DELETE methods for any class:
 import json
 from flask import request, abort, Response
 from flask.views import MethodView
+from sqlalchemy import and_
 from werkzeug.exceptions import NotFound, Unauthorized, Forbidden
-from pybossa.util import jsonpify, crossdomain
+from pybossa.util import jsonpify, crossdomain, get_fields_from_request
+from pybossa.util import conditional_response, add_cache_headers
 from pybossa.core import ratelimits
 from pybossa.auth import require
 from pybossa.hateoas import Hateoas
@@ -45,6 +48,8 @@ repos = {'Task'   : {'repo': task_repo, 'filter': 'filter_tasks_by',
         'TaskRun' : {'repo': task_repo, 'filter': 'filter_task_runs_by',
                      'get': 'get_task_run',  'save': 'save', 'update': 'update',
                      'delete': 'delete'},
+        'Result'  : {'repo': task_repo, 'filter': 'filter_results_by',
+                     'get': 'get_result'},
         'User'    : {'repo': user_repo, 'filter': 'filter_by', 'get': 'get',
                      'save': 'save', 'update': 'update'},
         'App'     : {'repo': project_repo, 'filter': 'filter_by', 'get': 'get',
@@ -67,6 +72,10 @@ class APIBase(MethodView):
 
     hateoas = Hateoas()
 
+    # Columns that are always loaded when the client selects the fields of
+    # the response, as they are needed for authorization or privacy checks
+    required_fields = ()
+
     def valid_args(self):
         """Check if the domain object args are valid."""
         for k in request.args.keys():
@@ -94,9 +103,21 @@ class APIBase(MethodView):
         """
         try:
             getattr(require, self.__class__.__name__.lower()).read()
+            validators = None
+            if id is not None:
+                validators = self._cache_validators(id)
+            if validators is not None:
+                not_modified = conditional_response(*validators)
+                if not_modified is not None:
+                    return not_modified
             query = self._db_query(id)
             json_response = self._create_json_response(query, id)
-            return Response(json_response, mimetype='application/json')
+            response = Response(json_response, mimetype='application/json')
+            if id is None:
+                self._add_next_link(response, query)
+            elif validators is not None:
+                add_cache_headers(response, *validators)
+            return response
         except Exception as e:
             return error.format_exception(
                 e,
@@ -106,23 +127,78 @@ class APIBase(MethodView):
     def _create_json_response(self, query_result, id):
         if len (query_result) == 1 and query_result[0] is None:
             raise abort(404)
-        items = []
-        for item in query_result:
-            try:
-                items.append(self._create_dict_from_model(item))
-                getattr(require, self.__class__.__name__.lower()).read(item)
-            except (Forbidden, Unauthorized):
-                # Remove last added item, as it is 401 or 403
-                items.pop()
-            except: # pragma: no cover
-                raise
+        fields = self._get_fields()
         if id:
             getattr(require, self.__class__.__name__.lower()).read(query_result[0])
-            items = items[0]
+            return json.dumps(self._create_dict_from_model(query_result[0],
+                                                           fields))
+        # Lists are already filtered by the read_filter of the resource
+        items = [self._create_dict_from_model(item, fields)
+                 for item in query_result]
         return json.dumps(items)
 
-    def _create_dict_from_model(self, model):
-        return self._select_attributes(self._add_hateoas_links(model))
+    def _create_dict_from_model(self, model, fields=None):
+        if not fields:
+            return self._select_attributes(self._add_hateoas_links(model))
+        obj = self._select_fields(model, fields)
+        for field in self.required_fields:
+            obj.setdefault(field, getattr(model, field))
+        obj = self._select_attributes(obj)
+        for field in self.required_fields:
+            if field not in fields:
+                obj.pop(field, None)
+        return obj
+
+    def _select_fields(self, model, fields):
+        """Return a dict with only the given fields of the model. A field
+        can be a column, a key of a JSON column like info.url, or the link
+        and links of the item"""
+        obj = {}
+        for field in fields:
+            column, _, key = field.partition('.')
+            if column in ('link', 'links'):
+                continue
+            value = getattr(model, column)
+            if not key:
+                obj[column] = value
+            elif column not in fields:
+                selected = obj.setdefault(column, {})
+                if isinstance(value, dict) and key in value:
+                    selected[key] = value[key]
+        if 'link' in fields or 'links' in fields:
+            links, link = self.hateoas.create_links(model)
+            if links and 'links' in fields:
+                obj['links'] = links
+            if link and 'link' in fields:
+                obj['link'] = link
+        return obj
+
+    def _get_fields(self):
+        """Return the list of fields requested with the fields argument, or
+        None if the whole item must be returned"""
+        fields = get_fields_from_request()
+        if not fields:
+            return None
+        columns = self.__class__.__table__.columns.keys()
+        for field in fields:
+            column = field.split('.')[0]
+            if column not in columns and column not in ('link', 'links'):
+                raise AttributeError("type object '%s' has no attribute '%s'"
+                                     % (self.__class__.__name__, column))
+        return fields
+
+    def _load_only(self, fields):
+        """Return the columns that must be loaded from the DB to return the
+        given fields"""
+        columns = self.__class__.__table__.columns.keys()
+        load = set(['id'])
+        load.update(self.required_fields)
+        load.update(field.split('.')[0] for field in fields
+                    if field.split('.')[0] in columns)
+        if 'links' in fields:
+            load.update(column for column in ('app_id', 'task_id', 'category_id')
+                        if column in columns)
+        return sorted(load)
 
     def _add_hateoas_links(self, item):
         obj = item.dictize()
@@ -133,6 +209,16 @@ class APIBase(MethodView):
             obj['link'] = link
         return obj
 
+    def _add_next_link(self, response, query_result):
+        """Add a Link header with the next page of the list, if the page is
+        full, so the client can go on with keyset pagination"""
+        limit, offset = self._set_limit_and_offset()
+        if len(query_result) < limit:
+            return
+        endpoint = '.api_%s' % self.__class__.__name__.lower()
+        response.headers['Link'] = self.hateoas.create_next_link(
+            endpoint, query_result[-1].id, request.args.to_dict())
+
     def _db_query(self, id):
         """Returns a list with the results of the query"""
         repo_info = repos[self.__class__.__name__]
@@ -148,16 +234,46 @@ class APIBase(MethodView):
     def _filter_query(self, repo_info, limit, offset):
         filters = {}
         for k in request.args.keys():
-            if k not in ['limit', 'offset', 'api_key']:
+            if k not in ['limit', 'offset', 'last_id', 'fields', 'api_key']:
                 # Raise an error if the k arg is not a column
                 getattr(self.__class__, k)
                 filters[k] = request.args[k]
+        if request.args.get('last_id') is not None:
+            filters['last_id'] = int(request.args['last_id'])
+        fields = self._get_fields()
+        if fields:
+            filters['fields'] = self._load_only(fields)
+        criteria = []
+        if '::' in filters.get('info', ''):
+            info = self._info_filter(filters.pop('info'))
+            criteria.append(self.__class__.info.contains(info))
+        criterion = getattr(require, self.__class__.__name__.lower()).read_filter()
+        if criterion is not None:
+            criteria.append(criterion)
+        if criteria:
+            filters['criterion'] = and_(*criteria)
         repo = repo_info['repo']
         query_func = repo_info['filter']
         filters = self._custom_filter(filters)
         results = getattr(repo, query_func)(limit=limit, offset=offset, **filters)
         return results
 
+    def _info_filter(self, value):
+        """Return the dict that the info of the items must contain for an
+        info=key::value|key2::value2 filter. The values are read as JSON
+        if they can be, e.g. n::3, or as strings otherwise"""
+        info = {}
+        for pair in value.split('|'):
+            key, separator, key_value = pair.partition('::')
+            if not separator or not key:
+                raise ValueError("info filters must be key::value pairs "
+                                 "separated by |")
+            try:
+                info[key] = json.loads(key_value)
+            except ValueError:
+                info[key] = key_value
+        return info
+
     def _set_limit_and_offset(self):
         try:
             limit = min(100, int(request.args.get('limit')))
@@ -319,6 +435,14 @@ class APIBase(MethodView):
         return item_data
 
 
+    def _cache_validators(self, id):
+        """Method to be overriden in inheriting classes which can tell the
+        version of an item without loading it. It returns the ETag, the
+        Last-Modified datetime and whether the item is private, or None
+        """
+        return None
+
+
     def _custom_filter(self, query):
         """Method to be overriden in inheriting classes which wish to consider
         specific filtering criteria
@@ -22,12 +22,21 @@ This package adds GET, POST, PUT and DELETE methods for:
     * projects,
 
 """
+from flask import request
 from flask.ext.login import current_user
+from rq import Queue
 from api_base import APIBase
+from pybossa.auth import require
+from pybossa.core import project_repo, sentinel
+from pybossa.jobs import rebuild_results, HOUR
+from pybossa.progress import JobProgress
+from pybossa.util import make_etag, timestamp_to_datetime
 from pybossa.model.app import App
 import pybossa.cache.apps as cached_apps
 from pybossa.cache.categories import get_all as get_categories
 
+importer_queue = Queue('importer', connection=sentinel.master)
+
 
 class AppAPI(APIBase):
 
@@ -40,12 +49,39 @@ class AppAPI(APIBase):
 
     __class__ = App
 
+    required_fields = ('hidden', 'owner_id')
+
     def _create_instance_from_request(self, data):
         inst = super(AppAPI, self)._create_instance_from_request(data)
         default_category = get_categories()[0]
         inst.category_id = default_category.id
         return inst
 
+    def _cache_validators(self, id):
+        # The updated timestamp changes with the project and its tasks and
+        # task runs, so it tells whether the project has to be sent again
+        version = project_repo.get_version(id)
+        if version is None:
+            return None
+        require.app.read(version)
+        etag = make_etag('app', id, version.updated,
+                         request.args.get('fields'))
+        return (etag, timestamp_to_datetime(version.updated),
+                bool(version.hidden))
+
+    def _update_instance(self, id):
+        existing = project_repo.get(id)
+        old_keys = None
+        if existing is not None:
+            old_keys = (existing.info or {}).get('result_keys')
+        app = super(AppAPI, self)._update_instance(id)
+        # The results of the answers already given have to be counted again
+        if (app.info or {}).get('result_keys') != old_keys:
+            JobProgress(sentinel.master, 'results', app.id).start(
+                state='queued', app_id=app.id)
+            importer_queue.enqueue(rebuild_results, app.id, timeout=HOUR)
+        return app
+
     def _refresh_cache(self, obj):
         cached_apps.delete_app(obj.short_name)
 
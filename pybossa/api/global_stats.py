@@ -25,9 +25,8 @@ import json
 from api_base import APIBase, cors_headers
 from flask import Response
 import pybossa.cache.site_stats as stats
-import pybossa.cache.apps as cached_apps
-import pybossa.cache.categories as cached_categories
-from pybossa.util import jsonpify, crossdomain
+from pybossa.util import jsonpify, crossdomain, make_etag
+from pybossa.util import conditional_response, add_cache_headers
 from pybossa.ratelimit import ratelimit
 from werkzeug.exceptions import MethodNotAllowed
 
@@ -46,29 +45,16 @@ class GlobalStatsAPI(APIBase):
     @ratelimit(limit=300, per=15 * 60)
     def get(self, id):
         """Return global stats."""
-        n_pending_tasks = stats.n_total_tasks_site() - stats.n_task_runs_site()
-        n_users = stats.n_auth_users() + stats.n_anon_users()
-        n_projects = cached_apps.n_published() + cached_apps.n_count('draft')
-        data = dict(n_projects=n_projects,
-                    n_users=n_users,
-                    n_task_runs=stats.n_task_runs_site(),
-                    n_pending_tasks=n_pending_tasks,
-                    categories=[])
-        # Add Categories
-        categories = cached_categories.get_used()
-        for c in categories:
-            datum = dict()
-            datum[c['short_name']] = cached_apps.n_count(c['short_name'])
-            data['categories'].append(datum)
-        # Add Featured
-        datum = dict()
-        datum['featured'] = cached_apps.n_count('featured')
-        data['categories'].append(datum)
-        # Add Draft
-        datum = dict()
-        datum['draft'] = cached_apps.n_count('draft')
-        data['categories'].append(datum)
-        return Response(json.dumps(data), 200, mimetype='application/json')
+        data = stats.get_global_stats()
+        json_response = json.dumps(data)
+        # The stats come from a stored document, so the ETag saves sending
+        # them while it does not change
+        etag = make_etag('globalstats', json_response)
+        response = conditional_response(etag)
+        if response is not None:
+            return response
+        response = Response(json_response, 200, mimetype='application/json')
+        return add_cache_headers(response, etag)
 
     def post(self):
         raise MethodNotAllowed
@@ -50,6 +50,8 @@ class UserAPI(APIBase):
     # has privacy_mode disabled
     allowed_attributes = ('name', 'locale', 'fullname', 'created')
 
+    required_fields = ('privacy_mode',)
+
 
     def _select_attributes(self, user_data):
         privacy = self._is_user_private(user_data)
@@ -71,6 +73,12 @@ class UserAPI(APIBase):
     def _is_requester_admin(self):
         return current_user.is_authenticated() and current_user.admin
 
+    def _filter_query(self, repo_info, limit, offset):
+        # The info of the users is never shown, so it cannot be searched
+        if 'info' in request.args:
+            raise AttributeError('info')
+        return super(UserAPI, self)._filter_query(repo_info, limit, offset)
+
     def _custom_filter(self, filters):
         if self._private_attributes_in_request() and not self._is_requester_admin():
             filters['privacy_mode'] = False
@@ -23,6 +23,7 @@ from flask.ext.login import current_user
 import app
 import task
 import taskrun
+import result
 import category
 import user
 import token
@@ -32,6 +33,7 @@ import auditlog
 assert app
 assert task
 assert taskrun
+assert result
 assert category
 assert user
 assert token
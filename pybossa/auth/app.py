@@ -17,6 +17,9 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
 from flask.ext.login import current_user
+from sqlalchemy import or_
+
+from pybossa.model.app import App
 
 
 def create(app=None):
@@ -31,6 +34,16 @@ def read(app=None):
     return True
 
 
+def read_filter():
+    """Return the SQL criterion that selects the projects the current user
+    can read, or None if the user can read all of them."""
+    if current_user.is_anonymous():
+        return App.hidden == 0
+    if current_user.admin:
+        return None
+    return or_(App.hidden == 0, App.owner_id == current_user.id)
+
+
 def update(app):
     return _only_admin_or_owner(app)
 
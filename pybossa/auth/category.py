@@ -33,6 +33,10 @@ def read(category=None):
     return True
 
 
+def read_filter():
+    return None
+
+
 def update(category):
     return create(category)
 
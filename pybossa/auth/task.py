@@ -36,6 +36,10 @@ def read(task=None):
     return True
 
 
+def read_filter():
+    return None
+
+
 def update(task):
     if not current_user.is_anonymous():
         app = project_repo.get(task.app_id)
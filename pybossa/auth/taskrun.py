@@ -37,6 +37,9 @@ def create(taskrun=None):
 def read(taskrun=None):
     return True
 
+def read_filter():
+    return None
+
 def update(taskrun):
     return False
 
@@ -27,6 +27,10 @@ def read(user=None):
     return True
 
 
+def read_filter():
+    return None
+
+
 def update(user):
     return create(user) or user.id == current_user.id
 
@@ -24,6 +24,8 @@ It exports:
     * memoize: for caching functions using its arguments as part of the key
     * delete_cached: to remove a cached value
     * delete_memoized: to remove a cached value from the memoize decorator
+    * get_memoized_many: to read many values of the memoize decorator at once
+    * set_memoized_many: to cache many values of the memoize decorator at once
 
 """
 import os
@@ -67,6 +69,13 @@ def get_hash_key(prefix, key_to_hash):
     return key
 
 
+def get_memoize_key(function, *args, **kwargs):
+    """Return the key of the memoized value of a function for its args."""
+    key = "%s:%s_args:" % (settings.REDIS_KEYPREFIX, function.__name__)
+    key_to_hash = get_key_to_hash(*args, **kwargs)
+    return get_hash_key(key, key_to_hash)
+
+
 def cache(key_prefix, timeout=300):
     """
     Decorator for caching functions.
@@ -106,9 +115,7 @@ def memoize(timeout=300):
     def decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            key = "%s:%s_args:" % (settings.REDIS_KEYPREFIX, f.__name__)
-            key_to_hash = get_key_to_hash(*args, **kwargs)
-            key = get_hash_key(key, key_to_hash)
+            key = get_memoize_key(f, *args, **kwargs)
             if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is None:
                 output = sentinel.slave.get(key)
                 if output:
@@ -123,6 +130,34 @@ def memoize(timeout=300):
     return decorator
 
 
+def get_memoized_many(function, args_list):
+    """
+    Get the memoized values of a function for every tuple of args at once.
+
+    Returns a list with the cached values, and None for the missing ones or
+    all of them if the cache is disabled
+
+    """
+    if (os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is not None
+            or not args_list):
+        return [None] * len(args_list)
+    keys = [get_memoize_key(function, *args) for args in args_list]
+    return [pickle.loads(output) if output else None
+            for output in sentinel.slave.mget(keys)]
+
+
+def set_memoized_many(function, values, timeout=300):
+    """
+    Cache the values of a memoized function, given as a dict of tuples of
+    args and values, at once.
+
+    """
+    p = sentinel.master.pipeline()
+    for args, value in values.iteritems():
+        p.setex(get_memoize_key(function, *args), timeout, pickle.dumps(value))
+    p.execute()
+
+
 def delete_cached(key):
     """
     Delete a cached value from the cache.
@@ -23,6 +23,7 @@ from pybossa.model.task import Task
 from pybossa.model.task_run import TaskRun
 from pybossa.util import pretty_date
 from pybossa.cache import memoize, cache, delete_memoized, delete_cached
+from pybossa.cache import get_memoized_many, set_memoized_many
 
 import json
 import string
@@ -97,6 +98,27 @@ def n_tasks(app_id):
     return n_tasks
 
 
+def n_tasks_many(app_ids):
+    """Return a dict with the number of tasks of every one of the given
+    projects. The cached values of n_tasks are read at once, and the missing
+    ones are counted with a single query."""
+    app_ids = list(app_ids)
+    totals = get_memoized_many(n_tasks, [(app_id,) for app_id in app_ids])
+    totals = dict(zip(app_ids, totals))
+    missing = [app_id for app_id, total in totals.items() if total is None]
+    if missing:
+        sql = text('''SELECT app_id, COUNT(id) AS n_tasks FROM task
+                      WHERE app_id = ANY(:app_ids) GROUP BY app_id;''')
+        counts = dict.fromkeys(missing, 0)
+        for row in session.execute(sql, dict(app_ids=missing)):
+            counts[row.app_id] = row.n_tasks
+        set_memoized_many(n_tasks,
+                          dict(((app_id,), n) for app_id, n in counts.items()),
+                          timeout=timeouts.get('APP_TIMEOUT'))
+        totals.update(counts)
+    return totals
+
+
 @memoize(timeout=timeouts.get('APP_TIMEOUT'))
 def n_completed_tasks(app_id):
     sql = text('''SELECT COUNT(task.id) AS n_completed_tasks FROM task
@@ -258,7 +280,7 @@ def _n_draft():
     """Return number of draft projects"""
     sql = text('''SELECT COUNT(app.id) FROM app
                LEFT JOIN task on app.id=task.app_id
-               WHERE task.app_id IS NULL AND app.info NOT LIKE('%task_presenter%')
+               WHERE task.app_id IS NULL AND NOT app.info ? 'task_presenter'
                AND app.hidden=0;''')
 
     results = session.execute(sql)
@@ -273,7 +295,7 @@ def get_draft(category=None, page=1, per_page=5):
     sql = text('''SELECT app.id, app.name, app.short_name, app.created,
                app.description, app.info, "user".fullname as owner
                FROM "user", app LEFT JOIN task ON app.id=task.app_id
-               WHERE task.app_id IS NULL AND app.info NOT LIKE('%task_presenter%')
+               WHERE task.app_id IS NULL AND NOT app.info ? 'task_presenter'
                AND app.hidden=0
                AND app.owner_id="user".id
                OFFSET :offset
@@ -311,7 +333,7 @@ def n_count(category):
                WHERE
                category.short_name=:category
                AND app.hidden=0
-               AND app.info LIKE('%task_presenter%')
+               AND app.info ? 'task_presenter'
                AND task.app_id=app.id
                GROUP BY app.id)
                SELECT COUNT(*) FROM uniq
@@ -336,7 +358,7 @@ def get(category, page=1, per_page=5):
                category.short_name=:category
                AND app.hidden=0
                AND "user".id=app.owner_id
-               AND app.info LIKE('%task_presenter%')
+               AND app.info ? 'task_presenter'
                AND task.app_id=app.id
                GROUP BY app.id, "user".id ORDER BY app.name
                OFFSET :offset
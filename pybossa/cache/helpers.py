@@ -17,20 +17,184 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
 from sqlalchemy.sql import text
-from pybossa.core import db, timeouts
-from pybossa.cache import memoize, ONE_HOUR
+from pybossa.core import db, timeouts, sentinel
+from pybossa.cache import ONE_HOUR
 from pybossa.cache.apps import overall_progress
 
 
 
 session = db.slave_session
 
+# Every project has a bitmap of its open tasks and a bitmap of the tasks
+# answered by every user (user:<id>) or anonymous IP address (ip:<address>)
+# that has asked for them. The bits are the ordinals of the tasks, numbered
+# in order of id by a hash of the project. Bit 0 is set in all of them, so
+# existing bitmaps are never empty and it cancels out when counting.
+#
+# The current generation of the bitmaps of a project is stored in
+# TASK_BITMAPS_KEY. Any change to the tasks of a project deletes it, and the
+# bitmaps are built again from the DB when needed, under a new generation
+# taken from TASK_BITMAPS_COUNTER_KEY. The counter never expires, so the
+# bitmaps of the old generations are never read again.
+TASK_BITMAPS_KEY = 'pybossa:task_bitmaps:%s'
+TASK_BITMAPS_COUNTER_KEY = 'pybossa:task_bitmaps_generations:%s'
+TASK_BITMAPS_TIMEOUT = ONE_HOUR * 3
+# Number of tasks added to the ordinals hash by every HMSET
+TASK_BITMAPS_CHUNK_SIZE = 1000
+
+# Returns the number of open tasks not answered by the user, -1 if the open
+# tasks bitmap is missing or -2 if the bitmap of the user is missing
+N_AVAILABLE_TASKS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    return -2
+end
+redis.call('BITOP', 'AND', KEYS[3], KEYS[1], KEYS[2])
+local answered = redis.call('BITCOUNT', KEYS[3])
+redis.call('DEL', KEYS[3])
+return redis.call('BITCOUNT', KEYS[1]) - answered
+"""
+# Sets the bit of an answered task in the bitmap of the user, if it exists,
+# and clears it in the open tasks bitmap if the task is completed
+RECORD_ANSWER_SCRIPT = """
+local ordinal = redis.call('HGET', KEYS[1], ARGV[1])
+if not ordinal then
+    return 0
+end
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('SETBIT', KEYS[2], ordinal, 1)
+end
+if ARGV[2] == '1' then
+    redis.call('SETBIT', KEYS[3], ordinal, 0)
+end
+return 1
+"""
+_scripts = {}
+
+
+def _script(source):
+    if source not in _scripts:
+        _scripts[source] = sentinel.master.register_script(source)
+    return _scripts[source]
+
+
+def _task_bitmaps_keys(app_id, generation):
+    """Return the keys of the ordinals hash and the open tasks bitmap."""
+    prefix = '%s:%s' % (TASK_BITMAPS_KEY % app_id, generation)
+    return prefix + ':ordinals', prefix + ':open'
+
+
+def _answered_key(app_id, generation, user_id=None, user_ip=None):
+    if user_id and not user_ip:
+        user = 'user:%s' % user_id
+    else:
+        user = 'ip:%s' % (user_ip or '127.0.0.1')
+    return '%s:%s:%s' % (TASK_BITMAPS_KEY % app_id, generation, user)
+
+
+def _bitmap(ordinals):
+    """Return the bytes of a Redis bitmap with the given bits set."""
+    bitmap = bytearray(max(ordinals) // 8 + 1)
+    for ordinal in ordinals:
+        bitmap[ordinal // 8] |= 0x80 >> (ordinal % 8)
+    return bytes(bitmap)
+
+
+def _build_task_bitmaps(app_id):
+    """Build the ordinals and the open tasks bitmap of a project under a new
+    generation, and return it."""
+    query = text('''SELECT id, state FROM task WHERE app_id=:app_id
+                   ORDER BY id;''')
+    ordinals = {}
+    open_tasks = [0]
+    for ordinal, row in enumerate(db.session.execute(query,
+                                                     dict(app_id=app_id)), 1):
+        ordinals[row.id] = ordinal
+        if row.state != 'completed':
+            open_tasks.append(ordinal)
+    generation = sentinel.master.incr(TASK_BITMAPS_COUNTER_KEY % app_id)
+    ordinals_key, open_key = _task_bitmaps_keys(app_id, generation)
+    items = ordinals.items()
+    p = sentinel.master.pipeline()
+    for i in range(0, len(items), TASK_BITMAPS_CHUNK_SIZE):
+        p.hmset(ordinals_key, dict(items[i:i + TASK_BITMAPS_CHUNK_SIZE]))
+    p.set(open_key, _bitmap(open_tasks))
+    p.set(TASK_BITMAPS_KEY % app_id, generation)
+    for key in (TASK_BITMAPS_KEY % app_id, ordinals_key, open_key):
+        p.expire(key, TASK_BITMAPS_TIMEOUT)
+    p.execute()
+    return generation
+
+
+def _build_answered_bitmap(app_id, generation, user_id=None, user_ip=None):
+    """Build the bitmap of the tasks of a project answered by a user."""
+    if user_id and not user_ip:
+        query = text('''SELECT task_id FROM task_run
+                       WHERE app_id=:app_id AND user_id=:user_id;''')
+    else:
+        user_ip = user_ip or '127.0.0.1'
+        query = text('''SELECT task_id FROM task_run
+                       WHERE app_id=:app_id AND user_ip=:user_ip;''')
+    task_ids = [row.task_id for row in db.session.execute(
+        query, dict(app_id=app_id, user_id=user_id, user_ip=user_ip))]
+    answered = [0]
+    if task_ids:
+        ordinals_key, _ = _task_bitmaps_keys(app_id, generation)
+        answered.extend(int(ordinal) for ordinal in
+                        sentinel.master.hmget(ordinals_key, task_ids)
+                        if ordinal is not None)
+    key = _answered_key(app_id, generation, user_id, user_ip)
+    p = sentinel.master.pipeline()
+    p.set(key, _bitmap(answered))
+    p.expire(key, TASK_BITMAPS_TIMEOUT)
+    p.execute()
+
 
-@memoize(timeout=ONE_HOUR * 3)
 def n_available_tasks(app_id, user_id=None, user_ip=None):
     """Returns the number of tasks for a given app a user can contribute to,
     based on the completion of the app tasks, and previous task_runs submitted
-    by the user"""
+    by the user. It is counted with the task bitmaps of the project, which
+    are built when missing"""
+    generation = sentinel.master.get(TASK_BITMAPS_KEY % app_id)
+    for attempt in range(3):
+        if generation is None:
+            generation = _build_task_bitmaps(app_id)
+        _, open_key = _task_bitmaps_keys(app_id, generation)
+        answered_key = _answered_key(app_id, generation, user_id, user_ip)
+        n_tasks = _script(N_AVAILABLE_TASKS_SCRIPT)(
+            keys=[open_key, answered_key, answered_key + ':available'])
+        if n_tasks == -1:
+            generation = None
+        elif n_tasks == -2:
+            _build_answered_bitmap(app_id, generation, user_id, user_ip)
+        else:
+            return n_tasks
+    # The tasks of the project are changing, so count them in the DB
+    return _n_available_tasks_sql(app_id, user_id, user_ip)
+
+
+def record_answer(app_id, task_id, user_id=None, user_ip=None,
+                  completed=False):
+    """Mark a task as answered by a user, and as closed if it is completed,
+    in the task bitmaps of the project (if they exist)."""
+    generation = sentinel.master.get(TASK_BITMAPS_KEY % app_id)
+    if generation is None:
+        return
+    ordinals_key, open_key = _task_bitmaps_keys(app_id, generation)
+    answered_key = _answered_key(app_id, generation, user_id, user_ip)
+    _script(RECORD_ANSWER_SCRIPT)(keys=[ordinals_key, answered_key, open_key],
+                                  args=[task_id, int(completed)])
+
+
+def delete_task_bitmaps(app_id):
+    """Delete the task bitmaps of a project, when its tasks change. They
+    will be built again from the DB."""
+    sentinel.master.delete(TASK_BITMAPS_KEY % app_id)
+
+
+def _n_available_tasks_sql(app_id, user_id=None, user_ip=None):
     if user_id and not user_ip:
         query = text('''SELECT COUNT(id) AS n_tasks FROM task WHERE NOT EXISTS
                        (SELECT task_id FROM task_run WHERE
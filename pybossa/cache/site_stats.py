@@ -21,11 +21,18 @@ import pygeoip
 from sqlalchemy.sql import text
 from flask import current_app
 
-from pybossa.core import db
+from pybossa.core import db, sentinel
 from pybossa.cache import cache, ONE_DAY
+from pybossa.model import make_timestamp
+from pybossa.util import with_cache_disabled
 
 session = db.slave_session
 
+# Redis hash with the document served by /api/globalstats
+GLOBAL_STATS_KEY = 'pybossa:global_stats'
+GLOBAL_STATS_COUNTERS = ('n_projects', 'n_users', 'n_task_runs',
+                         'n_pending_tasks')
+
 @cache(timeout=ONE_DAY, key_prefix="site_n_auth_users")
 def n_auth_users():
     sql = text('''SELECT COUNT("user".id) AS n_auth FROM "user";''')
@@ -134,3 +141,49 @@ def get_locs(): # pragma: no cover
                 loc['longitude'] = 0
             locs.append(dict(loc=loc))
     return locs
+
+
+@with_cache_disabled
+def global_stats():
+    """Compute the global stats of the site from the database, with a
+    generated_at timestamp, and store them as a single document."""
+    import pybossa.cache.apps as cached_apps
+    import pybossa.cache.categories as cached_categories
+    n_task_runs = n_task_runs_site()
+    data = dict(n_projects=(cached_apps.n_published() +
+                            cached_apps.n_count('draft')),
+                n_users=n_auth_users() + n_anon_users(),
+                n_task_runs=n_task_runs,
+                n_pending_tasks=n_total_tasks_site() - n_task_runs,
+                categories=[])
+    for c in cached_categories.get_used():
+        short_name = c['short_name']
+        data['categories'].append({short_name: cached_apps.n_count(short_name)})
+    data['categories'].append({'featured': cached_apps.n_count('featured')})
+    data['categories'].append({'draft': cached_apps.n_count('draft')})
+    data['generated_at'] = make_timestamp()
+    document = dict(data, categories=json.dumps(data['categories']))
+    sentinel.master.hmset(GLOBAL_STATS_KEY, document)
+    return data
+
+
+def get_global_stats():
+    """Return the stored global stats document, computing it if there is
+    none yet. The counters include the changes made since it was
+    generated."""
+    document = sentinel.slave.hgetall(GLOBAL_STATS_KEY)
+    if 'generated_at' not in document:
+        return global_stats()
+    data = dict((k, int(document[k])) for k in GLOBAL_STATS_COUNTERS)
+    data['categories'] = json.loads(document['categories'])
+    data['generated_at'] = document['generated_at']
+    return data
+
+
+def incr_global_stats(**counters):
+    """Add the given amounts to the counters of the global stats document,
+    e.g. n_task_runs=1, until the next time it is generated."""
+    p = sentinel.master.pipeline()
+    for counter, amount in counters.iteritems():
+        p.hincrby(GLOBAL_STATS_KEY, counter, amount)
+    p.execute()
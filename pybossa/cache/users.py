@@ -15,12 +15,16 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import time
 from sqlalchemy.sql import text
-from pybossa.core import db, timeouts
-from pybossa.cache import cache, memoize, delete_memoized
+from flask.ext.login import UserMixin
+from pybossa.core import db, timeouts, sentinel
+from pybossa.cache import cache, memoize, delete_memoized, ONE_DAY
 from pybossa.util import pretty_date
 from pybossa.model.user import User
 from pybossa.cache.apps import overall_progress, n_tasks, n_volunteers
+from pybossa.cache.apps import n_tasks_many
 import json
 
 
@@ -202,7 +206,7 @@ def published_apps(user_id):
                app.info
                FROM app, task
                WHERE app.id=task.app_id AND app.owner_id=:user_id AND
-               app.hidden=0 AND app.info LIKE('%task_presenter%')
+               app.hidden=0 AND app.info ? 'task_presenter'
                GROUP BY app.id, app.name, app.short_name,
                app.description,
                app.info;''')
@@ -232,7 +236,7 @@ def draft_apps(user_id):
                app.info
                FROM app
                WHERE app.owner_id=:user_id
-               AND app.info NOT LIKE('%task_presenter%')
+               AND NOT app.info ? 'task_presenter'
                GROUP BY app.id, app.name, app.short_name,
                app.description,
                app.info;''')
@@ -262,7 +266,7 @@ def hidden_apps(user_id):
                app.info
                FROM app, task
                WHERE app.id=task.app_id AND app.owner_id=:user_id AND
-               app.hidden=1 AND app.info LIKE('%task_presenter%')
+               app.hidden=1 AND app.info ? 'task_presenter'
                GROUP BY app.id, app.name, app.short_name,
                app.description,
                app.info;''')
@@ -314,3 +318,171 @@ def get_users_page(page, per_page=24):
 def delete_user_summary(name):
     """Delete from cache the user summary."""
     delete_memoized(get_user_summary, name)
+
+
+# Seconds that every process keeps the users of the API keys it has seen,
+# without asking Redis
+API_KEY_LOCAL_TIMEOUT = 10
+API_KEY_LOCAL_MAX_SIZE = 10000
+_api_keys = {}
+
+
+class UserPrincipal(UserMixin):
+
+    """The user of an API key, with the attributes that are checked on most
+    requests. Any other attribute loads the User from the DB."""
+
+    def __init__(self, id, name, admin, pro):
+        self.id = id
+        self.name = name
+        self.admin = admin
+        self.pro = pro
+
+    def get_id(self):
+        return self.name
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        user = self.__dict__.get('_user')
+        if user is None:
+            user = db.session.query(User).get(self.id)
+            self.__dict__['_user'] = user
+        return getattr(user, attr)
+
+
+@memoize(timeout=timeouts.get('USER_TIMEOUT'))
+def get_api_key_principal(api_key):
+    """Return the id, name, admin and pro flags of the user with the given
+    API key, or None."""
+    sql = text('''SELECT id, name, admin, pro FROM "user"
+               WHERE api_key=:api_key;''')
+    row = db.session.execute(sql, dict(api_key=api_key)).first()
+    if row is None:
+        return None
+    return dict(id=row.id, name=row.name, admin=row.admin, pro=row.pro)
+
+
+def get_user_by_api_key(api_key):
+    """Return the UserPrincipal of the user with the given API key, or None.
+    It is looked up in the memory of the process, then in Redis and then in
+    the DB."""
+    if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is not None:
+        principal = get_api_key_principal(api_key)
+    else:
+        now = time.time()
+        expires, principal = _api_keys.get(api_key, (0, None))
+        if expires <= now:
+            if len(_api_keys) >= API_KEY_LOCAL_MAX_SIZE:
+                _api_keys.clear()
+            principal = get_api_key_principal(api_key)
+            _api_keys[api_key] = (now + API_KEY_LOCAL_TIMEOUT, principal)
+    if principal is None:
+        return None
+    return UserPrincipal(**principal)
+
+
+def delete_api_key(api_key):
+    """Delete from cache the user of an API key."""
+    _api_keys.pop(api_key, None)
+    delete_memoized(get_api_key_principal, api_key)
+
+
+# Every project has a Redis hash with the number of task runs of each user
+# (user:<id>) and anonymous IP address (ip:<address>) that has contributed.
+# The counters are incremented when a task run is added, and rebuilt from the
+# DB when they are missing. The TTL is only set when the hash is created, so
+# the drift of the counters is bounded by it.
+USER_PROGRESS_KEY = 'pybossa:user_progress:%s'
+USER_PROGRESS_TIMEOUT = ONE_DAY
+# Only increments counters that exist, so a missing one is rebuilt from the DB
+USER_PROGRESS_INCR_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    return redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+end
+return nil
+"""
+# Sets a counter rebuilt from the DB, and the TTL if the hash is new
+USER_PROGRESS_SET_SCRIPT = """
+redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2])
+if redis.call('TTL', KEYS[1]) < 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+"""
+_user_progress_incr = None
+_user_progress_set = None
+
+
+def _user_progress_field(user_id=None, user_ip=None):
+    if user_id is not None:
+        return 'user:%s' % user_id
+    return 'ip:%s' % user_ip
+
+
+def n_user_task_runs(app_ids, user_id=None, user_ip=None):
+    """Return a dict with the number of task runs of the user (or anonymous
+    IP address) in every one of the given projects. The counters of all the
+    projects are read from Redis at once."""
+    field = _user_progress_field(user_id, user_ip)
+    p = sentinel.slave.pipeline(transaction=False)
+    for app_id in app_ids:
+        p.hget(USER_PROGRESS_KEY % app_id, field)
+    counts = dict(zip(app_ids, p.execute()))
+    missing = [app_id for app_id, count in counts.items() if count is None]
+    if missing:
+        counts.update(_rebuild_user_progress(missing, field, user_id, user_ip))
+    return dict((app_id, int(count)) for app_id, count in counts.items())
+
+
+def _rebuild_user_progress(app_ids, field, user_id, user_ip):
+    if user_id is not None:
+        sql = text('''SELECT app_id, COUNT(id) AS n_task_runs FROM task_run
+                   WHERE app_id = ANY(:app_ids) AND user_id=:user_id
+                   GROUP BY app_id;''')
+    else:
+        sql = text('''SELECT app_id, COUNT(id) AS n_task_runs FROM task_run
+                   WHERE app_id = ANY(:app_ids) AND user_ip=:user_ip
+                   GROUP BY app_id;''')
+    results = db.session.execute(sql, dict(app_ids=list(app_ids),
+                                           user_id=user_id, user_ip=user_ip))
+    counts = dict.fromkeys(app_ids, 0)
+    for row in results:
+        counts[row.app_id] = row.n_task_runs
+    global _user_progress_set
+    if _user_progress_set is None:
+        _user_progress_set = sentinel.master.register_script(
+            USER_PROGRESS_SET_SCRIPT)
+    p = sentinel.master.pipeline()
+    for app_id, count in counts.iteritems():
+        _user_progress_set(keys=[USER_PROGRESS_KEY % app_id],
+                           args=[field, count, USER_PROGRESS_TIMEOUT],
+                           client=p)
+    p.execute()
+    return counts
+
+
+def incr_user_progress(app_id, user_id=None, user_ip=None, amount=1):
+    """Add amount to the task runs of the user (or anonymous IP address) in
+    a project, if they are counted."""
+    global _user_progress_incr
+    if _user_progress_incr is None:
+        _user_progress_incr = sentinel.master.register_script(
+            USER_PROGRESS_INCR_SCRIPT)
+    _user_progress_incr(keys=[USER_PROGRESS_KEY % app_id],
+                        args=[_user_progress_field(user_id, user_ip), amount])
+
+
+def delete_user_progress(app_id):
+    """Delete the counters of a project, e.g. when its task runs are deleted
+    in bulk."""
+    sentinel.master.delete(USER_PROGRESS_KEY % app_id)
+
+
+def user_progress(app_ids, user_id=None, user_ip=None):
+    """Return a dict with the progress of the user (or anonymous IP address)
+    in every one of the given projects: the task runs done and the total
+    number of tasks."""
+    done = n_user_task_runs(app_ids, user_id, user_ip)
+    totals = n_tasks_many(app_ids)
+    return dict((app_id, dict(done=done[app_id], total=totals[app_id]))
+                for app_id in app_ids)
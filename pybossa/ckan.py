@@ -18,21 +18,32 @@
 
 import requests
 import json
+import time
+from threading import BoundedSemaphore
+from multiprocessing.pool import ThreadPool
 
 from pybossa.model.task import Task
 from pybossa.model.task_run import TaskRun
 
 
 class Ckan(object):
+    # Number of records sent to CKAN in every datastore_upsert request
+    upsert_chunk_size = 500
+    # Number of concurrent datastore_upsert requests
+    upsert_workers = 4
+    # Retries for failed datastore_upsert requests, with exponential backoff
+    upsert_retries = 3
+    upsert_backoff = 1
+
     def _field_setup(self, obj):
         int_fields = ['id', 'app_id', 'task_id', 'user_id', 'n_answers', 'timeout',
                       'calibration', 'quorum']
-        text_fields = ['state', 'user_ip']
+        text_fields = ['state', 'user_ip', 'info_hash']
         float_fields = ['priority_0']
         timestamp_fields = ['created', 'finish_time']
         json_fields = ['info']
         # Backrefs and functions
-        sqlalchemy_refs = ['app', 'task_runs', 'pct_status']
+        sqlalchemy_refs = ['app', 'task_runs', 'result', 'pct_status']
         fields = []
         for attr in obj.__dict__.keys():
             if ("__" not in attr[0:2] and "_" not in attr[0:1] and
@@ -170,28 +181,77 @@ class Ckan(object):
                             r.text,
                             r.status_code)
 
-    def datastore_upsert(self, name, records, resource_id=None):
+    def datastore_upsert(self, name, records, resource_id=None, progress=None):
+        """Upsert the records (an iterable of dicts) in batches of
+        upsert_chunk_size records, using a pool of upsert_workers threads.
+        Only a bounded number of batches is kept in memory at any time. The
+        progress callable, if given, is called with the number of records of
+        every batch stored in CKAN."""
         if resource_id is None:
             resource_id = self.get_resource_id(name)
-        _records = ''
-        for text in records:
-            _records += text
-        _records = json.loads(_records)
-        for i in range(0, len(_records), 20):
-            chunk = _records[i:i + 20]
-            payload = {'resource_id': resource_id,
-                       'records': chunk,
-                       'method': 'insert',
-                       'force': True}
-            r = requests.post(self.url + "/action/datastore_upsert",
-                              headers=self.headers,
-                              data=json.dumps(payload))
-            if r.status_code != 200:
-                raise Exception("CKAN: the remote site failed! datastore_upsert failed",
-                                r.text,
-                                r.status_code)
+        pool = ThreadPool(self.upsert_workers)
+        slots = BoundedSemaphore(self.upsert_workers * 2)
+        errors = []
+
+        def upsert(chunk):
+            try:
+                self._upsert_chunk(resource_id, chunk)
+                if progress is not None:
+                    progress(len(chunk))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                slots.release()
+
+        try:
+            for chunk in self._chunks(records, self.upsert_chunk_size):
+                slots.acquire()
+                if errors:
+                    slots.release()
+                    break
+                pool.apply_async(upsert, (chunk,))
+        finally:
+            pool.close()
+            pool.join()
+        if errors:
+            raise errors[0]
         return True
 
+    def _upsert_chunk(self, resource_id, chunk):
+        payload = json.dumps({'resource_id': resource_id,
+                              'records': chunk,
+                              'method': 'insert',
+                              'force': True})
+        for attempt in range(self.upsert_retries + 1):
+            if attempt > 0:
+                time.sleep(self.upsert_backoff * 2 ** (attempt - 1))
+            try:
+                r = requests.post(self.url + "/action/datastore_upsert",
+                                  headers=self.headers,
+                                  data=payload)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout):
+                if attempt == self.upsert_retries:
+                    raise
+                continue
+            if r.status_code == 200:
+                return True
+            if r.status_code < 500:
+                break
+        raise Exception("CKAN: the remote site failed! datastore_upsert failed",
+                        r.text,
+                        r.status_code)
+
+    def _chunks(self, records, size):
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
     def datastore_delete(self, name, resource_id=None):
         #if resource_id is None:
         #    resource_id = self.get_resource_id(name)
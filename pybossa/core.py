@@ -343,7 +343,8 @@ def setup_hooks(app):
         if 'Authorization' in request.headers:
             apikey = request.headers.get('Authorization')
         if apikey:
-            user = user_repo.get_by(api_key=apikey)
+            from pybossa.cache.users import get_user_by_api_key
+            user = get_user_by_api_key(apikey)
             ## HACK:
             # login_user sets a session cookie which we really don't want.
             # login_user(user)
@@ -421,6 +422,7 @@ def setup_ratelimits(app):
     global ratelimits
     ratelimits['LIMIT'] = app.config['LIMIT']
     ratelimits['PER'] = app.config['PER']
+    ratelimits['API_KEYS'] = app.config['RATE_LIMIT_API_KEYS']
 
 def setup_queues(app):
     global queues
@@ -88,6 +88,11 @@ PASSWD_COOKIE_TIMEOUT = 60 * 30
 # Rate limits default values
 LIMIT = 300
 PER = 15 * 60
+# Higher (limit, per) quotas for the API keys of trusted integrations
+RATE_LIMIT_API_KEYS = {}
+
+# Seconds that a front proxy can keep the public API responses
+HTTP_CACHE_MAX_AGE = 10
 
 # Disable new account confirmation (via email)
 ACCOUNT_CONFIRMATION_DISABLED = True
@@ -22,8 +22,10 @@ from wtforms import IntegerField, DecimalField, TextField, BooleanField, \
     SelectField, validators, TextAreaField, PasswordField
 from wtforms.widgets import HiddenInput
 from flask.ext.babel import lazy_gettext, gettext
+from flask.ext.login import current_user
 
 from pybossa.core import project_repo, user_repo
+from pybossa.importers import store_upload
 import validator as pb_validator
 
 
@@ -122,6 +124,9 @@ class _BulkTaskCSVImportForm(Form):
                         [validators.Required(message=msg_required),
                          validators.URL(message=msg_url)])
 
+    def get_import_data(self):
+        return {'type': 'csv', 'csv_url': self.csv_url.data}
+
 
 class _BulkTaskGDImportForm(Form):
     form_name =TextField(label=None, widget=HiddenInput(), default='gdocs')
@@ -132,6 +137,9 @@ class _BulkTaskGDImportForm(Form):
                                [validators.Required(message=msg_required),
                                    validators.URL(message=msg_url)])
 
+    def get_import_data(self):
+        return {'type': 'gdocs', 'googledocs_url': self.googledocs_url.data}
+
 
 class _BulkTaskEpiCollectPlusImportForm(Form):
     form_name =TextField(label=None, widget=HiddenInput(), default='epicollect')
@@ -144,13 +152,51 @@ class _BulkTaskEpiCollectPlusImportForm(Form):
     epicollect_form = TextField(lazy_gettext('Form name'),
                                 [validators.Required(message=msg_required)])
 
+    def get_import_data(self):
+        return {'type': 'epicollect',
+                'epicollect_project': self.epicollect_project.data,
+                'epicollect_form': self.epicollect_form.data}
+
+
+class _BulkTaskFileImportForm(Form):
+    form_name =TextField(label=None, widget=HiddenInput(), default='upload')
+    file = FileField(lazy_gettext('File'))
+    file_path = TextField(lazy_gettext('Path of the file in the server'))
+    file_format = SelectField(lazy_gettext('Format'),
+                              choices=[('csv', 'CSV'),
+                                       ('ndjson', lazy_gettext('JSON lines'))],
+                              default='csv')
+
+    def validate_file(form, field):
+        if not (field.has_file() or form.file_path.data):
+            raise validators.ValidationError(
+                lazy_gettext("You must upload a file"))
+
+    def validate_file_path(form, field):
+        if field.data and not current_user.admin:
+            raise validators.ValidationError(
+                lazy_gettext("Only administrators can import files that "
+                             "are already in the server"))
+
+    def get_import_data(self):
+        """Store the uploaded file, if any, so the import can be done in
+        the background"""
+        import_data = {'type': 'upload', 'file_format': self.file_format.data}
+        if self.file.has_file():
+            import_data['file_path'] = store_upload(self.file.data)
+            import_data['uploaded'] = True
+        else:
+            import_data['file_path'] = self.file_path.data
+        return import_data
+
 
 class GenericBulkTaskImportForm(object):
     """Callable class that will return, when called, the appropriate form
     instance"""
     _forms = { 'csv': _BulkTaskCSVImportForm,
               'gdocs': _BulkTaskGDImportForm,
-              'epicollect': _BulkTaskEpiCollectPlusImportForm }
+              'epicollect': _BulkTaskEpiCollectPlusImportForm,
+              'upload': _BulkTaskFileImportForm }
 
     def __call__(self, form_name, *form_args, **form_kwargs):
         return self._forms[form_name](*form_args, **form_kwargs)
@@ -16,18 +16,34 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
-from flask import url_for
+from flask import url_for, request, has_request_context
 
 
 class Hateoas(object):
+    def __init__(self):
+        self._hrefs = {}
+
     def link(self, rel, title, href):
         return "<link rel='%s' title='%s' href='%s'/>" % (rel, title, href)
 
     def create_link(self, item, rel='self'):
         title = item.__class__.__name__.lower()
-        method = ".api_%s" % title
-        href = url_for(method, id=item.id, _external=True)
-        return self.link(rel, title, href)
+        return self.create_link_by_id(title, item.id, rel)
+
+    def create_link_by_id(self, title, id, rel='self'):
+        """Return the link to the item of the given type with the given id,
+        without having to load the item"""
+        return self.link(rel, title, '%s/%s' % (self._href(title), id))
+
+    def _href(self, title):
+        """Return the URL of the list of items of the given type. The path is
+        built once per type instead of once per link, and joined to the host
+        of the request, so the cache does not grow with the Host headers"""
+        if not has_request_context():
+            return url_for('.api_%s' % title, _external=True)
+        if title not in self._hrefs:
+            self._hrefs[title] = url_for('.api_%s' % title)
+        return request.host_url.rstrip('/') + self._hrefs[title]
 
     def create_links(self, item):
         cls = item.__class__.__name__.lower()
@@ -35,21 +51,32 @@ class Hateoas(object):
         if cls == 'taskrun':
             link = self.create_link(item)
             if item.app_id is not None:
-                links.append(self.create_link(item.app, rel='parent'))
+                links.append(self.create_link_by_id('app', item.app_id,
+                                                    rel='parent'))
             if item.task_id is not None:
-                links.append(self.create_link(item.task, rel='parent'))
+                links.append(self.create_link_by_id('task', item.task_id,
+                                                    rel='parent'))
+            return links, link
+        elif cls == 'result':
+            link = self.create_link(item)
+            links = [self.create_link_by_id('app', item.app_id, rel='parent'),
+                     self.create_link_by_id('task', item.task_id,
+                                            rel='parent')]
             return links, link
         elif cls == 'task':
             link = self.create_link(item)
             if item.app_id is not None:
-                links = [self.create_link(item.app, rel='parent')]
+                links = [self.create_link_by_id('app', item.app_id,
+                                                rel='parent')]
             return links, link
         elif cls == 'category':
             return None, self.create_link(item)
         elif cls == 'app':
             link = self.create_link(item)
             if item.category_id is not None:
-                links.append(self.create_link(item.category, rel='category'))
+                links.append(self.create_link_by_id('category',
+                                                    item.category_id,
+                                                    rel='category'))
             return links, link
         elif cls == 'user':
             link = self.create_link(item)
@@ -58,6 +85,16 @@ class Hateoas(object):
         else: # pragma: no cover
             return False
 
+    def create_next_link(self, endpoint, last_id, args):
+        """Return the Link header value for the page of a list that comes
+        after the item with id last_id, keeping the other arguments but the
+        API key, which must not end up in a header that proxies may store"""
+        args = dict(args, last_id=last_id)
+        args.pop('offset', None)
+        args.pop('api_key', None)
+        href = url_for(endpoint, _external=True, **args)
+        return '<%s>; rel="next"' % href
+
     def remove_links(self, item):
         """Remove HATEOAS link and links from item"""
         if item.get('link'):
@@ -16,12 +16,17 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
-from StringIO import StringIO
+import codecs
 import json
+import os
+import re
 import requests
+from tempfile import TemporaryFile, mkstemp
+from flask import current_app
 from flask.ext.babel import gettext
 from pybossa.util import unicode_csv_reader
-from pybossa.model.task import Task
+from pybossa.model import bulk_operation
+from pybossa.model.task import make_info_hash
 from pybossa.cache import apps as cached_apps
 
 
@@ -36,26 +41,102 @@ def variants():
     return variants
 
 
-def create_importer_for(template):
-    return _importers[template]()
+def create_importer_for(template, spool=False):
+    return _importers[template](spool=spool)
 
 
 class _BulkTaskImport(object):
     importer_id = None
+    # Size of the chunks read from the remote source
+    chunk_size = 64 * 1024
+    # Columns of the imported data that are Task fields instead of info keys
+    task_fields = set(['state', 'quorum', 'calibration', 'priority_0',
+                       'n_answers'])
+
+    def __init__(self, spool=False):
+        """If spool is True, the remote data is downloaded to a temporary
+        file before parsing it, so the connection is not kept open while the
+        tasks are created"""
+        self.spool = spool
 
     @classmethod
     def variants(self):
         return [self.importer_id] if self.importer_id != None else []
 
-    def tasks(self, form):
+    def tasks(self, **form_data):
         """Returns a generator with all the tasks imported"""
         pass
 
+    def cleanup(self, **form_data):
+        """Remove anything left behind by the import, once the tasks have
+        been read"""
+        pass
+
+    def _get(self, url):
+        return requests.get(url, stream=True)
+
+    def _text(self, r):
+        """Yield the body of the response in unicode chunks, without reading
+        the whole body in memory"""
+        try:
+            if self.spool:
+                chunks = self._spool(r)
+            else:
+                chunks = r.iter_content(self.chunk_size)
+            for text in self._decode(chunks, r.encoding or 'utf-8'):
+                yield text
+        finally:
+            r.close()
+
+    def _lines(self, r):
+        """Yield the lines of the body of the response, as unicode"""
+        return self._split_lines(self._text(r))
+
+    def _file_lines(self, f):
+        """Yield the lines of a file, as unicode, without reading the whole
+        file in memory"""
+        try:
+            chunks = iter(lambda: f.read(self.chunk_size), '')
+            for line in self._split_lines(self._decode(chunks, 'utf-8-sig')):
+                yield line
+        finally:
+            f.close()
+
+    def _decode(self, chunks, encoding):
+        decoder = codecs.getincrementaldecoder(encoding)('replace')
+        for chunk in chunks:
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        text = decoder.decode('', final=True)
+        if text:
+            yield text
+
+    def _split_lines(self, texts):
+        pending = u''
+        for text in texts:
+            lines = (pending + text).split(u'\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line + u'\n'
+        if pending:
+            yield pending
+
+    def _spool(self, r):
+        tmp = TemporaryFile()
+        try:
+            for chunk in r.iter_content(self.chunk_size):
+                tmp.write(chunk)
+            r.close()
+            tmp.seek(0)
+            for chunk in iter(lambda: tmp.read(self.chunk_size), ''):
+                yield chunk
+        finally:
+            tmp.close()
+
     def _import_csv_tasks(self, csvreader):
         headers = []
         data_rows_present = False
-        fields = set(['state', 'quorum', 'calibration', 'priority_0',
-                      'n_answers'])
         field_header_index = []
 
         for row in csvreader:
@@ -65,7 +146,7 @@ class _BulkTaskImport(object):
                     msg = gettext('The file you uploaded has '
                                   'two headers with the same name.')
                     raise BulkImportException(msg)
-                field_headers = set(headers) & fields
+                field_headers = set(headers) & self.task_fields
                 for field in field_headers:
                     field_header_index.append(headers.index(field))
             else:
@@ -80,6 +161,30 @@ class _BulkTaskImport(object):
         if data_rows_present is False:
             raise BulkImportException(gettext('Oops! It looks like the file is empty.'))
 
+    def _import_ndjson_tasks(self, lines):
+        data_rows_present = False
+        for n, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if not isinstance(record, dict):
+                msg = gettext('Oops! Line %(n)s of the file is not a JSON '
+                              'object.', n=n)
+                raise BulkImportException(msg, 'error')
+            data_rows_present = True
+            task_data = {"info": {}}
+            for key, value in record.items():
+                if key in self.task_fields:
+                    task_data[key] = value
+                else:
+                    task_data["info"][key] = value
+            yield task_data
+        if data_rows_present is False:
+            raise BulkImportException(gettext('Oops! It looks like the file is empty.'))
+
     def _get_csv_data_from_request(self, r):
         if r.status_code == 403:
             msg = "Oops! It looks like you don't have permission to access" \
@@ -90,21 +195,20 @@ class _BulkTaskImport(object):
             msg = gettext("Oops! That file doesn't look like the right file.")
             raise BulkImportException(msg, 'error')
 
-        csvcontent = StringIO(r.text)
-        csvreader = unicode_csv_reader(csvcontent)
+        csvreader = unicode_csv_reader(self._lines(r))
         return self._import_csv_tasks(csvreader)
 
 
 class _BulkTaskCSVImport(_BulkTaskImport):
     importer_id = "csv"
 
-    def tasks(self, form):
-        dataurl = self._get_data_url(form)
-        r = requests.get(dataurl)
+    def tasks(self, **form_data):
+        dataurl = self._get_data_url(**form_data)
+        r = self._get(dataurl)
         return self._get_csv_data_from_request(r)
 
-    def _get_data_url(self, form):
-        return form.csv_url.data
+    def _get_data_url(self, **form_data):
+        return form_data['csv_url']
 
 
 class _BulkTaskGDImport(_BulkTaskImport):
@@ -132,37 +236,42 @@ class _BulkTaskGDImport(_BulkTaskImport):
         return [("-".join([self.importer_id, mode]))
                 for mode in self.googledocs_urls.keys()]
 
-    def tasks(self, form):
-        dataurl = self._get_data_url(form)
-        r = requests.get(dataurl)
+    def tasks(self, **form_data):
+        dataurl = self._get_data_url(**form_data)
+        r = self._get(dataurl)
         return self._get_csv_data_from_request(r)
 
-    def _get_data_url(self, form):
+    def _get_data_url(self, **form_data):
+        url = form_data['googledocs_url']
         # For old data links of Google Spreadsheets
-        if 'ccc?key' in form.googledocs_url.data:
-            return ''.join([form.googledocs_url.data, '&output=csv'])
+        if 'ccc?key' in url:
+            return ''.join([url, '&output=csv'])
         # New data format for Google Drive import is like this: 
         # https://docs.google.com/spreadsheets/d/key/edit?usp=sharing
         else:
-            return ''.join([form.googledocs_url.data.split('edit')[0], 
-                            'export?format=csv'])
+            return ''.join([url.split('edit')[0], 'export?format=csv'])
 
 
 class _BulkTaskEpiCollectPlusImport(_BulkTaskImport):
     importer_id = "epicollect"
 
-    def tasks(self, form):
-        dataurl = self._get_data_url(form)
-        r = requests.get(dataurl)
+    def tasks(self, **form_data):
+        dataurl = self._get_data_url(**form_data)
+        r = self._get(dataurl)
         return self._get_epicollect_data_from_request(r)
 
     def _import_epicollect_tasks(self, data):
-        for d in data:
-            yield {"info": d}
+        try:
+            for d in data:
+                yield {"info": d}
+        except ValueError:
+            msg = "Oops! It looks like the data of that project and form " \
+                "is not valid JSON."
+            raise BulkImportException(gettext(msg), 'error')
 
-    def _get_data_url(self, form):
+    def _get_data_url(self, **form_data):
         return 'http://plus.epicollect.net/%s/%s.json' % \
-            (form.epicollect_project.data, form.epicollect_form.data)
+            (form_data['epicollect_project'], form_data['epicollect_form'])
 
     def _get_epicollect_data_from_request(self, r):
         if r.status_code == 403:
@@ -172,33 +281,167 @@ class _BulkTaskEpiCollectPlusImport(_BulkTaskImport):
         if not 'application/json' in r.headers['content-type']:
             msg = "Oops! That project and form do not look like the right one."
             raise BulkImportException(gettext(msg), 'error')
-        return self._import_epicollect_tasks(json.loads(r.text))
+        return self._import_epicollect_tasks(iter_json_array(self._text(r)))
 
 
-def create_tasks(task_repo, tasks_data, project_id):
-    empty = True
-    n = 0
+class _BulkTaskFileImport(_BulkTaskImport):
+    """Import the tasks from a CSV or JSON lines (one task per line) file in
+    the server: either a file uploaded with the import form (see
+    store_upload) or, for admins, any file the server can read. The file is
+    already on disk, so it is never spooled"""
+    importer_id = "upload"
+    formats = ('csv', 'ndjson')
+
+    def tasks(self, **form_data):
+        file_format = form_data.get('file_format', 'csv')
+        if file_format not in self.formats:
+            msg = gettext("Oops! That file doesn't look like the right file.")
+            raise BulkImportException(msg, 'error')
+        try:
+            f = open(form_data['file_path'], 'rb')
+        except IOError:
+            msg = gettext("Oops! It looks like that file can not be read.")
+            raise BulkImportException(msg, 'error')
+        lines = self._file_lines(f)
+        if file_format == 'ndjson':
+            return self._import_ndjson_tasks(lines)
+        return self._import_csv_tasks(unicode_csv_reader(lines))
+
+    def cleanup(self, **form_data):
+        """Remove the file, if it was uploaded for the import"""
+        if form_data.get('uploaded'):
+            try:
+                os.remove(form_data['file_path'])
+            except OSError:
+                pass
+
+
+def store_upload(upload):
+    """Store an uploaded file (a FileStorage) in IMPORT_UPLOAD_FOLDER, or in
+    the temporary folder if it is not set, so it can be read by a background
+    import. Return the path of the stored file"""
+    folder = current_app.config.get('IMPORT_UPLOAD_FOLDER')
+    fd, path = mkstemp(prefix='import-', dir=folder)
+    with os.fdopen(fd, 'wb') as f:
+        upload.save(f)
+    return path
+
+
+_whitespace = re.compile(r'\s*')
+
+
+def iter_json_array(texts):
+    """Yield the items of a JSON array that is read from an iterable of
+    unicode chunks, without loading the whole array in memory. Raise a
+    ValueError if it is not a valid JSON array"""
+    decoder = json.JSONDecoder()
+    texts = iter(texts)
+    buf, pos = u'', 0
+    exhausted = False
+    expect = '['
+    while True:
+        pos = _whitespace.match(buf, pos).end()
+        end = None
+        if pos < len(buf):
+            char = buf[pos]
+            if expect == '[':
+                if char != u'[':
+                    raise ValueError('Expecting a JSON array')
+                pos, expect = pos + 1, 'first'
+                continue
+            if expect == 'separator' or (expect == 'first' and char == u']'):
+                if char == u']':
+                    return
+                if char != u',':
+                    raise ValueError("Expecting ',' or ']' in the JSON array")
+                pos, expect = pos + 1, 'item'
+                continue
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                end = None
+            # An item could go on in the next chunk (e.g. a number), unless
+            # it is followed by a separator
+            if end is not None:
+                after = _whitespace.match(buf, end).end()
+                if exhausted or (after < len(buf) and buf[after] in u',]'):
+                    yield item
+                    pos, expect = end, 'separator'
+                    continue
+        if exhausted:
+            raise ValueError('Unexpected end of the JSON array')
+        text = next(texts, None)
+        if text is None:
+            exhausted = True
+        else:
+            buf, pos = buf[pos:] + text, 0
+
+
+def batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def remove_duplicates(tasks_data, seen):
+    """Return the tasks whose info hash is not in the seen set, with their
+    info_hash, and add their hashes to it"""
+    new_tasks = []
     for task_data in tasks_data:
-        task = Task(app_id=project_id)
-        [setattr(task, k, v) for k, v in task_data.iteritems()]
-        found = task_repo.get_task_by(app_id=project_id, info=task.info)
-        if found is None:
-            task_repo.save(task)
-            n += 1
-            empty = False
-    if empty:
-        msg = gettext('It looks like there were no new records to import')
-        return msg
-    msg = str(n) + " " + gettext('new tasks were imported successfully')
+        info_hash = make_info_hash(task_data.get('info'))
+        if info_hash not in seen:
+            seen.add(info_hash)
+            new_tasks.append(dict(task_data, info_hash=info_hash))
+    return new_tasks
+
+
+def insert_new_tasks(task_repo, tasks_data, project_id):
+    """Insert the tasks that are not in the project yet, and return how many
+    were inserted. The tasks must not have duplicates among them (see
+    remove_duplicates)"""
+    existing = task_repo.get_info_hashes(
+        project_id, [t['info_hash'] for t in tasks_data])
+    new_tasks = [t for t in tasks_data if t['info_hash'] not in existing]
+    return task_repo.insert_tasks(project_id, new_tasks)
+
+
+def create_tasks(task_repo, tasks_data, project_id, batch_size=1000):
+    """Create the tasks that are not already in the project, in batches.
+    Duplicates are found by the hash of the task info, both within the
+    imported data and against the tasks in the DB. Every batch is committed,
+    so the events of the tasks are fired even if a later batch fails"""
+    n = 0
+    seen = set()
+    with bulk_operation(fire_on_error=True):
+        for batch in batches(tasks_data, batch_size):
+            new_tasks = remove_duplicates(batch, seen)
+            n += insert_new_tasks(task_repo, new_tasks, project_id)
+    if n > 0:
+        delete_cached_stats(project_id)
+    return import_message(n)
+
+
+def import_message(n):
+    if n == 0:
+        return gettext('It looks like there were no new records to import')
     if n == 1:
-        msg = str(n) + " " + gettext('new task was imported successfully')
+        return str(n) + " " + gettext('new task was imported successfully')
+    return str(n) + " " + gettext('new tasks were imported successfully')
+
+
+def delete_cached_stats(project_id):
     cached_apps.delete_n_tasks(project_id)
     cached_apps.delete_n_task_runs(project_id)
     cached_apps.delete_overall_progress(project_id)
     cached_apps.delete_last_activity(project_id)
-    return msg
 
 
 _importers = {'csv': _BulkTaskCSVImport,
               'gdocs': _BulkTaskGDImport,
-              'epicollect': _BulkTaskEpiCollectPlusImport}
+              'epicollect': _BulkTaskEpiCollectPlusImport,
+              'upload': _BulkTaskFileImport}
@@ -22,6 +22,17 @@ from pybossa.util import with_cache_disabled
 
 MINUTE = 60
 HOUR = 60 * 60
+# Number of tasks inserted by every import_tasks_chunk job
+IMPORT_CHUNK_SIZE = 1000
+# Chunks of an import that can be waiting in the queue at the same time
+IMPORT_MAX_PENDING_CHUNKS = 8
+# Number of tasks removed by every statement of delete_tasks
+DELETE_BATCH_SIZE = 1000
+# Number of tasks updated by every transaction of update_tasks_redundancy
+REDUNDANCY_BATCH_SIZE = 1000
+# Number of tasks whose results are rebuilt by every transaction of
+# rebuild_results
+RESULTS_BATCH_SIZE = 1000
 
 def get_scheduled_jobs(): # pragma: no cover
     """Return a list of scheduled jobs."""
@@ -30,6 +41,8 @@ def get_scheduled_jobs(): # pragma: no cover
     # interval)
     jobs = [dict(name=warm_up_stats, args=[], kwargs={},
                  interval=HOUR, timeout=(10 * MINUTE)),
+            dict(name=generate_global_stats, args=[], kwargs={},
+                 interval=(10 * MINUTE), timeout=(10 * MINUTE)),
             dict(name=warn_old_project_owners, args=[], kwargs={},
                  interval=(24 * HOUR), timeout=(10 * MINUTE)),
             dict(name=warm_cache, args=[], kwargs={},
@@ -97,6 +110,13 @@ def warm_up_stats(): # pragma: no cover
     return True
 
 
+def generate_global_stats(): # pragma: no cover
+    """Background job for generating the global stats document."""
+    from pybossa.cache.site_stats import global_stats
+    global_stats()
+    return True
+
+
 @with_cache_disabled
 def warm_cache(): # pragma: no cover
     """Background job to warm cache."""
@@ -209,17 +229,267 @@ def send_mail(message_dict):
     mail.send(message)
 
 
-def import_tasks(tasks_info, app_id):
-    from pybossa.core import task_repo, project_repo
-    from flask import current_app
+def import_tasks(app_id, import_id=None, **form_data):
+    """Import the tasks of a project from the source described by form_data.
+
+    The source is read as a stream and split in chunks of IMPORT_CHUNK_SIZE
+    tasks, which are inserted by import_tasks_chunk jobs in parallel. When
+    too many chunks are pending, the next one is inserted by this job, so
+    that memory is bounded and the import goes on with a single worker. The
+    progress is available at JobProgress(sentinel.master, 'import',
+    import_id)."""
+    from pybossa.core import sentinel
+    from pybossa.model import make_uuid
+    from pybossa.progress import JobProgress
+    from rq import Queue
+    import pybossa.importers as importers
+
+    import_id = import_id or make_uuid()
+    progress = JobProgress(sentinel.master, 'import', import_id)
+    progress.start(app_id=app_id, n_parsed=0, n_inserted=0, n_skipped=0,
+                   n_chunks_done=0)
+    queue = Queue('importer', connection=sentinel.master)
+    importer = importers.create_importer_for(form_data.get('type'), spool=True)
+    seen = set()
+    n_chunks = 0
+    try:
+        tasks_data = importer.tasks(**form_data)
+        for chunk in importers.batches(tasks_data, IMPORT_CHUNK_SIZE):
+            new_tasks = importers.remove_duplicates(chunk, seen)
+            progress.incr('n_parsed', len(chunk))
+            progress.incr('n_skipped', len(chunk) - len(new_tasks))
+            record = progress.get()
+            # A chunk job failed, and the owner has been notified
+            if record['state'] == 'failed':
+                return None
+            pending = n_chunks - record['n_chunks_done']
+            if pending < IMPORT_MAX_PENDING_CHUNKS:
+                queue.enqueue(import_tasks_chunk, app_id, import_id, n_chunks,
+                              new_tasks)
+            else:
+                import_tasks_chunk(app_id, import_id, n_chunks, new_tasks)
+            n_chunks += 1
+    except importers.BulkImportException as e:
+        return _fail_import(app_id, import_id, e.args[0])
+    except Exception as e:
+        _fail_import(app_id, import_id, 'Error: %s' % e)
+        raise
+    finally:
+        importer.cleanup(**form_data)
+    progress.set(n_chunks=n_chunks)
+    return _finish_import(app_id, import_id)
+
+
+def import_tasks_chunk(app_id, import_id, index, tasks_data):
+    """Insert a chunk of an import. Retrying a chunk that is done already
+    does nothing, and tasks are never duplicated as they are checked
+    against the project before the insert."""
+    from pybossa.core import task_repo, sentinel
+    from pybossa.progress import JobProgress
+    import pybossa.importers as importers
+
+    progress = JobProgress(sentinel.master, 'import', import_id)
+    if progress.is_step_done(index):
+        return 0
+    # The chunks still queued when the import fails are not inserted
+    if progress.get()['state'] == 'failed':
+        return 0
+    try:
+        n = importers.insert_new_tasks(task_repo, tasks_data, app_id)
+    except Exception as e:
+        _fail_import(app_id, import_id, 'Error: %s' % e)
+        raise
+    if progress.step_done(index):
+        progress.incr('n_inserted', n)
+        progress.incr('n_skipped', len(tasks_data) - n)
+        progress.incr('n_chunks_done')
+        _finish_import(app_id, import_id)
+    return n
+
+
+def _finish_import(app_id, import_id):
+    """Finish the import if all its chunks are done. Only the first caller
+    that sees it done notifies the owner."""
+    from pybossa.core import project_repo, sentinel
+    from pybossa.progress import JobProgress
     import pybossa.importers as importers
 
+    progress = JobProgress(sentinel.master, 'import', import_id)
+    record = progress.get()
+    if (record.get('n_chunks') is None or
+            record['n_chunks_done'] < record['n_chunks']):
+        return None
+    if not progress.claim('finished'):
+        return None
+    progress.finish()
     app = project_repo.get(app_id)
-    msg = importers.create_tasks(task_repo, tasks_info, app_id)
+    if record['n_inserted'] > 0:
+        importers.delete_cached_stats(app_id)
+    msg = importers.import_message(record['n_inserted'])
     msg = msg + ' to your project %s!' % app.name
+    _send_import_mail(app, msg)
+    return msg
+
+
+def _fail_import(app_id, import_id, error):
+    """Mark the import as failed and tell the owner how many tasks were
+    inserted before the error. Only the first caller that sees it fail (or
+    finish) notifies the owner."""
+    from pybossa.core import project_repo, sentinel
+    from pybossa.progress import JobProgress
+    import pybossa.importers as importers
+
+    progress = JobProgress(sentinel.master, 'import', import_id)
+    if not progress.claim('finished'):
+        return None
+    progress.finish(error=error)
+    n_inserted = progress.get()['n_inserted']
+    app = project_repo.get(app_id)
+    if n_inserted == 0:
+        msg = '%s Nothing was imported to your project %s.' % (error,
+                                                               app.name)
+    else:
+        importers.delete_cached_stats(app_id)
+        msg = '%s Only %s new tasks were imported to your project %s.' % (
+            error, n_inserted, app.name)
+    _send_import_mail(app, msg)
+    return msg
+
+
+def _send_import_mail(app, msg):
+    from flask import current_app
     subject = 'Tasks Import to your project %s' % app.name
     body = 'Hello,\n\n' + msg + '\n\nAll the best,\nThe %s team.' % current_app.config.get('BRAND')
     mail_dict = dict(recipients=[app.owner.email_addr],
                      subject=subject, body=body)
     send_mail(mail_dict)
+
+
+def delete_tasks(app_id):
+    """Delete all the tasks of a project, with their task runs, in batches of
+    DELETE_BATCH_SIZE tasks. The progress is available at
+    JobProgress(sentinel.master, 'delete_tasks', app_id)."""
+    from pybossa.core import task_repo, sentinel
+    from pybossa.progress import JobProgress
+    import pybossa.importers as importers
+
+    progress = JobProgress(sentinel.master, 'delete_tasks', app_id)
+    progress.start(app_id=app_id, n_tasks=0, n_task_runs=0)
+    while True:
+        n_tasks, n_task_runs = task_repo.delete_tasks_batch(app_id,
+                                                            DELETE_BATCH_SIZE)
+        if n_tasks == 0:
+            break
+        progress.incr('n_tasks', n_tasks)
+        progress.incr('n_task_runs', n_task_runs)
+    importers.delete_cached_stats(app_id)
+    progress.finish()
+    return progress.get()['n_tasks']
+
+
+def update_tasks_redundancy(app_id, n_answers):
+    """Update the redundancy of all the tasks of a project, and their state,
+    in batches of REDUNDANCY_BATCH_SIZE tasks with a short transaction each.
+    The progress is available at JobProgress(sentinel.master, 'redundancy',
+    app_id)."""
+    from pybossa.core import project_repo, task_repo, sentinel
+    from pybossa.progress import JobProgress
+    import pybossa.cache.apps as cached_apps
+
+    progress = JobProgress(sentinel.master, 'redundancy', app_id)
+    progress.start(app_id=app_id, n_answers=n_answers, n_updated=0)
+    app = project_repo.get(app_id)
+    n = task_repo.update_tasks_redundancy(
+        app, n_answers, chunk_size=REDUNDANCY_BATCH_SIZE,
+        progress=lambda n: progress.incr('n_updated', n))
+    cached_apps.delete_app(app.short_name)
+    cached_apps.delete_n_completed_tasks(app_id)
+    cached_apps.delete_overall_progress(app_id)
+    progress.finish()
+    return n
+
+
+def rebuild_results(app_id):
+    """Rebuild the results of a project from its task runs, e.g. when its
+    result_keys change, in batches of RESULTS_BATCH_SIZE tasks with a short
+    transaction each. The progress is available at
+    JobProgress(sentinel.master, 'results', app_id)."""
+    from pybossa.core import project_repo, task_repo, sentinel
+    from pybossa.progress import JobProgress
+
+    progress = JobProgress(sentinel.master, 'results', app_id)
+    progress.start(app_id=app_id, n_tasks=0)
+    app = project_repo.get(app_id)
+    keys = (app.info or {}).get('result_keys')
+    last_task_id = 0
+    while True:
+        last_task_id, n_tasks = task_repo.rebuild_results_batch(
+            app_id, keys, last_task_id, RESULTS_BATCH_SIZE)
+        if n_tasks == 0:
+            break
+        progress.incr('n_tasks', n_tasks)
+    progress.finish()
+    return progress.get()['n_tasks']
+
+
+def export_to_ckan(app_id, ty, user_id, app_url):
+    """Export the tasks or task runs of a project to the CKAN datastore,
+    streaming them in batches and keeping track of the progress."""
+    from pybossa.core import task_repo, project_repo, user_repo, sentinel
+    from pybossa.ckan import Ckan
+    from pybossa.progress import JobProgress
+    from flask import current_app
+    from requests.exceptions import ConnectionError
+
+    app = project_repo.get(app_id)
+    user = user_repo.get(user_id)
+    ckan_url = current_app.config['CKAN_URL']
+    progress = JobProgress(sentinel.master, 'ckan_export',
+                           '%s:%s' % (app_id, ty))
+    progress.start(app_id=app_id, type=ty, exported=0)
+    ckan = Ckan(url=ckan_url, api_key=user.ckan_api)
+    rows = getattr(task_repo, 'filter_%ss_by' % ty)(app_id=app_id,
+                                                    yielded=True)
+    records = (row.dictize() for row in rows)
+    try:
+        package, e = ckan.package_exists(name=app.short_name)
+        if e:
+            raise e
+        owner = user_repo.get(app.owner_id)
+        resource_id = None
+        if package:
+            ckan.package_update(app=app, user=owner, url=app_url,
+                                resources=package['resources'])
+            resource_id = ckan.get_resource_id(ty)
+            if resource_id:
+                ckan.datastore_delete(name=ty, resource_id=resource_id)
+                ckan.datastore_create(name=ty, resource_id=resource_id)
+        else:
+            ckan.package_create(app=app, user=owner, url=app_url)
+        if not resource_id:
+            new_resource = ckan.resource_create(name=ty)
+            resource_id = new_resource['result']['id']
+            ckan.datastore_create(name=ty, resource_id=resource_id)
+        ckan.datastore_upsert(name=ty, records=records,
+                              resource_id=resource_id,
+                              progress=lambda n: progress.incr('exported', n))
+        progress.finish()
+        msg = 'Data exported to %s' % ckan_url
+    except ConnectionError as e:
+        msg = ("CKAN server seems to be down, try again later or contact "
+               "the CKAN admins")
+        progress.finish(error=msg)
+    except Exception as e:
+        if len(e.args) == 3:
+            t, error_msg, status_code = e.args
+            msg = "Error: %s with status code: %s" % (t, status_code)
+        else:  # pragma: no cover
+            msg = "Error: %s" % e.args[0]
+        progress.finish(error=msg)
+    subject = 'Export of your project %s to CKAN' % app.name
+    body = ('Hello,\n\n' + msg + ' for your project %s.' % app.name +
+            '\n\nAll the best,\nThe %s team.' % current_app.config.get('BRAND'))
+    mail_dict = dict(recipients=[user.email_addr], subject=subject, body=body)
+    send_mail(mail_dict)
     return msg
+
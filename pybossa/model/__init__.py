@@ -20,11 +20,16 @@ import datetime
 import json
 import uuid
 import requests
+import threading
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+from functools import wraps
 
+from psycopg2.extensions import new_type, register_type
 from sqlalchemy import Text
 from sqlalchemy.orm import relationship, backref, class_mapper
 from sqlalchemy.ext.mutable import Mutable
-from sqlalchemy.types import TypeDecorator
+from sqlalchemy.types import TypeDecorator, UserDefinedType
 from sqlalchemy import event
 from sqlalchemy.engine import reflection
 from sqlalchemy.schema import (
@@ -79,10 +84,32 @@ class DomainObject(object):
         return repr
 
 
+# The JSONB values are read as text, like the Text columns they replaced,
+# and the JSON types below (or whoever runs a query by hand) load them
+JSONB_OID = 3802
+register_type(new_type((JSONB_OID,), 'JSONB', lambda value, cursor: value))
+
+
+class JSONB(UserDefinedType):
+    '''The JSONB type of PostgreSQL, which can be indexed with GIN indexes
+    and queried with the containment operator.
+    '''
+
+    def get_col_spec(self):
+        return 'JSONB'
+
+    class comparator_factory(UserDefinedType.Comparator):
+
+        def contains(self, other, **kwargs):
+            """Return whether the value contains the given JSON value,
+            e.g. info.contains({'answer': 'yes'})"""
+            return self.op('@>')(other)
+
+
 class JSONType(Mutable, TypeDecorator):
     '''Additional Database Type for handling JSON values.
     '''
-    impl = Text
+    impl = JSONB
 
     def __init__(self):
         super(JSONType, self).__init__()
@@ -100,7 +127,7 @@ class JSONType(Mutable, TypeDecorator):
 class JSONEncodedDict(TypeDecorator):
     "Represents a dict structure as a json-encoded string."
 
-    impl = Text
+    impl = JSONB
 
     def process_bind_param(self, value, dialect):
         if value is not None:
@@ -175,6 +202,50 @@ def update_app_timestamp(mapper, conn, target):
     conn.execute(sql_query)
 
 
+_bulk = threading.local()
+_BulkTarget = namedtuple('BulkTarget', ['app_id'])
+
+
+@contextmanager
+def bulk_operation(fire_on_error=False):
+    """Run a bulk operation, e.g. a task import, deferring the per row
+    listeners decorated with deferred_in_bulk. They are fired once per
+    project when the block ends, and dropped if it raises unless
+    fire_on_error is set, for blocks that commit their work as they go.
+    Nested blocks are part of the outer one."""
+    if getattr(_bulk, 'events', None) is not None:
+        yield
+        return
+    _bulk.events = OrderedDict()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        events = _bulk.events.values()
+        _bulk.events = None
+        if events and (fire_on_error or not failed):
+            from pybossa.core import db
+            with db.engine.begin() as conn:
+                for listener, target in events:
+                    listener(None, conn, target)
+
+
+def deferred_in_bulk(listener):
+    """Decorate a model listener that only depends on target.app_id, so it
+    is collapsed into one call per project inside a bulk_operation."""
+    @wraps(listener)
+    def wrapper(mapper, conn, target):
+        events = getattr(_bulk, 'events', None)
+        if events is None:
+            return listener(mapper, conn, target)
+        events[(listener, target.app_id)] = (listener,
+                                             _BulkTarget(target.app_id))
+    return wrapper
+
+
 def webhook(url, payload=None):
     """Post to a webhook."""
     headers = {'Content-type': 'application/json', 'Accept': 'text/plain'}
@@ -17,7 +17,7 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
 from sqlalchemy import Integer, Boolean, Unicode, Float, UnicodeText, Text
-from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.schema import Column, ForeignKey, Index
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy import event
 
@@ -26,6 +26,7 @@ from pybossa.core import db, signer
 from pybossa.model import DomainObject, JSONType, JSONEncodedDict, make_timestamp, update_redis
 from pybossa.model.task import Task
 from pybossa.model.task_run import TaskRun
+from pybossa.model.result import Result
 from pybossa.model.category import Category
 from pybossa.model.blogpost import Blogpost
 
@@ -35,6 +36,7 @@ class App(db.Model, DomainObject):
     '''
 
     __tablename__ = 'app'
+    __table_args__ = (Index('app_info_idx', 'info', postgresql_using='gin'), )
 
     #: ID of the project
     id = Column(Integer, primary_key=True)
@@ -79,6 +81,8 @@ class App(db.Model, DomainObject):
     task_runs = relationship(TaskRun, backref='app',
                              cascade='all, delete-orphan',
                              order_by='TaskRun.finish_time.desc()')
+    results = relationship(Result, backref='app',
+                           cascade='all, delete-orphan')
     category = relationship(Category)
     blogposts = relationship(Blogpost, cascade='all, delete-orphan', backref='app')
 
@@ -16,6 +16,8 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
+
 from sqlalchemy import Integer, Text
 from sqlalchemy.schema import Column, ForeignKey
 
@@ -51,3 +53,26 @@ class Auditlog(db.Model, DomainObject):
     old_value = Column(Text)
     #: New_value
     new_value = Column(Text)
+
+
+def tasks_update_log(app, user, values, n_tasks, caller, task_ids=None,
+                     filters=None):
+    """Return the Auditlog of an update of many tasks of a project. The tasks
+    are summarized by their number and the range of their ids, or by the
+    filter that selected them."""
+    selection = dict(n_tasks=n_tasks)
+    if task_ids:
+        selection.update(first_task_id=min(task_ids),
+                         last_task_id=max(task_ids))
+    else:
+        selection['filter'] = filters or {}
+    return Auditlog(
+        app_id=app.id,
+        app_short_name=app.short_name,
+        user_id=user.id,
+        user_name=user.name,
+        action='update',
+        caller=caller,
+        attribute=','.join('task.%s' % key for key in sorted(values)),
+        old_value=json.dumps(selection, sort_keys=True),
+        new_value=json.dumps(values, sort_keys=True))
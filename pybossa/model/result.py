@@ -0,0 +1,88 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+
+from sqlalchemy import Integer, Text
+from sqlalchemy.schema import Column, ForeignKey, Index
+
+from pybossa.core import db
+from pybossa.model import DomainObject, JSONType, make_timestamp
+
+
+
+class Result(db.Model, DomainObject):
+    '''The aggregated answers of all the TaskRuns of a Task.
+    '''
+    __tablename__ = 'result'
+    __table_args__ = (Index('result_app_id_id_idx', 'app_id', 'id'), )
+
+    #: ID of the Result
+    id = Column(Integer, primary_key=True)
+    #: UTC timestamp for when the Result is created.
+    created = Column(Text, default=make_timestamp)
+    #: UTC timestamp for when the last answer was added to the Result.
+    updated = Column(Text, default=make_timestamp, onupdate=make_timestamp)
+    #: Project.id of the project associated with this Result.
+    app_id = Column(Integer, ForeignKey('app.id', ondelete='CASCADE'),
+                    nullable=False)
+    #: Task.id of the task associated with this Result.
+    task_id = Column(Integer, ForeignKey('task.id', ondelete='CASCADE'),
+                     nullable=False, unique=True)
+    #: Number of TaskRuns aggregated in this Result.
+    n_answers = Column(Integer, default=0)
+    #: Frequency of every answered value, per key of the TaskRun.info field.
+    info = Column(JSONType, default=dict)
+    '''Only the keys listed in the project's info['result_keys'] are
+    aggregated. For example::
+        info: {
+            'answer': {'yes': 3, 'no': 1}
+        }
+    '''
+
+
+def answer_value(value):
+    """Return the value of an answer as a string that can be used as a key of
+    the frequencies dict."""
+    if isinstance(value, basestring):
+        return value
+    return json.dumps(value, sort_keys=True)
+
+
+def add_answer(frequencies, answer, keys, amount=1):
+    """Add the values of the given keys of an answer (a TaskRun.info field) to
+    the frequencies dict, and return it. The values whose frequency drops to
+    zero are removed."""
+    if not isinstance(answer, dict):
+        return frequencies
+    for key in keys:
+        if key in answer:
+            value = answer_value(answer[key])
+            counts = frequencies.setdefault(key, {})
+            counts[value] = counts.get(value, 0) + amount
+            if counts[value] <= 0:
+                del counts[value]
+            if not counts:
+                del frequencies[key]
+    return frequencies
+
+
+def remove_answer(frequencies, answer, keys):
+    """Remove the values of the given keys of an answer from the frequencies
+    dict, and return it."""
+    return add_answer(frequencies, answer, keys, amount=-1)
@@ -16,15 +16,19 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
+from hashlib import md5
+
 from sqlalchemy import Integer, Boolean, Float, UnicodeText, Text
-from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.schema import Column, ForeignKey, Index
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy import event
 
 from pybossa.core import db
 from pybossa.model import DomainObject, JSONType, JSONEncodedDict, \
-    make_timestamp, update_redis, update_app_timestamp
+    make_timestamp, update_redis, update_app_timestamp, deferred_in_bulk
 from pybossa.model.task_run import TaskRun
+from pybossa.model.result import Result
 
 
 
@@ -34,6 +38,9 @@ class Task(db.Model, DomainObject):
     associated to a project.
     '''
     __tablename__ = 'task'
+    __table_args__ = (Index('task_app_id_id_idx', 'app_id', 'id'),
+                      Index('task_app_id_info_hash_idx', 'app_id', 'info_hash'),
+                      Index('task_info_idx', 'info', postgresql_using='gin'))
 
 
     #: Task.ID
@@ -51,10 +58,14 @@ class Task(db.Model, DomainObject):
     priority_0 = Column(Float, default=0)
     #: Task.info field in JSON with the data for the task.
     info = Column(JSONType, default=dict)
+    #: MD5 hash of the Task.info field, used to find duplicated tasks.
+    info_hash = Column(Text)
     #: Number of answers to collect for this task.
     n_answers = Column(Integer, default=30)
 
     task_runs = relationship(TaskRun, cascade='all, delete, delete-orphan', backref='task')
+    result = relationship(Result, cascade='all, delete, delete-orphan',
+                          backref='task', uselist=False)
 
 
     def pct_status(self):
@@ -64,7 +75,23 @@ class Task(db.Model, DomainObject):
         else:  # pragma: no cover
             return float(0)
 
+def make_info_hash(info):
+    """Return the hash of a Task.info field. Keys are sorted, so equal
+    dicts get the same hash."""
+    if info is None:
+        info = {}
+    return md5(json.dumps(info, sort_keys=True)).hexdigest()
+
+
+@event.listens_for(Task, 'before_insert')
+@event.listens_for(Task, 'before_update')
+def update_info_hash(mapper, conn, target):
+    """Keep Task.info_hash in sync with Task.info."""
+    target.info_hash = make_info_hash(target.info)
+
+
 @event.listens_for(Task, 'after_insert')
+@deferred_in_bulk
 def add_event(mapper, conn, target):
     """Update PyBossa feed with new task."""
     sql_query = ('select name, short_name, info from app \
@@ -84,6 +111,33 @@ def add_event(mapper, conn, target):
 
 @event.listens_for(Task, 'after_insert')
 @event.listens_for(Task, 'after_update')
+@event.listens_for(Task, 'after_delete')
+@deferred_in_bulk
 def update_app(mapper, conn, target):
     """Update app updated timestamp."""
     update_app_timestamp(mapper, conn, target)
+
+
+@event.listens_for(Task, 'after_insert')
+@event.listens_for(Task, 'after_update')
+@event.listens_for(Task, 'after_delete')
+@deferred_in_bulk
+def delete_task_bitmaps(mapper, conn, target):
+    """Delete the task bitmaps of the project, which no longer match its
+    tasks."""
+    from pybossa.cache import helpers
+    helpers.delete_task_bitmaps(target.app_id)
+
+
+@event.listens_for(Task, 'after_insert')
+def add_pending_answers(mapper, conn, target):
+    """Add the answers the task needs to the global stats."""
+    from pybossa.cache.site_stats import incr_global_stats
+    incr_global_stats(n_pending_tasks=target.n_answers or 0)
+
+
+@event.listens_for(Task, 'after_delete')
+def remove_pending_answers(mapper, conn, target):
+    """Remove the answers the task needed from the global stats."""
+    from pybossa.cache.site_stats import incr_global_stats
+    incr_global_stats(n_pending_tasks=-(target.n_answers or 0))
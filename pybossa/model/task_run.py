@@ -16,14 +16,17 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
 from datetime import datetime
 from sqlalchemy import Integer, Text
-from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.schema import Column, ForeignKey, Index
+from sqlalchemy.sql import select, text
 from sqlalchemy import event
 
 from pybossa.core import db, queues
 from pybossa.model import DomainObject, JSONType, make_timestamp, update_redis, \
-    update_app_timestamp, webhook
+    update_app_timestamp, webhook, deferred_in_bulk
+from pybossa.model.result import Result, add_answer, remove_answer
 
 
 
@@ -32,6 +35,10 @@ class TaskRun(db.Model, DomainObject):
     '''A run of a given task by a specific user.
     '''
     __tablename__ = 'task_run'
+    __table_args__ = (Index('task_run_app_id_id_idx', 'app_id', 'id'),
+                      Index('task_run_task_id_idx', 'task_id'),
+                      Index('task_run_info_idx', 'info',
+                            postgresql_using='gin'))
 
     #: ID of the TaskRun
     id = Column(Integer, primary_key=True)
@@ -101,7 +108,11 @@ def update_task_state(mapper, conn, target):
     sql_query = ('select n_answers from task \
                  where task.id=%s') % target.task_id
     task_n_answers = conn.scalar(sql_query)
-    if (n_answers) >= task_n_answers:
+    completed = n_answers >= task_n_answers
+    from pybossa.cache.helpers import record_answer
+    record_answer(target.app_id, target.task_id, target.user_id,
+                  target.user_ip, completed=completed)
+    if completed:
         sql_query = ("UPDATE task SET state=\'completed\' \
                      where id=%s") % target.task_id
         conn.execute(sql_query)
@@ -119,6 +130,96 @@ def update_task_state(mapper, conn, target):
 
 @event.listens_for(TaskRun, 'after_insert')
 @event.listens_for(TaskRun, 'after_update')
+@event.listens_for(TaskRun, 'after_delete')
+@deferred_in_bulk
 def update_app(mapper, conn, target):
     """Update app updated timestamp."""
     update_app_timestamp(mapper, conn, target)
+
+
+@event.listens_for(TaskRun, 'after_insert')
+def update_result(mapper, conn, target):
+    """Add the answer to the Result of the task, for the keys listed in the
+    project's info['result_keys']."""
+    app_info = conn.scalar(text('select info from app where id=:app_id'),
+                           app_id=target.app_id)
+    keys = json.loads(app_info or '{}').get('result_keys')
+    if not keys:
+        return
+    # Serialize the concurrent answers for the same task
+    conn.execute(text('select pg_advisory_xact_lock(:task_id)'),
+                 task_id=target.task_id)
+    result = Result.__table__
+    row = conn.execute(select([result.c.id, result.c.info])
+                       .where(result.c.task_id == target.task_id)).first()
+    if row is None:
+        info = add_answer({}, target.info, keys)
+        conn.execute(result.insert().values(app_id=target.app_id,
+                                            task_id=target.task_id,
+                                            n_answers=1, info=info))
+    else:
+        info = add_answer(row.info or {}, target.info, keys)
+        conn.execute(result.update().where(result.c.id == row.id)
+                     .values(n_answers=result.c.n_answers + 1, info=info))
+
+
+@event.listens_for(TaskRun, 'after_delete')
+def remove_answer_from_result(mapper, conn, target):
+    """Remove the answer from the Result of the task, which is deleted with
+    its last answer."""
+    app_info = conn.scalar(text('select info from app where id=:app_id'),
+                           app_id=target.app_id)
+    keys = json.loads(app_info or '{}').get('result_keys')
+    if not keys:
+        return
+    conn.execute(text('select pg_advisory_xact_lock(:task_id)'),
+                 task_id=target.task_id)
+    result = Result.__table__
+    row = conn.execute(select([result.c.id, result.c.info,
+                               result.c.n_answers])
+                       .where(result.c.task_id == target.task_id)).first()
+    if row is None:
+        return
+    if row.n_answers <= 1:
+        conn.execute(result.delete().where(result.c.id == row.id))
+    else:
+        info = remove_answer(row.info or {}, target.info, keys)
+        conn.execute(result.update().where(result.c.id == row.id)
+                     .values(n_answers=result.c.n_answers - 1, info=info))
+
+
+@event.listens_for(TaskRun, 'after_insert')
+def add_answer_to_global_stats(mapper, conn, target):
+    """Count the answer in the global stats."""
+    from pybossa.cache.site_stats import incr_global_stats
+    incr_global_stats(n_task_runs=1, n_pending_tasks=-1)
+
+
+@event.listens_for(TaskRun, 'after_delete')
+def remove_answer_from_global_stats(mapper, conn, target):
+    """Remove the answer from the global stats."""
+    from pybossa.cache.site_stats import incr_global_stats
+    incr_global_stats(n_task_runs=-1, n_pending_tasks=1)
+
+
+@event.listens_for(TaskRun, 'after_insert')
+def add_answer_to_user_progress(mapper, conn, target):
+    """Count the answer in the progress of its user."""
+    from pybossa.cache.users import incr_user_progress
+    incr_user_progress(target.app_id, target.user_id, target.user_ip)
+
+
+@event.listens_for(TaskRun, 'after_delete')
+def remove_answer_from_user_progress(mapper, conn, target):
+    """Remove the answer from the progress of its user."""
+    from pybossa.cache.users import incr_user_progress
+    incr_user_progress(target.app_id, target.user_id, target.user_ip, -1)
+
+
+@event.listens_for(TaskRun, 'after_delete')
+@deferred_in_bulk
+def delete_task_bitmaps(mapper, conn, target):
+    """Delete the task bitmaps of the project, which no longer match the
+    answers."""
+    from pybossa.cache import helpers
+    helpers.delete_task_bitmaps(target.app_id)
@@ -17,9 +17,9 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
 from sqlalchemy import Integer, Boolean, Unicode, Text, String, BigInteger
-from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.schema import Column, ForeignKey, Index
 from sqlalchemy.orm import relationship, backref
-from sqlalchemy import event
+from sqlalchemy import event, inspect
 from flask.ext.login import UserMixin
 
 from pybossa.core import db, signer
@@ -35,6 +35,7 @@ class User(db.Model, DomainObject, UserMixin):
     '''A registered user of the PyBossa system'''
 
     __tablename__ = 'user'
+    __table_args__ = (Index('user_info_idx', 'info', postgresql_using='gin'), )
 
     id = Column(Integer, primary_key=True)
     #: UTC timestamp of the user when it's created.
@@ -96,3 +97,29 @@ def add_event(mapper, conn, target):
     obj = target.dictize()
     obj['action_updated']='User'
     update_redis(obj)
+
+
+@event.listens_for(User, 'after_insert')
+def add_user_to_global_stats(mapper, conn, target):
+    """Count the new user in the global stats."""
+    from pybossa.cache.site_stats import incr_global_stats
+    incr_global_stats(n_users=1)
+
+
+@event.listens_for(User, 'after_delete')
+def remove_user_from_global_stats(mapper, conn, target):
+    """Remove the deleted user from the global stats."""
+    from pybossa.cache.site_stats import incr_global_stats
+    incr_global_stats(n_users=-1)
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def delete_cached_api_key(mapper, conn, target):
+    """Delete from cache the user of the old and the current API keys, so
+    the API sees the changes of the user and does not accept an old key."""
+    from pybossa.cache.users import delete_api_key
+    history = inspect(target).attrs.api_key.history
+    for api_key in set(list(history.deleted) + [target.api_key]):
+        if api_key is not None:
+            delete_api_key(api_key)
@@ -0,0 +1,124 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""Progress records for background jobs, stored as Redis hashes."""
+
+import time
+
+
+class JobProgress(object):
+
+    """
+    Progress of a background job.
+
+    Every record is a Redis hash with a state (queued, running, done or
+    failed), a set of counters and the timestamps of the last update.
+    Records expire after a week.
+
+    """
+
+    prefix = 'pybossa:progress'
+    expiration = 7 * 24 * 60 * 60
+    states = ('queued', 'running', 'done', 'failed')
+
+    def __init__(self, redis_conn, kind, identifier):
+        self.redis_conn = redis_conn
+        self.key = '%s:%s:%s' % (self.prefix, kind, identifier)
+
+    def start(self, state='running', **fields):
+        fields.update(state=state, started=time.time(), updated=time.time())
+        p = self.redis_conn.pipeline()
+        p.delete(self.key, self.key + ':steps')
+        p.hmset(self.key, fields)
+        p.expire(self.key, self.expiration)
+        p.execute()
+
+    def set(self, **fields):
+        fields['updated'] = time.time()
+        p = self.redis_conn.pipeline()
+        p.hmset(self.key, fields)
+        p.expire(self.key, self.expiration)
+        p.execute()
+
+    def incr(self, field, amount=1):
+        p = self.redis_conn.pipeline()
+        p.hincrby(self.key, field, amount)
+        p.hset(self.key, 'updated', time.time())
+        p.expire(self.key, self.expiration)
+        return p.execute()[0]
+
+    def finish(self, error=None, **fields):
+        if error is not None:
+            fields.update(state='failed', error=str(error))
+        else:
+            fields['state'] = 'done'
+        self.set(**fields)
+
+    def claim(self, field):
+        """Set the field only if it is not set yet. Returns True for the only
+        caller that sets it, so it can be used to run something once."""
+        return bool(self.redis_conn.hsetnx(self.key, field, time.time()))
+
+    def is_step_done(self, step):
+        return bool(self.redis_conn.sismember(self.key + ':steps', step))
+
+    def step_done(self, step):
+        """Mark a step of the job (e.g. a chunk) as done. Returns False if it
+        was already done."""
+        p = self.redis_conn.pipeline()
+        p.sadd(self.key + ':steps', step)
+        p.expire(self.key + ':steps', self.expiration)
+        return bool(p.execute()[0])
+
+    def get(self):
+        """Return the progress record as a dict, or None if it does not
+        exist. Numeric values are returned as numbers"""
+        record = self.redis_conn.hgetall(self.key)
+        if not record:
+            return None
+        return dict((k, self._to_number(v)) for k, v in record.iteritems())
+
+    def _to_number(self, value):
+        for cast in (int, float):
+            try:
+                return cast(value)
+            except ValueError:
+                pass
+        return value
+
+
+def track(redis_conn, kind, group, identifier):
+    """Add a job to the list of recent jobs of a group, e.g. a project."""
+    key = '%s:%s:recent:%s' % (JobProgress.prefix, kind, group)
+    p = redis_conn.pipeline()
+    p.zadd(key, time.time(), identifier)
+    p.expire(key, JobProgress.expiration)
+    p.execute()
+
+
+def recent(redis_conn, kind, group, n=5):
+    """Return the progress records of the last n jobs of a group that have
+    not expired, newest first. Every record includes its id."""
+    key = '%s:%s:recent:%s' % (JobProgress.prefix, kind, group)
+    records = []
+    for identifier in redis_conn.zrevrange(key, 0, n - 1):
+        record = JobProgress(redis_conn, kind, identifier).get()
+        if record is not None:
+            record['id'] = identifier
+            records.append(record)
+    return records
+
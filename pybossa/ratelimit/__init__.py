@@ -24,40 +24,105 @@ This module exports:
     * ratelimit decorator: for decorating the views
 
 """
+import math
 import time
 from functools import update_wrapper, wraps
 from flask import request, g
 from werkzeug.exceptions import TooManyRequests
-from pybossa.core import sentinel
+from pybossa.core import sentinel, ratelimits
 from pybossa.error import ErrorStatus
 
 error = ErrorStatus()
 
+# Lua script that checks and counts a request in a single round trip. The
+# number of requests of the previous window is weighted by the part of it that
+# still overlaps the sliding window, so bursts around the boundaries of the
+# fixed windows cannot double the limit. Rejected requests are not counted.
+SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local per = tonumber(ARGV[2])
+local elapsed = tonumber(ARGV[3])
+local current = tonumber(redis.call('GET', KEYS[1]) or 0)
+local previous = tonumber(redis.call('GET', KEYS[2]) or 0)
+local weighted = math.floor(previous * (per - elapsed) / per)
+if weighted + current < limit then
+    current = redis.call('INCR', KEYS[1])
+    redis.call('EXPIRE', KEYS[1], 2 * per + tonumber(ARGV[4]))
+end
+return {weighted, current, previous}
+"""
+
+_sliding_window = None
+
+# Clients over their limit, with the time until they are rejected without
+# asking Redis again. Every process keeps its own.
+blocked_clients = dict()
+MAX_BLOCKED_CLIENTS = 10000
+
+
+def _sliding_window_script():
+    global _sliding_window
+    if _sliding_window is None:
+        _sliding_window = sentinel.master.register_script(
+            SLIDING_WINDOW_SCRIPT)
+    return _sliding_window
+
+
+def _block(key, until):
+    if len(blocked_clients) >= MAX_BLOCKED_CLIENTS:
+        now = time.time()
+        for k, v in blocked_clients.items():
+            if v <= now:
+                del blocked_clients[k]
+        if len(blocked_clients) >= MAX_BLOCKED_CLIENTS:
+            blocked_clients.clear()
+    blocked_clients[key] = until
+
 
 class RateLimit(object):
 
     """
     Limit the number of requests.
 
-    It uses a Redis pipe from the master node (configured via Sentinel) to
-    limit the number of requests.
+    It runs a sliding window script on the master node (configured via
+    Sentinel), which checks and counts the request atomically. Clients over
+    the limit are rejected locally, without contacting Redis, until the
+    reset time.
 
     """
 
     expiration_window = 10
 
     def __init__(self, key_prefix, limit, per, send_x_headers):
-        self.reset = (int(time.time()) // per) * per + per
-        self.key = key_prefix + str(self.reset)
         self.limit = limit
         self.per = per
         self.send_x_headers = send_x_headers
-
-        p = sentinel.master.pipeline()
-        p.incr(self.key)
-        p.expireat(self.key, self.reset + self.expiration_window)
-
-        self.current = min(p.execute()[0], limit)
+        now = time.time()
+        blocked_until = blocked_clients.get(key_prefix)
+        if blocked_until > now:
+            self.current = limit
+            self.reset = int(math.ceil(blocked_until))
+            return
+
+        window = (int(now) // per) * per
+        elapsed = now - window
+        self.key = key_prefix + str(window)
+        previous_key = key_prefix + str(window - per)
+        weighted, current, previous = _sliding_window_script()(
+            keys=[self.key, previous_key],
+            args=[limit, per, repr(elapsed), self.expiration_window])
+
+        self.current = min(weighted + current, limit)
+        self.reset = window + per
+        if self.over_limit:
+            if current < limit and previous:
+                # The weight of the previous window decreases with time, so
+                # the client is allowed again before the end of this one.
+                retry_at = window + per - float(limit - current) * per / previous
+            else:
+                retry_at = window + per
+            self.reset = int(math.ceil(retry_at))
+            _block(key_prefix, retry_at)
 
     remaining = property(lambda x: x.limit - x.current)
     over_limit = property(lambda x: x.current >= x.limit)
@@ -68,6 +133,12 @@ def get_view_rate_limit():
     return getattr(g, '_view_rate_limit', None)
 
 
+def _request_api_key():
+    if 'Authorization' in request.headers:
+        return request.headers.get('Authorization')
+    return request.args.get('api_key')
+
+
 def ratelimit(limit, per, send_x_headers=True,
               scope_func=lambda: request.remote_addr,
               key_func=lambda: request.endpoint,
@@ -77,15 +148,25 @@ def ratelimit(limit, per, send_x_headers=True,
 
     Returns the function if within the limit, otherwise TooManyRequests error
 
+    Requests with an API key listed in RATE_LIMIT_API_KEYS are limited per API
+    key, with the (limit, per) quota configured for it.
+
     """
     def decorator(f):
         @wraps(f)
         def rate_limited(*args, **kwargs):
             try:
-                key = 'rate-limit/%s/%s/' % (key_func(), scope_func())
-                rlimit = RateLimit(key, limit, per, send_x_headers)
+                api_key = _request_api_key()
+                quota = ratelimits.get('API_KEYS', {}).get(api_key)
+                if api_key and quota:
+                    key_limit, key_per = quota
+                    scope = 'api-key:%s' % api_key
+                else:
+                    key_limit, key_per = limit, per
+                    scope = scope_func()
+                key = 'rate-limit/%s/%s/' % (key_func(), scope)
+                rlimit = RateLimit(key, key_limit, key_per, send_x_headers)
                 g._view_rate_limit = rlimit
-                #if over_limit is not None and rlimit.over_limit:
                 if rlimit.over_limit:
                     raise TooManyRequests
                 return f(*args, **kwargs)
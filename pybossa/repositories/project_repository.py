@@ -19,9 +19,11 @@ import json
 from flask import request
 from flask.ext.login import current_user
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only
 from sqlalchemy.orm.attributes import get_history
 from sqlalchemy import inspect
 
+from pybossa.model import bulk_operation
 from pybossa.model.app import App
 from pybossa.model.auditlog import Auditlog
 from pybossa.model.category import Category
@@ -39,6 +41,13 @@ class ProjectRepository(object):
     def get(self, id):
         return self.db.session.query(App).get(id)
 
+    def get_version(self, id):
+        """Return the updated timestamp, hidden flag and owner_id of a
+        project, without loading the whole project, or None"""
+        query = self.db.session.query(App.id, App.updated, App.hidden,
+                                      App.owner_id).filter(App.id == id)
+        return query.first()
+
     def get_by_shortname(self, short_name):
         return self.db.session.query(App).filter_by(short_name=short_name).first()
 
@@ -48,8 +57,15 @@ class ProjectRepository(object):
     def get_all(self):
         return self.db.session.query(App).all()
 
-    def filter_by(self, limit=None, offset=0, **filters):
+    def filter_by(self, limit=None, offset=0, last_id=None, fields=None,
+                  criterion=None, **filters):
         query = self.db.session.query(App).filter_by(**filters)
+        if last_id is not None:
+            query = query.filter(App.id > last_id)
+        if criterion is not None:
+            query = query.filter(criterion)
+        if fields:
+            query = query.options(load_only(*fields))
         query = query.order_by(App.id).limit(limit).offset(offset)
         return query.all()
 
@@ -75,8 +91,10 @@ class ProjectRepository(object):
     def delete(self, project):
         self._validate_can_be('deleted', project)
         app = self.db.session.query(App).filter(App.id==project.id).first()
-        self.db.session.delete(app)
-        self.db.session.commit()
+        # The tasks and task runs deleted in cascade update the project once
+        with bulk_operation():
+            self.db.session.delete(app)
+            self.db.session.commit()
 
     def add_log_entry(self, project, action, caller):
         try:
@@ -160,8 +178,15 @@ class ProjectRepository(object):
     def get_all_categories(self):
         return self.db.session.query(Category).all()
 
-    def filter_categories_by(self, limit=None, offset=0, **filters):
+    def filter_categories_by(self, limit=None, offset=0, last_id=None,
+                             fields=None, criterion=None, **filters):
         query = self.db.session.query(Category).filter_by(**filters)
+        if last_id is not None:
+            query = query.filter(Category.id > last_id)
+        if criterion is not None:
+            query = query.filter(criterion)
+        if fields:
+            query = query.options(load_only(*fields))
         query = query.order_by(Category.id).limit(limit).offset(offset)
         return query.all()
 
@@ -16,11 +16,15 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
-from sqlalchemy.sql import text
+from sqlalchemy.sql import func, select, case, text
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only
 
-from pybossa.model.task import Task
+from pybossa.model import bulk_operation
+from pybossa.model.task import Task, make_info_hash, add_event, update_app, \
+    delete_task_bitmaps
 from pybossa.model.task_run import TaskRun
+from pybossa.model.result import Result, add_answer
 from pybossa.exc import WrongObjectError, DBIntegrityError
 
 
@@ -39,16 +43,61 @@ class TaskRepository(object):
     def get_task_by(self, **attributes):
         return self.db.session.query(Task).filter_by(**attributes).first()
 
-    def filter_tasks_by(self, limit=None, offset=0, yielded=False, **filters):
+    def filter_tasks_by(self, limit=None, offset=0, yielded=False,
+                        last_id=None, fields=None, criterion=None,
+                        **filters):
         query = self.db.session.query(Task).filter_by(**filters)
+        if last_id is not None:
+            query = query.filter(Task.id > last_id)
+        if criterion is not None:
+            query = query.filter(criterion)
+        if fields:
+            query = query.options(load_only(*fields))
         query = query.order_by(Task.id).limit(limit).offset(offset)
         if yielded:
-            return query.yield_per(1)
+            return query.yield_per(100)
         return query.all()
 
     def count_tasks_with(self, **filters):
         return self.db.session.query(Task).filter_by(**filters).count()
 
+    def get_last_task_id(self, **filters):
+        query = self.db.session.query(func.max(Task.id)).filter_by(**filters)
+        return query.scalar()
+
+    def get_info_hashes(self, app_id, info_hashes):
+        """Return the set of the given info hashes that already belong to
+        tasks of the project"""
+        if not info_hashes:
+            return set()
+        query = self.db.session.query(Task.info_hash).filter(
+            Task.app_id == app_id, Task.info_hash.in_(info_hashes))
+        return set(row.info_hash for row in query)
+
+    def delete_tasks_batch(self, app_id, size=1000):
+        """Delete up to size tasks of a project, with their task runs and
+        results, bypassing the ORM. Returns the number of deleted tasks and
+        task runs, so it can be called until no task is deleted"""
+        query = self.db.session.query(Task.id).filter(
+            Task.app_id == app_id).order_by(Task.id).limit(size)
+        task_ids = [row.id for row in query]
+        if not task_ids:
+            return 0, 0
+        n_task_runs = self.db.session.execute(
+            TaskRun.__table__.delete().where(
+                TaskRun.task_id.in_(task_ids))).rowcount
+        self.db.session.execute(
+            Result.__table__.delete().where(Result.task_id.in_(task_ids)))
+        self.db.session.execute(
+            Task.__table__.delete().where(Task.id.in_(task_ids)))
+        conn, target = self.db.session.connection(), Task(app_id=app_id)
+        update_app(None, conn, target)
+        delete_task_bitmaps(None, conn, target)
+        self.db.session.commit()
+        from pybossa.cache.users import delete_user_progress
+        delete_user_progress(app_id)
+        return len(task_ids), n_task_runs
+
 
 
     # Methods for queries on TaskRun objects
@@ -58,16 +107,94 @@ class TaskRepository(object):
     def get_task_run_by(self, **attributes):
         return self.db.session.query(TaskRun).filter_by(**attributes).first()
 
-    def filter_task_runs_by(self, limit=None, offset=0, yielded=False, **filters):
+    def filter_task_runs_by(self, limit=None, offset=0, yielded=False,
+                            last_id=None, fields=None, criterion=None,
+                            **filters):
         query = self.db.session.query(TaskRun).filter_by(**filters)
+        if last_id is not None:
+            query = query.filter(TaskRun.id > last_id)
+        if criterion is not None:
+            query = query.filter(criterion)
+        if fields:
+            query = query.options(load_only(*fields))
         query = query.order_by(TaskRun.id).limit(limit).offset(offset)
         if yielded:
-            return query.yield_per(1)
+            return query.yield_per(100)
         return query.all()
 
     def count_task_runs_with(self, **filters):
         return self.db.session.query(TaskRun).filter_by(**filters).count()
 
+    def get_last_task_run_id(self, **filters):
+        query = self.db.session.query(func.max(TaskRun.id)).filter_by(**filters)
+        return query.scalar()
+
+
+
+    # Methods for queries on Result objects
+    def get_result(self, id):
+        return self.db.session.query(Result).get(id)
+
+    def get_result_by(self, **attributes):
+        return self.db.session.query(Result).filter_by(**attributes).first()
+
+    def filter_results_by(self, limit=None, offset=0, yielded=False,
+                          last_id=None, fields=None, criterion=None,
+                          **filters):
+        query = self.db.session.query(Result).filter_by(**filters)
+        if last_id is not None:
+            query = query.filter(Result.id > last_id)
+        if criterion is not None:
+            query = query.filter(criterion)
+        if fields:
+            query = query.options(load_only(*fields))
+        query = query.order_by(Result.id).limit(limit).offset(offset)
+        if yielded:
+            return query.yield_per(100)
+        return query.all()
+
+    def rebuild_results_batch(self, app_id, keys, last_task_id=0, size=1000):
+        """Rebuild from their task runs the results of up to size tasks of a
+        project, the ones that follow last_task_id, counting the given keys
+        of the answers. Returns the id of the last task of the batch and the
+        number of tasks, so it can be called until no task is rebuilt"""
+        query = self.db.session.query(Task.id).filter(
+            Task.app_id == app_id, Task.id > last_task_id).order_by(
+            Task.id).limit(size)
+        task_ids = [row.id for row in query]
+        if not task_ids:
+            return last_task_id, 0
+        # Serialize with the answers being added to the same tasks
+        self.db.session.execute(
+            text('''SELECT pg_advisory_xact_lock(id) FROM task
+                    WHERE id = ANY(:task_ids) ORDER BY id'''),
+            dict(task_ids=task_ids))
+        self.db.session.execute(
+            Result.__table__.delete().where(Result.task_id.in_(task_ids)))
+        results = {}
+        if keys:
+            task_runs = self.db.session.execute(
+                select([TaskRun.task_id, TaskRun.info]).where(
+                    TaskRun.task_id.in_(task_ids)))
+            for row in task_runs:
+                result = results.setdefault(
+                    row.task_id, dict(app_id=app_id, task_id=row.task_id,
+                                      n_answers=0, info={}))
+                result['n_answers'] += 1
+                add_answer(result['info'], row.info, keys)
+        if results:
+            self.db.session.execute(Result.__table__.insert(),
+                                    results.values())
+        self.db.session.commit()
+        return task_ids[-1], len(task_ids)
+
+    def count_results_with(self, **filters):
+        return self.db.session.query(Result).filter_by(**filters).count()
+
+    def get_last_result_id(self, **filters):
+        query = self.db.session.query(func.max(Result.id)).filter_by(**filters)
+        return query.scalar()
+
 
 
     # Methods for saving, deleting and updating both Task and TaskRun objects
@@ -93,39 +220,151 @@ class TaskRepository(object):
         self._validate_can_be('deleted', element)
         table = element.__class__
         inst = self.db.session.query(table).filter(table.id==element.id).first()
-        self.db.session.delete(inst)
-        self.db.session.commit()
+        # The task runs deleted in cascade update the project once
+        with bulk_operation():
+            self.db.session.delete(inst)
+            self.db.session.commit()
 
     def delete_all(self, elements):
-        for element in elements:
-            self._validate_can_be('deleted', element)
-            table = element.__class__
-            inst = self.db.session.query(table).filter(table.id==element.id).first()
-            self.db.session.delete(inst)
-        self.db.session.commit()
+        with bulk_operation():
+            for element in elements:
+                self._validate_can_be('deleted', element)
+                table = element.__class__
+                inst = self.db.session.query(table).filter(table.id==element.id).first()
+                self.db.session.delete(inst)
+            self.db.session.commit()
 
-    def update_tasks_redundancy(self, project, n_answer):
-        """update the n_answer of every task from a project and their state.
-        Use raw SQL for performance"""
-        sql = text('''
-                   UPDATE task SET n_answers=:n_answers,
-                   state='ongoing' WHERE app_id=:app_id''')
-        self.db.session.execute(sql, dict(n_answers=n_answer, app_id=project.id))
-        # Update task.state according to their new n_answers value
-        sql = text('''
-                   WITH project_tasks AS (
-                   SELECT task.id, task.n_answers,
-                   COUNT(task_run.id) AS n_task_runs, task.state
-                   FROM task, task_run
-                   WHERE task_run.task_id=task.id AND task.app_id=:app_id
-                   GROUP BY task.id)
-                   UPDATE task SET state='completed'
-                   FROM project_tasks
-                   WHERE (project_tasks.n_task_runs >=:n_answers)
-                   and project_tasks.id=task.id
-                   ''')
-        self.db.session.execute(sql, dict(n_answers=n_answer, app_id=project.id))
-        self.db.session.commit()
+    def insert_tasks(self, app_id, tasks_data, commit=True):
+        """Insert the tasks (a list of dicts with the Task attributes) of a
+        project in bulk, bypassing the ORM. Returns the number of inserted
+        tasks. With commit=False the caller commits them, e.g. to insert many
+        batches in a single transaction"""
+        if not tasks_data:
+            return 0
+        # All the rows of an executemany need the same columns
+        rows_by_columns = {}
+        for task_data in tasks_data:
+            row = dict(task_data, app_id=app_id)
+            row.setdefault('info', {})
+            row.setdefault('info_hash', make_info_hash(row['info']))
+            rows_by_columns.setdefault(tuple(sorted(row)), []).append(row)
+        try:
+            for rows in rows_by_columns.values():
+                self.db.session.execute(Task.__table__.insert(), rows)
+            # ORM events are not fired by bulk inserts, so the feed and the
+            # project timestamp are updated once for all the tasks (or once
+            # for the whole bulk_operation, if there is one)
+            conn = self.db.session.connection()
+            target = Task(app_id=app_id)
+            add_event(None, conn, target)
+            update_app(None, conn, target)
+            delete_task_bitmaps(None, conn, target)
+            if commit:
+                self.db.session.commit()
+        except IntegrityError as e:
+            self.db.session.rollback()
+            raise DBIntegrityError(e)
+        from pybossa.cache.site_stats import incr_global_stats
+        n_answers = Task.__table__.c.n_answers.default.arg
+        incr_global_stats(n_pending_tasks=sum(
+            task_data.get('n_answers', n_answers) or 0
+            for task_data in tasks_data))
+        return len(tasks_data)
+
+    def insert_tasks_returning_ids(self, app_id, tasks_data, commit=True):
+        """Insert the tasks of a project in bulk, like insert_tasks, and
+        return their ids in the same order. The ids are taken from the
+        sequence of the table with a single query before the insert"""
+        if not tasks_data:
+            return []
+        query = select([func.nextval('task_id_seq')]).select_from(
+            func.generate_series(1, len(tasks_data)).alias())
+        ids = [row[0] for row in self.db.session.execute(query)]
+        self.insert_tasks(app_id, [dict(task_data, id=id) for task_data, id
+                                   in zip(tasks_data, ids)], commit)
+        return ids
+
+    def update_tasks(self, project, values, task_ids=None, chunk_size=1000,
+                     **filters):
+        """Set the given values (priority_0, n_answers and/or state) of the
+        project tasks with the given ids or, if there are no ids, of the
+        project tasks that match the filters. The tasks are updated with an
+        UPDATE statement per chunk of chunk_size tasks. Returns the number of
+        updated tasks"""
+        self._validate_task_values(values)
+        chunks = self._task_id_chunks(project.id, task_ids, chunk_size,
+                                      **filters)
+        return self._update_task_chunks(project.id, values, chunks)
+
+    def update_tasks_redundancy(self, project, n_answer, chunk_size=1000,
+                                progress=None):
+        """Update the n_answers of every task of a project and their state,
+        in chunks of chunk_size tasks. If given, progress is called with the
+        number of tasks updated by every chunk. Returns the number of updated
+        tasks"""
+        chunks = self._task_id_chunks(project.id, None, chunk_size)
+        return self._update_task_chunks(project.id, dict(n_answers=n_answer),
+                                        chunks, progress)
+
+    def _update_task_chunks(self, app_id, values, chunks, progress=None):
+        """Update the tasks in every chunk of ids with a statement and a
+        transaction of its own, so the rows are locked for a short time"""
+        new_values = dict(values)
+        # The state of the tasks depends on their redundancy
+        if 'n_answers' in values and 'state' not in values:
+            n_task_runs = select([func.count(TaskRun.id)]).where(
+                TaskRun.task_id == Task.id).as_scalar()
+            new_values['state'] = case(
+                [(n_task_runs >= values['n_answers'], 'completed')],
+                else_='ongoing')
+        n = 0
+        for ids in chunks:
+            update = Task.__table__.update().where(
+                Task.app_id == app_id).where(Task.id.in_(ids))
+            updated = self.db.session.execute(
+                update.values(**new_values)).rowcount
+            conn, target = self.db.session.connection(), Task(app_id=app_id)
+            update_app(None, conn, target)
+            delete_task_bitmaps(None, conn, target)
+            self.db.session.commit()
+            n += updated
+            if progress is not None:
+                progress(updated)
+        return n
+
+    def _task_id_chunks(self, app_id, task_ids, chunk_size, **filters):
+        if task_ids is not None:
+            task_ids = sorted(set(task_ids))
+            for i in range(0, len(task_ids), chunk_size):
+                yield task_ids[i:i + chunk_size]
+            return
+        last_id = 0
+        while True:
+            query = self.db.session.query(Task.id).filter_by(
+                app_id=app_id, **filters).filter(Task.id > last_id)
+            ids = [row.id for row in
+                   query.order_by(Task.id).limit(chunk_size)]
+            if not ids:
+                return
+            yield ids
+            last_id = ids[-1]
+
+    def _validate_task_values(self, values):
+        allowed = set(['priority_0', 'n_answers', 'state'])
+        if not values or not set(values) <= allowed:
+            msg = 'Only %s can be updated' % ', '.join(sorted(allowed))
+            raise ValueError(msg)
+        if values.get('state', 'ongoing') not in ('ongoing', 'completed'):
+            raise ValueError('state must be ongoing or completed')
+        # The values are checked before the first chunk is updated
+        priority_0 = values.get('priority_0', 0)
+        if (not isinstance(priority_0, (int, long, float)) or
+                isinstance(priority_0, bool)):
+            raise ValueError('priority_0 must be a number')
+        n_answers = values.get('n_answers', 1)
+        if (not isinstance(n_answers, (int, long)) or
+                isinstance(n_answers, bool) or n_answers < 1):
+            raise ValueError('n_answers must be a positive integer')
 
 
     def _validate_can_be(self, action, element):
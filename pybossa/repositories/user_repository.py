@@ -18,6 +18,7 @@
 
 from sqlalchemy import or_, func
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only
 
 from pybossa.model.user import User
 from pybossa.exc import WrongObjectError, DBIntegrityError
@@ -43,8 +44,15 @@ class UserRepository(object):
     def get_all(self):
         return self.db.session.query(User).all()
 
-    def filter_by(self, limit=None, offset=0, **filters):
+    def filter_by(self, limit=None, offset=0, last_id=None, fields=None,
+                  criterion=None, **filters):
         query = self.db.session.query(User).filter_by(**filters)
+        if last_id is not None:
+            query = query.filter(User.id > last_id)
+        if criterion is not None:
+            query = query.filter(criterion)
+        if fields:
+            query = query.options(load_only(*fields))
         query = query.order_by(User.id).limit(limit).offset(offset)
         return query.all()
 
@@ -16,11 +16,12 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
-from datetime import timedelta
+from datetime import datetime, timedelta
 from functools import update_wrapper
 import csv
 import codecs
 import cStringIO
+import hashlib
 from flask import abort, request, make_response, current_app
 from functools import wraps
 from flask_oauth import OAuth
@@ -356,3 +357,89 @@ def with_cache_disabled(f):
             os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = env_cache_disabled
         return return_value
     return wrapper
+
+
+def get_fields_from_request(arg='fields'):
+    """Return the list of fields requested via a comma separated list in the
+    request args (e.g. ?fields=id,task_id,info.answer), or None"""
+    fields = request.args.get(arg)
+    if not fields:
+        return None
+    return [f.strip() for f in fields.split(',') if f.strip() != '']
+
+
+def project_fields(item, fields=None):
+    """Return a dict with only the specified fields of the given dict. Keys
+    within the info field can be selected with the info.<key> notation.
+    If no fields are specified, the item is returned untouched"""
+    if not fields:
+        return item
+    projected = {}
+    for field in fields:
+        if field.startswith('info.'):
+            key = field[len('info.'):]
+            info = item.get('info')
+            if isinstance(info, dict) and key in info:
+                projected.setdefault('info', {})[key] = info[key]
+        elif field in item:
+            projected[field] = item[field]
+    return projected
+
+
+def make_etag(*parts):
+    """Return an ETag for the version of a resource identified by the given
+    parts, e.g. its type, its id and its updated timestamp"""
+    key = u':'.join(unicode(part) for part in parts)
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def timestamp_to_datetime(timestamp):
+    """Return the datetime of a timestamp made by make_timestamp (with or
+    without microseconds), or None"""
+    if not timestamp:
+        return None
+    return datetime.strptime(timestamp[:19], '%Y-%m-%dT%H:%M:%S')
+
+
+def not_modified(etag, last_modified=None):
+    """Return True if the client already has the version of a resource
+    identified by the etag (and the last_modified datetime), so a 304 can be
+    returned without building the resource. JSONP requests are never
+    answered with a 304, as the callback drops the cache headers"""
+    if request.args.get('callback'):
+        return False
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified is not None and request.if_modified_since:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def add_cache_headers(response, etag, last_modified=None, private=False,
+                      max_age=None):
+    """Add the ETag, Last-Modified and Cache-Control headers to a response.
+    Public responses can be kept by a front proxy for max_age seconds
+    (HTTP_CACHE_MAX_AGE by default), private ones have to be revalidated
+    by the client every time"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    if private:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    else:
+        if max_age is None:
+            max_age = current_app.config.get('HTTP_CACHE_MAX_AGE', 0)
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    return response
+
+
+def conditional_response(etag, last_modified=None, private=False,
+                         max_age=None):
+    """Return a 304 Not Modified response with the cache headers if the
+    client already has the resource, or None"""
+    if not not_modified(etag, last_modified):
+        return None
+    response = current_app.response_class(status=304)
+    return add_cache_headers(response, etag, last_modified, private, max_age)
@@ -300,6 +300,10 @@ def _show_own_profile(user):
     user.score = rank_and_score['score']
     user.total = cached_users.get_total_users()
     apps_contributed = cached_users.apps_contributed_cached(user.id)
+    progress = cached_users.user_progress(
+        [app['id'] for app in apps_contributed], user_id=user.id)
+    for app in apps_contributed:
+        app['user_progress'] = progress[app['id']]
     apps_published, apps_draft = _get_user_apps(user.id)
     apps_published.extend(cached_users.hidden_apps(user.id))
 
@@ -20,11 +20,12 @@ import time
 import re
 import json
 import math
-import requests
 from StringIO import StringIO
+from itertools import takewhile, islice
 
 from flask import Blueprint, request, url_for, flash, redirect, abort, Response, current_app
 from flask import render_template, make_response
+from werkzeug.datastructures import CombinedMultiDict
 from flask.ext.login import login_required, current_user
 from flask.ext.babel import gettext
 from rq import Queue
@@ -36,18 +37,25 @@ import pybossa.importers as importers
 from pybossa.core import uploader, signer, sentinel
 from pybossa.model.app import App
 from pybossa.model.task import Task
-from pybossa.model.auditlog import Auditlog
+from pybossa.model.result import Result
+from pybossa.model.auditlog import Auditlog, tasks_update_log
 from pybossa.util import Pagination, UnicodeWriter, admin_required, get_user_id_or_ip
+from pybossa.util import get_fields_from_request, project_fields
 from pybossa.auth import require
 from pybossa.cache import apps as cached_apps
 from pybossa.cache import categories as cached_cat
 from pybossa.cache import project_stats as stats
 from pybossa.cache.helpers import add_custom_contrib_button_to
-from pybossa.ckan import Ckan
+from pybossa.progress import JobProgress, track as track_job, recent as recent_jobs
 from pybossa.extensions import misaka
 from pybossa.cookies import CookieHandler
 from pybossa.password_manager import ProjectPasswdManager
 from pybossa.jobs import import_tasks as background_import
+from pybossa.jobs import export_to_ckan as background_export_to_ckan
+from pybossa.jobs import delete_tasks as background_delete_tasks
+from pybossa.jobs import update_tasks_redundancy as \
+    background_update_tasks_redundancy
+from pybossa.jobs import HOUR
 from pybossa.forms.applications_view_forms import *
 
 from pybossa.core import project_repo, user_repo, task_repo, blog_repo, \
@@ -57,7 +65,10 @@ from pybossa.core import project_repo, user_repo, task_repo, blog_repo, \
 blueprint = Blueprint('app', __name__)
 
 importer_queue = Queue('importer', connection=sentinel.master)
+exporter_queue = Queue('exporter', connection=sentinel.master)
 MAX_NUM_SYNCHR_TASKS_IMPORT = 200
+MAX_NUM_SYNCHR_TASKS_DELETE = 1000
+MAX_NUM_SYNCHR_TASKS_UPDATE = 1000
 
 def app_title(app, page_name):
     if not app:  # pragma: no cover
@@ -557,7 +568,8 @@ def import_task(short_name):
 
     template = template if request.method == 'GET' else request.form['form_name']
     importer = importers.create_importer_for(template)
-    form = GenericBulkTaskImportForm()(template, request.form)
+    form = GenericBulkTaskImportForm()(
+        template, CombinedMultiDict([request.form, request.files]))
     template_args['form'] = form
     if template == 'gdocs' and request.args.get('mode'):  # pragma: no cover
         mode = request.args.get('mode')
@@ -578,12 +590,26 @@ def import_task(short_name):
 
 
 def _import_tasks(app, importer, form):
-    tasks_data = [data for data in importer.tasks(form)]
+    # Only read enough rows to know if the import has to be done in the
+    # background, where the whole source is read again
+    import_data = form.get_import_data()
+    try:
+        tasks_data = list(islice(importer.tasks(**import_data),
+                                 MAX_NUM_SYNCHR_TASKS_IMPORT + 1))
+    except Exception:
+        importer.cleanup(**import_data)
+        raise
     if len(tasks_data) <= MAX_NUM_SYNCHR_TASKS_IMPORT:
+        importer.cleanup(**import_data)
         msg = importers.create_tasks(task_repo, tasks_data, app.id)
         flash(msg)
     else:
-        importer_queue.enqueue(background_import, tasks_data, app.id)
+        import_id = model.make_uuid()
+        JobProgress(sentinel.master, 'import', import_id).start(
+            state='queued', app_id=app.id)
+        track_job(sentinel.master, 'import', 'app:%s' % app.id, import_id)
+        importer_queue.enqueue(background_import, app.id, import_id=import_id,
+                               timeout=HOUR, **import_data)
         flash(gettext("You're trying to import a large amount of tasks, so please be patient.\
             You will receive an email when the tasks are ready."))
     return redirect(url_for('.tasks', short_name=app.short_name))
@@ -744,6 +770,10 @@ def tasks(short_name):
     redirect_to_password = _check_if_redirect_to_password(app)
     if redirect_to_password:
         return redirect_to_password
+    imports = []
+    if current_user.is_authenticated() and (current_user.admin or
+                                            current_user.id == app.owner_id):
+        imports = recent_jobs(sentinel.master, 'import', 'app:%s' % app.id)
     app = add_custom_contrib_button_to(app, get_user_id_or_ip())
 
     return render_template('/applications/tasks.html',
@@ -753,6 +783,7 @@ def tasks(short_name):
                            n_tasks=n_tasks,
                            overall_progress=overall_progress,
                            last_activity=last_activity,
+                           imports=imports,
                            n_completed_tasks=cached_apps.n_completed_tasks(app.get('id')),
                            n_volunteers=cached_apps.n_volunteers(app.get('id')))
 
@@ -818,14 +849,18 @@ def delete_tasks(short_name):
                                last_activity=last_activity,
                                title=title)
     else:
-        tasks = task_repo.filter_tasks_by(app_id=app.id)
-        task_repo.delete_all(tasks)
-        msg = gettext("All the tasks and associated task runs have been deleted")
-        flash(msg, 'success')
-        cached_apps.delete_last_activity(app.id)
-        cached_apps.delete_n_tasks(app.id)
-        cached_apps.delete_n_task_runs(app.id)
-        cached_apps.delete_overall_progress(app.id)
+        if n_tasks <= MAX_NUM_SYNCHR_TASKS_DELETE:
+            background_delete_tasks(app.id)
+            msg = gettext("All the tasks and associated task runs have been deleted")
+            flash(msg, 'success')
+        else:
+            JobProgress(sentinel.master, 'delete_tasks', app.id).start(
+                state='queued', app_id=app.id)
+            importer_queue.enqueue(background_delete_tasks, app.id,
+                                   timeout=HOUR)
+            msg = gettext("The tasks and associated task runs are being "
+                          "deleted, this may take a while")
+            flash(msg, 'info')
         return redirect(url_for('.tasks', short_name=app.short_name))
 
 
@@ -858,17 +893,44 @@ def export_to(short_name):
                                overall_progress=overall_progress)
 
 
-    def gen_json(table):
-        n = getattr(task_repo, 'count_%ss_with' % table)(app_id=app.id)
-        sep = ", "
+    def gen_rows(table, since=None, cursor=None):
+        """Yield the rows of the table with since < id <= cursor, ordered by
+        id. Rows inserted after the cursor was taken are left for the next
+        pull"""
+        rows = getattr(task_repo, 'filter_%ss_by' % table)(app_id=app.id,
+                                                           last_id=since,
+                                                           yielded=True)
+        if cursor is None:
+            return rows
+        return takewhile(lambda row: row.id <= cursor, rows)
+
+    def gen_json(table, since=None, cursor=None):
+        sep = ""
         yield "["
-        for i, tr in enumerate(getattr(task_repo, 'filter_%ss_by' % table)(app_id=app.id, yielded=True), 1):
-            item = json.dumps(tr.dictize())
-            if (i == n):
-                sep = ""
-            yield item + sep
+        for tr in gen_rows(table, since, cursor):
+            yield sep + json.dumps(tr.dictize())
+            sep = ", "
         yield "]"
 
+    def gen_ndjson(table, fields=None, since=None, cursor=None):
+        for tr in gen_rows(table, since, cursor):
+            yield json.dumps(project_fields(tr.dictize(), fields)) + "\n"
+
+    def get_since():
+        since = request.args.get('since')
+        try:
+            return int(since) if since is not None else None
+        except ValueError:
+            return abort(404)
+
+    def get_cursor(table):
+        return getattr(task_repo, 'get_last_%s_id' % table)(app_id=app.id)
+
+    def add_cursor_header(res, since, cursor):
+        next_cursor = cursor if cursor is not None else since
+        res.headers['X-Next-Cursor'] = str(next_cursor or 0)
+        return res
+
     def format_csv_properly(row, ty=None):
         tmp = row.keys()
         task_keys = []
@@ -908,88 +970,55 @@ def export_to(short_name):
     def handle_task_run(writer, t):
         writer.writerow(format_csv_properly(t.dictize(), ty='taskrun'))
 
-    def get_csv(out, writer, table, handle_row):
-        for tr in getattr(task_repo, 'filter_%ss_by' % table)(app_id=app.id,
-                                                              yielded=True):
+    def handle_result(writer, t):
+        writer.writerow(format_csv_properly(t.dictize(), ty='result'))
+
+    def get_csv(out, writer, table, handle_row, since=None, cursor=None):
+        for tr in gen_rows(table, since, cursor):
             handle_row(writer, tr)
         yield out.getvalue()
 
     def respond_json(ty):
-        if ty not in ['task', 'task_run']:
+        if ty not in ['task', 'task_run', 'result']:
             return abort(404)
+        since = get_since()
+        cursor = get_cursor(ty)
         name = app.short_name.encode('utf-8', 'ignore').decode('latin-1')
         tmp = 'attachment; filename=%s_%s.json' % (name, ty)
-        res = Response(gen_json(ty), mimetype='application/json')
+        res = Response(gen_json(ty, since=since, cursor=cursor),
+                       mimetype='application/json')
         res.headers['Content-Disposition'] = tmp
-        return res
+        return add_cursor_header(res, since, cursor)
 
-    def create_ckan_datastore(ckan, table, package_id):
-        new_resource = ckan.resource_create(name=table,
-                                            package_id=package_id)
-        ckan.datastore_create(name=table,
-                              resource_id=new_resource['result']['id'])
-        ckan.datastore_upsert(name=table,
-                              records=gen_json(table),
-                              resource_id=new_resource['result']['id'])
+    def respond_ndjson(ty):
+        if ty not in ['task', 'task_run', 'result']:
+            return abort(404)
+        since = get_since()
+        cursor = get_cursor(ty)
+        fields = get_fields_from_request()
+        name = app.short_name.encode('utf-8', 'ignore').decode('latin-1')
+        tmp = 'attachment; filename=%s_%s.ndjson' % (name, ty)
+        res = Response(gen_ndjson(ty, fields=fields, since=since,
+                                  cursor=cursor),
+                       mimetype='application/x-ndjson')
+        res.headers['Content-Disposition'] = tmp
+        return add_cursor_header(res, since, cursor)
 
     def respond_ckan(ty):
-        # First check if there is a package (dataset) in CKAN
-        msg_1 = gettext("Data exported to ")
-        msg = msg_1 + "%s ..." % current_app.config['CKAN_URL']
-        ckan = Ckan(url=current_app.config['CKAN_URL'],
-                    api_key=current_user.ckan_api)
+        # The upload to CKAN runs in the background; the owner is notified
+        # by email once the data is in the datastore
+        if ty not in ['task', 'task_run']:
+            return abort(404)
         app_url = url_for('.details', short_name=app.short_name, _external=True)
-
-        try:
-            package, e = ckan.package_exists(name=app.short_name)
-            if e:
-                raise e
-            if package:
-                # Update the package
-                owner = user_repo.get(app.owner_id)
-                package = ckan.package_update(app=app, user=owner, url=app_url,
-                                              resources=package['resources'])
-
-                ckan.package = package
-                resource_found = False
-                for r in package['resources']:
-                    if r['name'] == ty:
-                        ckan.datastore_delete(name=ty, resource_id=r['id'])
-                        ckan.datastore_create(name=ty, resource_id=r['id'])
-                        ckan.datastore_upsert(name=ty,
-                                              records=gen_json(ty),
-                                              resource_id=r['id'])
-                        resource_found = True
-                        break
-                if not resource_found:
-                    create_ckan_datastore(ckan, ty, package['id'])
-            else:
-                owner = user_repo.get(app.owner_id)
-                package = ckan.package_create(app=app, user=owner, url=app_url)
-                create_ckan_datastore(ckan, ty, package['id'])
-                #new_resource = ckan.resource_create(name=ty,
-                #                                    package_id=package['id'])
-                #ckan.datastore_create(name=ty,
-                #                      resource_id=new_resource['result']['id'])
-                #ckan.datastore_upsert(name=ty,
-                #                     records=gen_json(ty),
-                #                     resource_id=new_resource['result']['id'])
-            flash(msg, 'success')
-            return respond()
-        except requests.exceptions.ConnectionError:
-                msg = "CKAN server seems to be down, try again layer or contact the CKAN admins"
-                current_app.logger.error(msg)
-                flash(msg, 'danger')
-        except Exception as inst:
-            if len(inst.args) == 3:
-                t, msg, status_code = inst.args
-                msg = ("Error: %s with status code: %s" % (t, status_code))
-            else: # pragma: no cover
-                msg = ("Error: %s" % inst.args[0])
-            current_app.logger.error(msg)
-            flash(msg, 'danger')
-        finally:
-            return respond()
+        progress = JobProgress(sentinel.master, 'ckan_export',
+                               '%s:%s' % (app.id, ty))
+        progress.start(state='queued', app_id=app.id, type=ty, exported=0)
+        exporter_queue.enqueue(background_export_to_ckan, app.id, ty,
+                               current_user.id, app_url, timeout=HOUR)
+        msg_1 = gettext("Exporting data to ")
+        msg_2 = gettext(". You will receive an email when it is done.")
+        flash(msg_1 + current_app.config['CKAN_URL'] + msg_2, 'success')
+        return respond()
 
     def respond_csv(ty):
         # Export Task(/Runs) to CSV
@@ -1005,15 +1034,29 @@ def export_to(short_name):
                 (lambda x: True),
                 gettext(
                     "Oops, there are no Task Runs yet to export, invite \
-                     some users to participate"))}
+                     some users to participate")),
+            "result": (
+                Result, handle_result,
+                (lambda x: True),
+                gettext(
+                    "Oops, there are no results yet to export, set the \
+                     result_keys of the project and get some answers"))}
         try:
             table, handle_row, test, msg = types[ty]
         except KeyError:
             return abort(404)
 
+        since = get_since()
+        cursor = get_cursor(ty)
         out = StringIO()
         writer = UnicodeWriter(out)
-        t = getattr(task_repo, 'get_%s_by' % ty)(app_id=app.id)
+        first = getattr(task_repo, 'filter_%ss_by' % ty)(app_id=app.id,
+                                                         last_id=since,
+                                                         limit=1)
+        t = first[0] if first else None
+        if t is None and since is not None:
+            res = Response('', mimetype='text/csv')
+            return add_cursor_header(res, since, cursor)
         if t is not None:
             if test(t):
                 tmp = t.dictize().keys()
@@ -1032,17 +1075,17 @@ def export_to(short_name):
                 keys = task_keys + task_info_keys
                 writer.writerow(sorted(keys))
 
-            res = Response(get_csv(out, writer, ty, handle_row),
+            res = Response(get_csv(out, writer, ty, handle_row, since, cursor),
                            mimetype='text/csv')
             name = app.short_name.encode('utf-8', 'ignore').decode('latin-1')
             tmp = 'attachment; filename=%s_%s.csv' % (name, ty)
             res.headers['Content-Disposition'] = tmp
-            return res
+            return add_cursor_header(res, since, cursor)
         else:
             flash(msg, 'info')
             return respond()
 
-    export_formats = ["json", "csv"]
+    export_formats = ["json", "ndjson", "csv"]
     if current_user.is_authenticated():
         if current_user.ckan_api:
             export_formats.append('ckan')
@@ -1066,7 +1109,8 @@ def export_to(short_name):
                                overall_progress=overall_progress)
     if fmt not in export_formats:
         abort(415)
-    return {"json": respond_json, "csv": respond_csv, 'ckan': respond_ckan}[fmt](ty)
+    return {"json": respond_json, "ndjson": respond_ndjson,
+            "csv": respond_csv, 'ckan': respond_ckan}[fmt](ty)
 
 
 @blueprint.route('/<short_name>/stats')
@@ -1167,9 +1211,16 @@ def task_n_answers(short_name):
                                app=app,
                                owner=owner)
     elif request.method == 'POST' and form.validate():
-        task_repo.update_tasks_redundancy(app, form.n_answers.data)
-        msg = ("User %s updated task redundancy to: %s" %
-               (current_user.name, form.n_answers.data))
+        if n_tasks <= MAX_NUM_SYNCHR_TASKS_UPDATE:
+            background_update_tasks_redundancy(app.id, form.n_answers.data)
+            msg = gettext('Redundancy of Tasks updated!')
+        else:
+            JobProgress(sentinel.master, 'redundancy', app.id).start(
+                state='queued', app_id=app.id)
+            importer_queue.enqueue(background_update_tasks_redundancy, app.id,
+                                   form.n_answers.data, timeout=HOUR)
+            msg = gettext('The redundancy of the tasks is being updated, '
+                          'this may take a while')
         # Log it
         log = Auditlog(
             app_id=app.id,
@@ -1182,8 +1233,6 @@ def task_n_answers(short_name):
             old_value=30,
             new_value=form.n_answers.data)
         auditlog_repo.save(log)
-
-        msg = gettext('Redundancy of Tasks updated!')
         flash(msg, 'success')
         return redirect(url_for('.tasks', short_name=app.short_name))
     else:
@@ -1274,40 +1323,16 @@ def task_priority(short_name):
     if request.method == 'GET':
         return respond()
     if request.method == 'POST' and form.validate():
-        for task_id in form.task_ids.data.split(","):
-            if task_id != '':
-                t = task_repo.get_task_by(app_id=app.id, id=int(task_id))
-                if t:
-                    old_priority = t.priority_0
-                    t.priority_0 = form.priority_0.data
-                    task_repo.update(t)
-
-                    if old_priority != t.priority_0:
-                        msg = ("User %s updated task priority for task ID: %s"
-                               " from: %s to: %s" % (current_user.name,
-                                                    t.id,
-                                                    old_priority,
-                                                    t.priority_0))
-                        old_value = json.dumps({'task_id': t.id,
-                                                'task_priority_0': old_priority})
-
-                        new_value = json.dumps({'task_id': t.id,
-                                                'task_priority_0': t.priority_0})
-
-
-                        log = Auditlog(
-                            app_id=app.id,
-                            app_short_name=app.short_name,
-                            user_id=current_user.id,
-                            user_name=current_user.name,
-                            action='update',
-                            caller='web',
-                            old_value=old_value,
-                            new_value=new_value,
-                            attribute='task.priority_0')
-                        auditlog_repo.save(log)
-                else:  # pragma: no cover
-                    flash(gettext(("Ooops, Task.id=%s does not belong to the app" % task_id)), 'danger')
+        task_ids = [int(task_id) for task_id in form.task_ids.data.split(",")
+                    if task_id != '']
+        # The form returns a Decimal, which cannot be stored as JSON
+        values = dict(priority_0=float(form.priority_0.data))
+        n = task_repo.update_tasks(app, values, task_ids=task_ids)
+        auditlog_repo.save(tasks_update_log(app, current_user, values, n,
+                                            'web', task_ids=task_ids))
+        if n < len(set(task_ids)):  # pragma: no cover
+            flash(gettext("Ooops, some of the tasks do not belong to the app"),
+                  'danger')
         cached_apps.delete_app(app.short_name)
         flash(gettext("Task priority has been changed"), 'success')
         return respond()
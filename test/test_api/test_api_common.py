@@ -74,6 +74,100 @@ class TestApiCommon(TestAPI):
         assert data[0].get('name') == 'user11', data
 
 
+    @with_context
+    def test_keyset_pagination(self):
+        """Test API GET with last_id returns the items after it, and a link
+        to the next page when the page is full"""
+        tasks = TaskFactory.create_batch(5)
+
+        res = self.app.get('/api/task?limit=2&last_id=%s' % tasks[0].id)
+        data = json.loads(res.data)
+        assert [t['id'] for t in data] == [tasks[1].id, tasks[2].id], data
+        link = res.headers['Link']
+        assert link.startswith('<http://localhost/api/task?'), link
+        assert link.endswith('>; rel="next"'), link
+        assert 'last_id=%s' % tasks[2].id in link, link
+        assert 'limit=2' in link, link
+
+        next_url = link[1:link.index('>')]
+        res = self.app.get(next_url)
+        data = json.loads(res.data)
+        assert [t['id'] for t in data] == [tasks[3].id, tasks[4].id], data
+
+        res = self.app.get('/api/task?limit=2&last_id=%s' % tasks[3].id)
+        data = json.loads(res.data)
+        assert [t['id'] for t in data] == [tasks[4].id], data
+        assert 'Link' not in res.headers, res.headers
+
+    @with_context
+    def test_keyset_pagination_link_has_no_api_key(self):
+        """Test API GET does not put the API key in the next page link"""
+        user = UserFactory.create()
+        TaskFactory.create_batch(3)
+
+        res = self.app.get('/api/task?limit=2&api_key=%s' % user.api_key)
+
+        link = res.headers['Link']
+        assert 'api_key' not in link, link
+        assert user.api_key not in link, link
+        assert 'limit=2' in link, link
+
+    @with_context
+    def test_keyset_pagination_for_apps_task_runs_and_users(self):
+        """Test API GET with last_id works for apps, task runs and users"""
+        # The ids of the users are not public
+        for endpoint, factory, key in [('app', AppFactory, 'id'),
+                                       ('taskrun', TaskRunFactory, 'id'),
+                                       ('user', UserFactory, 'name')]:
+            items = factory.create_batch(3)
+            url = '/api/%s?limit=1&last_id=%s' % (endpoint, items[1].id)
+
+            res = self.app.get(url)
+            data = json.loads(res.data)
+
+            assert [i[key] for i in data] == [getattr(items[2], key)], data
+            assert 'last_id=%s' % items[2].id in res.headers['Link']
+
+    @with_context
+    def test_fields_selects_the_returned_fields(self):
+        """Test API GET with fields returns only the requested fields"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app, state='ongoing',
+                                  info={'url': 'my url', 'other': 'data'})
+
+        res = self.app.get('/api/task?fields=id,state,info.url')
+        data = json.loads(res.data)
+
+        assert data == [{'id': task.id, 'state': 'ongoing',
+                         'info': {'url': 'my url'}}], data
+
+        res = self.app.get('/api/task/%s?fields=info,link' % task.id)
+        data = json.loads(res.data)
+
+        assert sorted(data.keys()) == ['info', 'link'], data
+        assert data['info'] == task.info, data
+
+    @with_context
+    def test_fields_keeps_private_user_attributes_hidden(self):
+        """Test API GET with fields does not return private user fields"""
+        UserFactory.create(privacy_mode=True)
+        UserFactory.create(privacy_mode=False)
+
+        res = self.app.get('/api/user?fields=name,fullname,email_addr')
+        data = json.loads(res.data)
+
+        assert data[0].keys() == ['name'], data
+        assert sorted(data[1].keys()) == ['fullname', 'name'], data
+
+    @with_context
+    def test_fields_with_a_wrong_field(self):
+        """Test API GET with fields that are not columns returns an error"""
+        for endpoint in self.endpoints:
+            res = self.app.get("/api/%s?fields=id,wrongfield" % endpoint)
+            err = json.loads(res.data)
+            assert res.status_code == 415, err
+            assert err['exception_cls'] == 'AttributeError', err
+
     @with_context
     def test_get_query_with_api_key(self):
         """ Test API GET query with an API-KEY"""
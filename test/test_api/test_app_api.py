@@ -26,8 +26,10 @@ from factories import (AppFactory, TaskFactory, TaskRunFactory, AnonymousTaskRun
 
 from pybossa.repositories import ProjectRepository
 from pybossa.repositories import TaskRepository
+from pybossa.repositories import AuditlogRepository
 project_repo = ProjectRepository(db)
 task_repo = TaskRepository(db)
+auditlog_repo = AuditlogRepository(db)
 
 class TestAppAPI(TestAPI):
 
@@ -78,6 +80,26 @@ class TestAppAPI(TestAPI):
         assert project['info']['hello'] == 'world', err_msg
 
 
+    @with_context
+    def test_hidden_apps_are_filtered_out_of_full_pages(self):
+        """Test API hidden projects do not shorten the pages of the list"""
+        owner = UserFactory.create()
+        visible = AppFactory.create(owner=owner)
+        hidden = AppFactory.create(owner=owner, hidden=1)
+        last = AppFactory.create(owner=owner)
+
+        res = self.app.get('/api/app?limit=2')
+        data = json.loads(res.data)
+
+        assert [app['id'] for app in data] == [visible.id, last.id], data
+
+        res = self.app.get('/api/app?limit=3&api_key=' + owner.api_key)
+        data = json.loads(res.data)
+
+        assert [app['id'] for app in data] == [visible.id, hidden.id,
+                                                last.id], data
+
+
     @with_context
     def test_query_app(self):
         """Test API query for project endpoint works"""
@@ -470,6 +492,92 @@ class TestAppAPI(TestAPI):
         assert len(taskruns) + 1 == data['done'], error_msg
 
 
+    @with_context
+    def test_user_progress_of_many_projects(self):
+        """Test API userprogress returns the progress in many projects"""
+        user = UserFactory.create()
+        app, other_app = AppFactory.create_batch(2)
+        task = TaskFactory.create(app=app)
+        TaskFactory.create(app=other_app)
+        TaskRunFactory.create(task=task, user=user)
+
+        url = '/api/userprogress?app_ids=%s,%s,5000&api_key=%s' % (
+            app.id, other_app.id, user.api_key)
+        data = json.loads(self.app.get(url).data)
+
+        assert data == [dict(app_id=app.id, done=1, total=1),
+                        dict(app_id=other_app.id, done=0, total=1)], data
+
+    @with_context
+    def test_user_progress_of_many_projects_needs_valid_ids(self):
+        """Test API userprogress returns 400 without valid project ids"""
+        for app_ids in ('', 'one', ','.join(['1'] * 101)):
+            res = self.app.get('/api/userprogress?app_ids=%s' % app_ids)
+            assert res.status_code == 400, res.status_code
+
+    @with_context
+    def test_get_app_is_conditional(self):
+        """Test API GET project returns 304 while the project is unchanged"""
+        app = AppFactory.create()
+        url = '/api/app/%s' % app.id
+
+        res = self.app.get(url)
+        etag = res.headers['ETag']
+
+        assert res.status_code == 200, res.status_code
+        assert 'public' in res.headers['Cache-Control'], res.headers
+        assert res.headers.get('Last-Modified') is not None, res.headers
+
+        res = self.app.get(url, headers={'If-None-Match': etag})
+        assert res.status_code == 304, res.status_code
+        assert res.data == '', res.data
+
+        res = self.app.get(url, headers={
+            'If-Modified-Since': res.headers['Last-Modified']})
+        assert res.status_code == 304, res.status_code
+
+        TaskFactory.create(app=app)
+        res = self.app.get(url, headers={'If-None-Match': etag})
+        assert res.status_code == 200, res.status_code
+        assert res.headers['ETag'] != etag, res.headers
+
+
+    @with_context
+    def test_get_hidden_app_is_private(self):
+        """Test API GET hidden project is not cached by proxies, and
+        conditional requests still need authorization"""
+        app = AppFactory.create(hidden=1)
+        url = '/api/app/%s?api_key=%s' % (app.id, app.owner.api_key)
+
+        res = self.app.get(url)
+
+        assert res.status_code == 200, res.status_code
+        assert 'private' in res.headers['Cache-Control'], res.headers
+        res = self.app.get('/api/app/%s' % app.id,
+                           headers={'If-None-Match': res.headers['ETag']})
+        assert res.status_code == 401, res.status_code
+
+
+    @with_context
+    def test_user_progress_is_conditional(self):
+        """Test API userprogress returns 304 until the project changes"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app)
+        url = '/api/app/%s/userprogress' % app.id
+
+        res = self.app.get(url)
+        etag = res.headers['ETag']
+
+        assert 'private' in res.headers['Cache-Control'], res.headers
+        res = self.app.get(url, headers={'If-None-Match': etag})
+        assert res.status_code == 304, res.status_code
+
+        AnonymousTaskRunFactory.create(task=task)
+        res = self.app.get(url, headers={'If-None-Match': etag})
+        assert res.status_code == 200, res.status_code
+        assert json.loads(res.data)['done'] == 1, res.data
+
+
     @with_context
     def test_delete_app_cascade(self):
         """Test API delete project deletes associated tasks and taskruns"""
@@ -582,3 +690,186 @@ class TestAppAPI(TestAPI):
         url = '/api/app/%s/newtask?offset=1000' % app.id
         res = self.app.get(url)
         assert res.data == '{}', res.data
+
+
+    @with_context
+    def test_import_progress(self):
+        """Test API import progress is only shown to the project owner"""
+        from pybossa.core import sentinel
+        from pybossa.progress import JobProgress
+        app = AppFactory.create()
+        other = UserFactory.create()
+        JobProgress(sentinel.master, 'import', 'some-id').start(
+            app_id=app.id, n_parsed=10, n_inserted=8, n_skipped=2)
+        url = '/api/app/%s/import/some-id' % app.id
+
+        res = self.app.get(url + '?api_key=%s' % app.owner.api_key)
+        progress = json.loads(res.data)
+        assert progress['state'] == 'running', progress
+        assert progress['n_inserted'] == 8, progress
+        assert progress['id'] == 'some-id', progress
+
+        res = self.app.get(url)
+        assert res.status_code == 401, res.status_code
+        res = self.app.get(url + '?api_key=%s' % other.api_key)
+        assert res.status_code == 403, res.status_code
+
+        other_app = AppFactory.create(owner=app.owner)
+        url = '/api/app/%s/import/some-id' % other_app.id
+        res = self.app.get(url + '?api_key=%s' % app.owner.api_key)
+        assert res.status_code == 404, res.status_code
+
+    @with_context
+    def test_job_progress(self):
+        """Test API job progress is only shown to the project owner"""
+        from pybossa.core import sentinel
+        from pybossa.progress import JobProgress
+        app = AppFactory.create()
+        other = UserFactory.create()
+        JobProgress(sentinel.master, 'delete_tasks', app.id).start(
+            app_id=app.id, n_tasks=10, n_task_runs=20)
+        url = '/api/app/%s/job/delete_tasks' % app.id
+
+        res = self.app.get(url + '?api_key=%s' % app.owner.api_key)
+        progress = json.loads(res.data)
+        assert progress['state'] == 'running', progress
+        assert progress['n_tasks'] == 10, progress
+        assert progress['kind'] == 'delete_tasks', progress
+
+        res = self.app.get(url)
+        assert res.status_code == 401, res.status_code
+        res = self.app.get(url + '?api_key=%s' % other.api_key)
+        assert res.status_code == 403, res.status_code
+
+        other_app = AppFactory.create(owner=app.owner)
+        url = '/api/app/%s/job/delete_tasks' % other_app.id
+        res = self.app.get(url + '?api_key=%s' % app.owner.api_key)
+        assert res.status_code == 404, res.status_code
+        url = '/api/app/%s/job/unknown' % app.id
+        res = self.app.get(url + '?api_key=%s' % app.owner.api_key)
+        assert res.status_code == 404, res.status_code
+
+    @with_context
+    @patch('pybossa.jobs.REDUNDANCY_BATCH_SIZE', 1)
+    def test_job_progress_of_redundancy_update(self):
+        """Test API job progress shows the update of the tasks redundancy"""
+        from pybossa.jobs import update_tasks_redundancy
+        app = AppFactory.create()
+        TaskFactory.create_batch(2, app=app)
+        update_tasks_redundancy(app.id, 3)
+        url = '/api/app/%s/job/redundancy?api_key=%s' % (app.id,
+                                                         app.owner.api_key)
+
+        res = self.app.get(url)
+
+        progress = json.loads(res.data)
+        assert progress['state'] == 'done', progress
+        assert progress['n_updated'] == 2, progress
+        assert progress['n_answers'] == 3, progress
+
+    @with_context
+    def test_job_progress_of_ckan_export(self):
+        """Test API job progress shows the CKAN export of every type"""
+        from pybossa.core import sentinel
+        from pybossa.progress import JobProgress
+        app = AppFactory.create()
+        JobProgress(sentinel.master, 'ckan_export', '%s:task_run' % app.id
+                    ).start(app_id=app.id, type='task_run', exported=5)
+        url = '/api/app/%s/job/ckan_export?api_key=%s' % (app.id,
+                                                          app.owner.api_key)
+
+        res = self.app.get(url + '&type=task_run')
+        progress = json.loads(res.data)
+        assert progress['exported'] == 5, progress
+        assert progress['type'] == 'task_run', progress
+
+        res = self.app.get(url)
+        assert res.status_code == 404, res.status_code
+
+    @with_context
+    def test_update_tasks_by_id(self):
+        """Test API update tasks sets the values of the given tasks"""
+        app = AppFactory.create()
+        tasks = TaskFactory.create_batch(3, app=app, priority_0=0.0)
+        url = '/api/app/%s/tasks?api_key=%s' % (app.id, app.owner.api_key)
+        data = dict(set=dict(priority_0=0.8),
+                    task_ids=[tasks[0].id, tasks[1].id])
+
+        res = self.app.put(url, data=json.dumps(data))
+
+        assert json.loads(res.data) == {'updated': 2}, res.data
+        priorities = [task_repo.get_task(t.id).priority_0 for t in tasks]
+        assert priorities == [0.8, 0.8, 0.0], priorities
+
+    @with_context
+    def test_update_tasks_by_filter(self):
+        """Test API update tasks sets the values of the tasks matching the
+        filter and updates their state"""
+        app = AppFactory.create()
+        task, other = TaskFactory.create_batch(2, app=app, n_answers=1)
+        TaskRunFactory.create(task=task)
+        url = '/api/app/%s/tasks?api_key=%s' % (app.id, app.owner.api_key)
+        data = dict(set=dict(n_answers=2), filter=dict(state='completed'))
+
+        res = self.app.put(url, data=json.dumps(data))
+
+        assert json.loads(res.data) == {'updated': 1}, res.data
+        task = task_repo.get_task(task.id)
+        assert task.n_answers == 2, task.n_answers
+        assert task.state == 'ongoing', task.state
+        assert task_repo.get_task(other.id).n_answers == 1
+        logs = auditlog_repo.filter_by(app_id=app.id)
+        assert len(logs) == 1, logs
+        assert logs[0].caller == 'api', logs[0].caller
+        assert logs[0].old_value == json.dumps(
+            {'filter': {'state': 'completed'}, 'n_tasks': 1}), logs[0].old_value
+
+    @with_context
+    def test_update_tasks_errors(self):
+        """Test API update tasks is only allowed to owners, with valid
+        values and filters"""
+        app = AppFactory.create()
+        TaskFactory.create(app=app)
+        other = UserFactory.create()
+        url = '/api/app/%s/tasks' % app.id
+        data = json.dumps(dict(set=dict(priority_0=0.8), filter={}))
+
+        res = self.app.put(url, data=data)
+        assert res.status_code == 401, res.status_code
+        res = self.app.put(url + '?api_key=%s' % other.api_key, data=data)
+        assert res.status_code == 403, res.status_code
+
+        url = url + '?api_key=%s' % app.owner.api_key
+        data = json.dumps(dict(set=dict(info={'a': 1}), filter={}))
+        res = self.app.put(url, data=data)
+        assert res.status_code == 415, res.status_code
+        data = json.dumps(dict(set=dict(priority_0=0.8), filter={'wrong': 1}))
+        res = self.app.put(url, data=data)
+        assert res.status_code == 415, res.status_code
+
+    @with_context
+    @patch('pybossa.api.app.importer_queue.enqueue')
+    def test_app_update_result_keys_rebuilds_results(self, enqueue):
+        """Test API project update rebuilds the results of the project when
+        its result_keys change"""
+        enqueue.side_effect = lambda job, *args, **kwargs: job(*args)
+        app = AppFactory.create(info={'result_keys': ['answer']})
+        task = TaskFactory.create(app=app)
+        TaskRunFactory.create(task=task, info={'answer': 'yes', 'n': 1})
+        url = '/api/app/%s?api_key=%s' % (app.id, app.owner.api_key)
+
+        res = self.app.put(url, data=json.dumps(dict(info={'total': 1})))
+        assert res.status_code == 200, res.data
+        assert task_repo.count_results_with(app_id=app.id) == 0
+
+        data = dict(info={'result_keys': ['n']})
+        res = self.app.put(url, data=json.dumps(data))
+        assert res.status_code == 200, res.data
+        result = task_repo.get_result_by(task_id=task.id)
+        assert result.n_answers == 1, result.n_answers
+        assert result.info == {'n': {'1': 1}}, result.info
+
+        enqueue.reset_mock()
+        res = self.app.put(url, data=json.dumps(dict(short_name='other')))
+        assert res.status_code == 200, res.data
+        assert not enqueue.called
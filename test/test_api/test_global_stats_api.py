@@ -16,8 +16,9 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 import json
+from default import db
 from test_api import TestAPI
-from factories import AppFactory
+from factories import AppFactory, TaskRunFactory, UserFactory
 
 
 
@@ -30,11 +31,42 @@ class TestGlobalStatsAPI(TestAPI):
         stats = json.loads(res.data)
         assert res.status_code == 200, res.status_code
         keys = ['n_projects', 'n_pending_tasks',
-                'n_users', 'n_task_runs', 'categories']
+                'n_users', 'n_task_runs', 'categories', 'generated_at']
         for k in keys:
             err_msg = "%s should be in stats JSON object" % k
             assert k in stats.keys(), err_msg
 
+    def test_global_stats_are_updated_by_counters(self):
+        """Test Global Stats document is updated with the new answers."""
+        stats = json.loads(self.app.get('api/globalstats').data)
+
+        TaskRunFactory.create()
+        new_stats = json.loads(self.app.get('api/globalstats').data)
+
+        assert new_stats['generated_at'] == stats['generated_at'], new_stats
+        assert new_stats['n_task_runs'] == stats['n_task_runs'] + 1, new_stats
+        assert new_stats['n_users'] == stats['n_users'] + 1, new_stats
+
+    def test_global_stats_counts_deleted_users(self):
+        """Test Global Stats document is updated with the deleted users."""
+        user = UserFactory.create()
+        stats = json.loads(self.app.get('api/globalstats').data)
+
+        db.session.delete(user)
+        db.session.commit()
+        new_stats = json.loads(self.app.get('api/globalstats').data)
+
+        assert new_stats['n_users'] == stats['n_users'] - 1, new_stats
+
+    def test_global_stats_is_conditional(self):
+        """Test Global Stats returns 304 while the stats are the same."""
+        res = self.app.get('api/globalstats')
+        etag = res.headers['ETag']
+
+        assert 'public' in res.headers['Cache-Control'], res.headers
+        res = self.app.get('api/globalstats', headers={'If-None-Match': etag})
+        assert res.status_code == 304, res.status_code
+
     def test_post_global_stats(self):
         """Test Global Stats Post works."""
         res = self.app.post('api/globalstats')
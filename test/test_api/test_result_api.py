@@ -0,0 +1,67 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+from default import with_context
+from test_api import TestAPI
+
+from factories import AppFactory, TaskFactory, TaskRunFactory, UserFactory
+
+
+class TestResultAPI(TestAPI):
+
+    def create_result(self):
+        app = AppFactory.create(info={'result_keys': ['answer']})
+        task = TaskFactory.create(app=app)
+        TaskRunFactory.create_batch(2, task=task, info={'answer': 'yes'})
+        return app, task
+
+    @with_context
+    def test_result_query_with_params(self):
+        """Test API query for results returns one row per task"""
+        app, task = self.create_result()
+        res = self.app.get('/api/result?app_id=%s' % app.id)
+        data = json.loads(res.data)
+        assert len(data) == 1, data
+        result = data[0]
+        assert result['task_id'] == task.id, result
+        assert result['n_answers'] == 2, result
+        assert result['info'] == {'answer': {'yes': 2}}, result
+        assert result['link'].startswith("<link rel='self' title='result'")
+        assert len(result['links']) == 2, result
+
+        res = self.app.get('/api/result/%s' % result['id'])
+        assert json.loads(res.data)['task_id'] == task.id, res.data
+
+    @with_context
+    def test_results_are_read_only(self):
+        """Test API results cannot be created, updated or deleted"""
+        app, task = self.create_result()
+        admin = UserFactory.create(admin=True)
+        data = dict(app_id=app.id, task_id=task.id, info={})
+
+        res = self.app.post('/api/result?api_key=%s' % admin.api_key,
+                            data=json.dumps(data))
+        assert res.status_code == 403, res.data
+        res = self.app.put('/api/result/1?api_key=%s' % admin.api_key,
+                           data=json.dumps(data))
+        assert res.status_code == 403, res.data
+        res = self.app.delete('/api/result/1?api_key=%s' % admin.api_key)
+        assert res.status_code == 403, res.data
+        res = self.app.delete('/api/result/1')
+        assert res.status_code == 401, res.data
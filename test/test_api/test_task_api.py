@@ -18,6 +18,7 @@
 import json
 from default import db, with_context
 from nose.tools import assert_equal
+from mock import patch
 from test_api import TestAPI
 
 from factories import AppFactory, TaskFactory, TaskRunFactory, UserFactory
@@ -79,6 +80,30 @@ class TestTaskAPI(TestAPI):
         assert len(data) == 5, data
 
 
+    @with_context
+    def test_task_query_with_info_filter(self):
+        """Test API query for task endpoint filtering by keys of the info
+        field works"""
+        app = AppFactory.create()
+        yes = TaskFactory.create(app=app, info={'answer': 'yes', 'n': 3})
+        TaskFactory.create(app=app, info={'answer': 'no', 'n': 3})
+        TaskFactory.create(app=app, info={'answer': 'yes', 'n': '3'})
+
+        res = self.app.get('/api/task?info=answer::yes|n::3')
+        data = json.loads(res.data)
+
+        assert [task['id'] for task in data] == [yes.id], data
+
+        res = self.app.get('/api/task?info=n::3&app_id=%s' % app.id)
+        data = json.loads(res.data)
+        assert len(data) == 2, data
+
+        res = self.app.get('/api/task?info=answer')
+        assert json.loads(res.data) == [], res.data
+
+        res = self.app.get('/api/task?info=::yes')
+        assert res.status_code == 415, res.data
+
     @with_context
     def test_task_post(self):
         """Test API Task creation"""
@@ -152,6 +177,94 @@ class TestTaskAPI(TestAPI):
         assert err['exception_cls'] == 'TypeError', err
 
 
+    @with_context
+    def test_task_bulk_post(self):
+        """Test API bulk Task creation from an array and from NDJSON"""
+        user = UserFactory.create()
+        app = AppFactory.create(owner=user)
+        other = AppFactory.create(owner=user)
+        data = [dict(app_id=app.id, info={'n': 1}),
+                dict(app_id=other.id, info={'n': 2}, n_answers=5),
+                dict(app_id=app.id, info={'n': 3})]
+        url = '/api/task/bulk?api_key=' + user.api_key
+
+        res = self.app.post(url, data=json.dumps(data))
+        created = json.loads(res.data)
+
+        assert res.status_code == 200, res.data
+        assert created['created'] == 3, created
+        tasks = [task_repo.get_task(id) for id in created['ids']]
+        assert [t.info['n'] for t in tasks] == [1, 2, 3], tasks
+        assert [t.app_id for t in tasks] == [app.id, other.id, app.id], tasks
+        assert tasks[1].n_answers == 5, tasks[1]
+
+        ndjson = '\n'.join(json.dumps(task) for task in data[:2])
+        res = self.app.post(url, data=ndjson,
+                            content_type='application/x-ndjson')
+        created = json.loads(res.data)
+
+        assert created['created'] == 2, created
+        assert task_repo.count_tasks_with(app_id=app.id) == 3
+
+    @with_context
+    def test_task_bulk_post_checks_every_project_first(self):
+        """Test API bulk Task creation does not create any task if the user
+        cannot create tasks in one of the projects"""
+        user = UserFactory.create()
+        app = AppFactory.create(owner=user)
+        not_owned = AppFactory.create()
+        data = [dict(app_id=app.id, info={'n': 1}),
+                dict(app_id=not_owned.id, info={'n': 2})]
+
+        res = self.app.post('/api/task/bulk', data=json.dumps(data))
+        assert res.status_code == 401, res.data
+
+        res = self.app.post('/api/task/bulk?api_key=' + user.api_key,
+                            data=json.dumps(data))
+        assert res.status_code == 403, res.data
+
+        res = self.app.post('/api/task/bulk?api_key=' + user.api_key,
+                            data=json.dumps([dict(app_id=app.id, wrong=1)]))
+        assert res.status_code == 415, res.data
+        assert json.loads(res.data)['exception_cls'] == 'AttributeError'
+
+        res = self.app.post('/api/task/bulk?api_key=' + user.api_key,
+                            data=json.dumps([dict(info={'n': 1})]))
+        assert res.status_code == 415, res.data
+        assert task_repo.count_tasks_with() == 0
+
+    @with_context
+    def test_task_bulk_post_checks_the_values_first(self):
+        """Test API bulk Task creation does not create any task if a value
+        of any task is wrong"""
+        user = UserFactory.create()
+        app = AppFactory.create(owner=user)
+        url = '/api/task/bulk?api_key=' + user.api_key
+
+        for wrong in (dict(n_answers='x'), dict(state='wrong'),
+                      dict(priority_0=True), dict(n_answers=None)):
+            task = dict(wrong, app_id=app.id)
+            ndjson = '\n'.join(json.dumps(t) for t in
+                                [dict(app_id=app.id), task])
+            res = self.app.post(url, data=ndjson)
+            assert res.status_code == 415, res.data
+        assert task_repo.count_tasks_with() == 0
+
+    @with_context
+    @patch('pybossa.api.BULK_TASKS_BATCH_SIZE', 1)
+    def test_task_bulk_post_inserts_every_batch_or_none(self):
+        """Test API bulk Task creation does not keep the first batches if
+        the insert of a later one fails"""
+        user = UserFactory.create()
+        app = AppFactory.create(owner=user)
+        data = [dict(app_id=app.id), dict(app_id=app.id, n_answers=2 ** 40)]
+
+        res = self.app.post('/api/task/bulk?api_key=' + user.api_key,
+                            data=json.dumps(data))
+
+        assert res.status_code != 200, res.data
+        assert task_repo.count_tasks_with() == 0
+
     @with_context
     def test_task_update(self):
         """Test API task update"""
@@ -252,3 +252,15 @@ class TestUserAPI(TestAPI):
         assert public_user['name'] == 'publicUser', public_user
         private_user = data[1]
         assert private_user['name'] == 'privateUser', private_user
+
+    @with_context
+    def test_user_query_by_info_is_not_allowed(self):
+        """Test API user queries cannot filter by the private info field"""
+        admin = UserFactory.create()
+        UserFactory.create(info={'secret': 'yes'})
+
+        for query in ('api/user?info=secret::yes', 'api/user?info={}'):
+            res = self.app.get(query)
+            assert res.status_code == 415, res.status_code
+            res = self.app.get(query + '&api_key=' + admin.api_key)
+            assert res.status_code == 415, res.status_code
@@ -578,9 +578,10 @@ class TestAuditlogWEB(web.Helper):
 
         attribute = 'task.priority_0'
 
-        new_string = json.dumps({'task_id': 1, 'task_priority_0': 0.5})
+        new_string = json.dumps({'priority_0': 0.5})
 
-        old_value = json.dumps({'task_id': 1, 'task_priority_0': 0.0})
+        old_value = json.dumps({'first_task_id': 1, 'last_task_id': 1,
+                                'n_tasks': 1})
 
         self.app.post(url, data={'task_ids': '1', 'priority_0': '0.5'}, follow_redirects=True)
 
@@ -611,12 +612,11 @@ class TestAuditlogWEB(web.Helper):
         self.app.post(url, data={'task_ids': '1,2', 'priority_0': '0.5'}, follow_redirects=True)
 
         logs = auditlog_repo.filter_by(app_short_name=short_name, offset=1)
-        assert len(logs) == 2, logs
-        id = 1
+        assert len(logs) == 1, logs
+        new_string = json.dumps({'priority_0': 0.5})
+        old_value = json.dumps({'first_task_id': 1, 'last_task_id': 2,
+                                'n_tasks': 2})
         for log in logs:
-            new_string = json.dumps({'task_id': id, 'task_priority_0': 0.5})
-            old_value = json.dumps({'task_id': id, 'task_priority_0': 0.0})
-
             assert log.attribute == attribute, log.attribute
             assert log.old_value == old_value, log.old_value
             assert log.new_value == new_string, log.new_value
@@ -624,7 +624,6 @@ class TestAuditlogWEB(web.Helper):
             assert log.action == 'update', log.action
             assert log.user_name == 'johndoe', log.user_name
             assert log.user_id == 1, log.user_id
-            id = id +1
 
     @with_context
     def test_app_task_redundancy(self):
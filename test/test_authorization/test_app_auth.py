@@ -24,6 +24,7 @@ from mock import patch
 from test_authorization import mock_current_user
 from factories import AppFactory, UserFactory
 from factories import reset_all_pk_sequences
+from pybossa.core import project_repo
 
 
 
@@ -122,6 +123,42 @@ class TestProjectAuthorization(Test):
         assert_not_raises(Exception, getattr(require, 'app').read, project)
 
 
+    @patch('pybossa.auth.current_user', new=mock_anonymous)
+    @patch('pybossa.auth.app.current_user', new=mock_anonymous)
+    def test_anonymous_user_read_filter_excludes_hidden(self):
+        """Test the read filter of anonymous users excludes hidden projects"""
+        project = AppFactory.create()
+        AppFactory.create(hidden=1)
+
+        criterion = getattr(require, 'app').read_filter()
+
+        assert project_repo.filter_by(criterion=criterion) == [project]
+
+
+    @patch('pybossa.auth.current_user', new=mock_authenticated)
+    @patch('pybossa.auth.app.current_user', new=mock_authenticated)
+    def test_owners_read_filter_includes_their_hidden(self):
+        """Test the read filter of a user includes the hidden projects they
+        own, but not the hidden projects of others"""
+        users = UserFactory.create_batch(2)
+        project = AppFactory.create()
+        own_hidden = AppFactory.create(hidden=1, owner=users[1])
+        AppFactory.create(hidden=1, owner=users[0])
+
+        criterion = getattr(require, 'app').read_filter()
+
+        assert users[1].id == self.mock_authenticated.id, users
+        assert project_repo.filter_by(criterion=criterion) == [project,
+                                                               own_hidden]
+
+
+    @patch('pybossa.auth.current_user', new=mock_admin)
+    @patch('pybossa.auth.app.current_user', new=mock_admin)
+    def test_admin_read_filter_includes_hidden(self):
+        """Test an admin has no read filter"""
+        assert getattr(require, 'app').read_filter() is None
+
+
     @patch('pybossa.auth.current_user', new=mock_anonymous)
     @patch('pybossa.auth.app.current_user', new=mock_anonymous)
     def test_anonymous_user_cannot_update(self):
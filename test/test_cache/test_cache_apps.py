@@ -265,6 +265,17 @@ class TestAppsCache(Test):
         for app in top_apps:
             assert app['name'] != 'hidden', app['name']
 
+    def test_n_tasks_many(self):
+        """Test CACHE PROJECTS n_tasks_many returns the number of tasks of
+        every project, including the ones without tasks"""
+
+        app = self.create_app_with_tasks(completed_tasks=2, ongoing_tasks=3)
+        other_app = AppFactory.create()
+        n_tasks = cached_apps.n_tasks_many([app.id, other_app.id])
+
+        assert n_tasks == {app.id: 5, other_app.id: 0}, n_tasks
+
+
     def test_n_completed_tasks_no_completed_tasks(self):
         """Test CACHE PROJECTS n_completed_tasks returns 0 if no completed tasks"""
 
@@ -20,6 +20,8 @@ from default import Test, db, with_context
 from factories import (AppFactory, TaskFactory, TaskRunFactory,
                       AnonymousTaskRunFactory, UserFactory)
 from pybossa.cache import helpers
+from pybossa.core import sentinel, task_repo
+from pybossa.model.task_run import TaskRun
 
 
 class TestHelpersCache(Test):
@@ -153,6 +155,52 @@ class TestHelpersCache(Test):
         assert n_available_tasks == 1, n_available_tasks
 
 
+    def test_n_available_tasks_bitmaps_are_updated_with_answers(self):
+        """Test n_available_tasks counts the new answers and the completed
+        tasks without building the task bitmaps again"""
+        app = AppFactory.create()
+        task, other_task = TaskFactory.create_batch(2, app=app, n_answers=1)
+        user, other_user = UserFactory.create_batch(2)
+        assert helpers.n_available_tasks(app.id, user_id=user.id) == 2
+        assert helpers.n_available_tasks(app.id, user_id=other_user.id) == 2
+        generation = sentinel.master.get(helpers.TASK_BITMAPS_KEY % app.id)
+
+        task_repo.save(TaskRun(app_id=app.id, task_id=task.id,
+                               user_id=user.id, info={}))
+
+        assert helpers.n_available_tasks(app.id, user_id=user.id) == 1
+        assert helpers.n_available_tasks(app.id, user_id=other_user.id) == 1
+        key = helpers.TASK_BITMAPS_KEY % app.id
+        assert sentinel.master.get(key) == generation
+
+    def test_n_available_tasks_counts_deleted_answers(self):
+        """Test n_available_tasks returns a task again once the answer of the
+        user is deleted"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app, n_answers=2)
+        user = UserFactory.create()
+        taskrun = TaskRun(app_id=app.id, task_id=task.id, user_id=user.id,
+                          info={})
+        task_repo.save(taskrun)
+        assert helpers.n_available_tasks(app.id, user_id=user.id) == 0
+
+        task_repo.delete(taskrun)
+
+        n_available_tasks = helpers.n_available_tasks(app.id, user_id=user.id)
+        assert n_available_tasks == 1, n_available_tasks
+
+    def test_n_available_tasks_counts_new_tasks(self):
+        """Test n_available_tasks counts the tasks added to the project
+        after the task bitmaps are built"""
+        app = AppFactory.create()
+        TaskFactory.create(app=app)
+        assert helpers.n_available_tasks(app.id, user_ip='127.0.0.1') == 1
+
+        TaskFactory.create(app=app)
+
+        assert helpers.n_available_tasks(app.id, user_ip='127.0.0.1') == 2
+
+
     def test_check_contributing_state_completed(self):
         """Test check_contributing_state returns 'completed' for a project with all
         tasks completed and user that has contributed to it"""
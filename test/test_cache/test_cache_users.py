@@ -16,8 +16,12 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+from mock import patch
 from default import Test
 from pybossa.cache import users as cached_users
+from pybossa.core import user_repo, sentinel
+from pybossa.model import make_uuid
 
 from factories import AppFactory, TaskFactory, TaskRunFactory, UserFactory
 from factories import reset_all_pk_sequences
@@ -280,3 +284,103 @@ class TestUsersCache(Test):
 
         for field in fields:
             assert field in hidden_projects[0].keys(), field
+
+
+    def test_get_user_by_api_key(self):
+        """Test CACHE USERS get_user_by_api_key returns the user of the key,
+        which loads the rest of its attributes when needed, or None"""
+        user = UserFactory.create(admin=True)
+
+        principal = cached_users.get_user_by_api_key(user.api_key)
+
+        assert principal.id == user.id, principal
+        assert principal.name == user.name, principal
+        assert principal.admin is True, principal
+        assert principal.is_authenticated(), principal
+        assert principal.email_addr == user.email_addr, principal
+        assert cached_users.get_user_by_api_key('wrong') is None
+
+
+    def test_get_user_by_api_key_cache_is_deleted_on_update(self):
+        """Test CACHE USERS get_user_by_api_key does not return the user for
+        an old API key, nor old data, once the user is updated"""
+        user = UserFactory.create()
+        old_key = user.api_key
+
+        with patch.dict(os.environ):
+            del os.environ['PYBOSSA_REDIS_CACHE_DISABLED']
+            principal = cached_users.get_user_by_api_key(old_key)
+            assert principal.admin is False, principal
+
+            user.admin = True
+            user_repo.update(user)
+            principal = cached_users.get_user_by_api_key(old_key)
+            assert principal.admin is True, principal
+
+            user.api_key = make_uuid()
+            user_repo.update(user)
+            assert cached_users.get_user_by_api_key(old_key) is None
+            principal = cached_users.get_user_by_api_key(user.api_key)
+            assert principal.id == user.id, principal
+
+
+    def test_n_user_task_runs(self):
+        """Test CACHE USERS n_user_task_runs returns the task runs of a user
+        in every project"""
+        user = UserFactory.create()
+        app, other_app = AppFactory.create_batch(2)
+        task = TaskFactory.create(app=app)
+        TaskRunFactory.create_batch(2, task=task, user=user)
+        TaskRunFactory.create(task=task)
+
+        n_task_runs = cached_users.n_user_task_runs([app.id, other_app.id],
+                                                    user_id=user.id)
+
+        assert n_task_runs == {app.id: 2, other_app.id: 0}, n_task_runs
+
+    def test_n_user_task_runs_counts_new_task_runs(self):
+        """Test CACHE USERS n_user_task_runs counts the new task runs, and
+        rebuilds the counters when they are missing"""
+        user = UserFactory.create()
+        task = TaskFactory.create()
+        app = task.app
+        TaskRunFactory.create(task=task, user=user)
+        assert cached_users.n_user_task_runs([app.id], user.id)[app.id] == 1
+
+        TaskRunFactory.create(task=task, user=user)
+        key = cached_users.USER_PROGRESS_KEY % app.id
+        assert sentinel.master.hget(key, 'user:%s' % user.id) == '2'
+
+        sentinel.master.delete(key)
+        assert cached_users.n_user_task_runs([app.id], user.id)[app.id] == 2
+
+    def test_incr_user_progress_does_not_refresh_ttl(self):
+        """Test CACHE USERS incr_user_progress keeps the TTL set when the
+        counters were rebuilt, so they expire even if the project is active"""
+        user = UserFactory.create()
+        task = TaskFactory.create()
+        app = task.app
+        assert cached_users.n_user_task_runs([app.id], user.id)[app.id] == 0
+        key = cached_users.USER_PROGRESS_KEY % app.id
+        assert sentinel.master.ttl(key) > 0
+        sentinel.master.expire(key, 100)
+
+        TaskRunFactory.create(task=task, user=user)
+
+        assert sentinel.master.hget(key, 'user:%s' % user.id) == '1'
+        assert sentinel.master.ttl(key) <= 100, sentinel.master.ttl(key)
+
+    def test_user_progress(self):
+        """Test CACHE USERS user_progress returns the task runs of a user and
+        the total number of tasks of every project"""
+        user = UserFactory.create()
+        app, other_app = AppFactory.create_batch(2)
+        task = TaskFactory.create(app=app)
+        TaskFactory.create(app=app)
+        TaskRunFactory.create(task=task, user=user)
+
+        progress = cached_users.user_progress([app.id, other_app.id],
+                                              user_id=user.id)
+
+        assert progress == {app.id: dict(done=1, total=2),
+                            other_app.id: dict(done=0, total=0)}, progress
@@ -402,8 +402,9 @@ class TestCkanModule(Test, object):
                 assert 500 == status_code, status_code
                 assert "CKAN: the remote site failed! datastore_create failed" == type, type
 
+    @patch('pybossa.ckan.time.sleep')
     @patch('pybossa.ckan.requests.post')
-    def test_06_datastore_upsert_without_resource_id(self, Mock):
+    def test_06_datastore_upsert_without_resource_id(self, Mock, sleep):
         """Test CKAN datastore_upsert without resourece_id works"""
         html_request = FakeRequest(json.dumps(self.task_upsert), 200,
                                    {'content-type': 'application/json'})
@@ -412,7 +413,7 @@ class TestCkanModule(Test, object):
         Mock.return_value = html_request
         with self.flask_app.test_request_context('/'):
             out = self.ckan.datastore_upsert(name='task',
-                                             records=json.dumps([record]),
+                                             records=[record],
                                              resource_id=None)
             err_msg = "It should return True"
             assert out is True, err_msg
@@ -420,7 +421,7 @@ class TestCkanModule(Test, object):
             Mock.return_value = self.server_error
             try:
                 self.ckan.datastore_upsert(name='task',
-                                           records=json.dumps([record]),
+                                           records=[record],
                                            resource_id=self.task_resource_id)
             except Exception as out:
                 type, msg, status_code = out.args
@@ -429,8 +430,9 @@ class TestCkanModule(Test, object):
                 assert "CKAN: the remote site failed! datastore_upsert failed" == type, type
 
 
+    @patch('pybossa.ckan.time.sleep')
     @patch('pybossa.ckan.requests.post')
-    def test_06_datastore_upsert(self, Mock):
+    def test_06_datastore_upsert(self, Mock, sleep):
         """Test CKAN datastore_upsert works"""
         html_request = FakeRequest(json.dumps(self.task_upsert), 200,
                                    {'content-type': 'application/json'})
@@ -439,7 +441,7 @@ class TestCkanModule(Test, object):
         Mock.return_value = html_request
         with self.flask_app.test_request_context('/'):
             out = self.ckan.datastore_upsert(name='task',
-                                             records=json.dumps([record]),
+                                             records=[record],
                                              resource_id=self.task_resource_id)
             err_msg = "It should return True"
             assert out is True, err_msg
@@ -447,7 +449,7 @@ class TestCkanModule(Test, object):
             Mock.return_value = self.server_error
             try:
                 self.ckan.datastore_upsert(name='task',
-                                           records=json.dumps([record]),
+                                           records=[record],
                                            resource_id=self.task_resource_id)
             except Exception as out:
                 type, msg, status_code = out.args
@@ -455,6 +457,56 @@ class TestCkanModule(Test, object):
                 assert 500 == status_code, status_code
                 assert "CKAN: the remote site failed! datastore_upsert failed" == type, type
 
+    @patch('pybossa.ckan.time.sleep')
+    @patch('pybossa.ckan.requests.post')
+    def test_06_datastore_upsert_in_chunks(self, Mock, sleep):
+        """Test CKAN datastore_upsert sends the records in chunks"""
+        html_request = FakeRequest(json.dumps(self.task_upsert), 200,
+                                   {'content-type': 'application/json'})
+        Mock.return_value = html_request
+        records = (dict(id=i) for i in range(5))
+        uploaded = []
+        with patch.object(self.ckan, 'upsert_chunk_size', 2):
+            out = self.ckan.datastore_upsert(name='task', records=records,
+                                             resource_id=self.task_resource_id,
+                                             progress=uploaded.append)
+        assert out is True, out
+        assert Mock.call_count == 3, Mock.call_count
+        assert sorted(uploaded) == [1, 2, 2], uploaded
+        sent = sorted(r['id'] for call in Mock.call_args_list
+                      for r in json.loads(call[1]['data'])['records'])
+        assert sent == range(5), sent
+        assert not sleep.called
+
+    @patch('pybossa.ckan.time.sleep')
+    @patch('pybossa.ckan.requests.post')
+    def test_06_datastore_upsert_retries_server_errors(self, Mock, sleep):
+        """Test CKAN datastore_upsert retries a chunk with backoff"""
+        html_request = FakeRequest(json.dumps(self.task_upsert), 200,
+                                   {'content-type': 'application/json'})
+        Mock.side_effect = [self.server_error, self.server_error, html_request]
+        out = self.ckan.datastore_upsert(name='task', records=[dict(id=1)],
+                                         resource_id=self.task_resource_id)
+        assert out is True, out
+        assert Mock.call_count == 3, Mock.call_count
+        assert [c[0][0] for c in sleep.call_args_list] == [1, 2]
+
+    @patch('pybossa.ckan.time.sleep')
+    @patch('pybossa.ckan.requests.post')
+    def test_06_datastore_upsert_does_not_retry_client_errors(self, Mock, sleep):
+        """Test CKAN datastore_upsert does not retry a rejected chunk"""
+        Mock.return_value = FakeRequest('Bad Request', 400,
+                                        {'content-type': 'application/json'})
+        try:
+            self.ckan.datastore_upsert(name='task', records=[dict(id=1)],
+                                       resource_id=self.task_resource_id)
+            raise AssertionError("An exception should be raised")
+        except Exception as out:
+            type, msg, status_code = out.args
+            assert 400 == status_code, status_code
+        assert Mock.call_count == 1, Mock.call_count
+        assert not sleep.called
+
     @patch('pybossa.ckan.requests.post')
     def test_07_datastore_delete(self, Mock):
         """Test CKAN datastore_delete works"""
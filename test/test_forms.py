@@ -18,8 +18,9 @@
 
 from wtforms import ValidationError
 from nose.tools import raises
+from mock import patch
 
-from pybossa.forms.forms import RegisterForm
+from pybossa.forms.forms import RegisterForm, GenericBulkTaskImportForm
 from default import Test, db, with_context
 from pybossa.forms import validator
 from pybossa.view.account import LoginForm
@@ -157,3 +158,36 @@ class TestRegisterForm(Test):
 
         assert not form.validate()
         assert "Passwords must match" in form.errors['password'], form.errors
+
+
+class TestBulkTaskFileImportForm(Test):
+
+    @with_context
+    def test_it_requires_a_file(self):
+        form = GenericBulkTaskImportForm()('upload', file_format='csv')
+
+        assert not form.validate()
+        assert "You must upload a file" in form.errors['file'], form.errors
+
+    @with_context
+    @patch('pybossa.forms.forms.current_user')
+    def test_only_admins_can_import_files_in_the_server(self, current_user):
+        current_user.admin = False
+        form = GenericBulkTaskImportForm()('upload', file_format='csv',
+                                           file_path='/tmp/tasks.csv')
+
+        assert not form.validate()
+        assert "Only administrators can import files that are already in "\
+               "the server" in form.errors['file_path'], form.errors
+
+    @with_context
+    @patch('pybossa.forms.forms.current_user')
+    def test_admins_can_import_files_in_the_server(self, current_user):
+        current_user.admin = True
+        form = GenericBulkTaskImportForm()('upload', file_format='csv',
+                                           file_path='/tmp/tasks.csv')
+
+        assert form.validate(), form.errors
+        assert form.get_import_data() == {'type': 'upload',
+                                          'file_format': 'csv',
+                                          'file_path': '/tmp/tasks.csv'}
@@ -20,6 +20,7 @@ import json
 
 from default import Test
 from pybossa.hateoas import Hateoas
+from pybossa.model.task_run import TaskRun
 
 
 class TestHateoas(Test):
@@ -213,3 +214,35 @@ class TestHateoas(Test):
         # # when the links specification of a user will be set, modify the following
         # err_msg = "The list of links should be empty for now"
         # assert output.get('links') == None, err_msg
+
+    def test_02_links_are_built_from_the_foreign_keys(self):
+        """Test HATEOAS parent links do not need the related objects"""
+        taskrun = TaskRun(id=3, app_id=1, task_id=2)
+        with self.flask_app.test_request_context('/api/taskrun'):
+            links, link = self.hateoas.create_links(taskrun)
+
+        assert taskrun.app is None and taskrun.task is None
+        assert link == self.hateoas.link(
+            rel='self', title='taskrun', href='http://localhost/api/taskrun/3')
+        assert links == [
+            self.hateoas.link(rel='parent', title='app',
+                              href='http://localhost/api/app/1'),
+            self.hateoas.link(rel='parent', title='task',
+                              href='http://localhost/api/task/2')], links
+
+    def test_03_links_use_the_host_of_the_request(self):
+        """Test HATEOAS links are built for the host of every request, without
+        caching anything per host"""
+        hateoas = Hateoas()
+        taskrun = TaskRun(id=3, app_id=1, task_id=2)
+        for host in ('localhost', 'example.com', 'other.example.com'):
+            with self.flask_app.test_request_context(
+                    '/api/taskrun', headers={'Host': host}):
+                links, link = hateoas.create_links(taskrun)
+
+            assert link == hateoas.link(
+                rel='self', title='taskrun',
+                href='http://%s/api/taskrun/3' % host), link
+
+        assert sorted(hateoas._hrefs) == ['app', 'task', 'taskrun'], \
+            hateoas._hrefs
@@ -0,0 +1,85 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+from mock import patch, Mock
+from nose.tools import assert_raises
+
+from default import Test, with_context
+from pybossa.importers import (create_importer_for, iter_json_array,
+                               BulkImportException)
+
+
+def split(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class TestIterJsonArray(object):
+
+    data = [{'a': 1, 'b': [1, 2, {'c': 'x],'}]}, 12345, 'a, b]', None, 1.5e3,
+            [], True]
+
+    def test_it_yields_the_items_split_in_any_chunks(self):
+        text = u' ' + json.dumps(self.data, indent=2) + u'\n'
+        for size in range(1, len(text) + 1):
+            items = list(iter_json_array(split(text, size)))
+            assert items == self.data, (size, items)
+
+    def test_it_yields_nothing_for_an_empty_array(self):
+        assert list(iter_json_array([u'[', u' ]'])) == []
+
+    def test_it_raises_value_error_for_invalid_arrays(self):
+        for text in [u'', u'{}', u'[1,', u'[1 2]', u'[1,]', u'[1.]']:
+            items = iter_json_array(split(text, 1))
+            assert_raises(ValueError, list, items)
+
+
+class TestEpiCollectPlusImporter(Test):
+
+    def response(self, chunks):
+        response = Mock(status_code=200, encoding=None,
+                        headers={'content-type': 'application/json'})
+        response.iter_content.return_value = chunks
+        return response
+
+    @with_context
+    @patch('pybossa.importers.requests.get')
+    def test_tasks_are_yielded_while_the_data_is_downloaded(self, requests_get):
+        chunks = iter(['[{"DeviceID": 23},', ' {"DeviceID": 24}]'])
+        requests_get.return_value = self.response(chunks)
+        importer = create_importer_for('epicollect')
+
+        tasks = importer.tasks(epicollect_project='project',
+                               epicollect_form='form')
+
+        assert next(tasks) == {'info': {'DeviceID': 23}}
+        assert next(chunks) == ' {"DeviceID": 24}]'
+        requests_get.assert_called_once_with(
+            'http://plus.epicollect.net/project/form.json', stream=True)
+
+    @with_context
+    @patch('pybossa.importers.requests.get')
+    def test_invalid_json_raises_bulk_import_exception(self, requests_get):
+        chunks = iter(['[{"DeviceID": 23}', ' {"DeviceID": 24}]'])
+        requests_get.return_value = self.response(chunks)
+        importer = create_importer_for('epicollect')
+
+        tasks = importer.tasks(epicollect_project='project',
+                               epicollect_form='form')
+
+        assert_raises(BulkImportException, list, tasks)
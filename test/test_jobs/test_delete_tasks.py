@@ -0,0 +1,74 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from default import Test, db, with_context
+from pybossa.core import sentinel, task_repo
+from pybossa.jobs import delete_tasks
+from pybossa.progress import JobProgress
+from pybossa.model.task import Task
+from pybossa.model.task_run import TaskRun
+from factories import AppFactory, TaskFactory, TaskRunFactory
+from mock import patch
+
+
+class TestDeleteTasksJob(Test):
+
+    @with_context
+    @patch('pybossa.jobs.DELETE_BATCH_SIZE', 2)
+    def test_it_deletes_all_the_tasks_in_batches(self):
+        app = AppFactory.create()
+        tasks = TaskFactory.create_batch(5, app=app)
+        TaskRunFactory.create_batch(3, task=tasks[4])
+        other = TaskFactory.create()
+
+        with patch.object(task_repo, 'delete_tasks_batch',
+                          wraps=task_repo.delete_tasks_batch) as delete_batch:
+            n = delete_tasks(app.id)
+
+        assert n == 5, n
+        assert delete_batch.call_count == 4, delete_batch.call_args_list
+        assert db.session.query(Task).filter_by(app_id=app.id).count() == 0
+        assert db.session.query(TaskRun).filter_by(app_id=app.id).count() == 0
+        assert db.session.query(Task).get(other.id) is not None
+
+    @with_context
+    def test_it_keeps_the_progress_of_the_deletion(self):
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app)
+        TaskRunFactory.create_batch(2, task=task)
+
+        delete_tasks(app.id)
+
+        progress = JobProgress(sentinel.master, 'delete_tasks', app.id).get()
+        assert progress['state'] == 'done', progress
+        assert progress['n_tasks'] == 1, progress
+        assert progress['n_task_runs'] == 2, progress
+
+    @with_context
+    @patch('pybossa.importers.cached_apps')
+    def test_it_deletes_the_cached_stats_of_the_project(self, cached_apps):
+        app = AppFactory.create()
+        TaskFactory.create(app=app)
+
+        delete_tasks(app.id)
+
+        cached_apps.delete_n_tasks.assert_called_with(app.id)
+        cached_apps.delete_n_task_runs.assert_called_with(app.id)
+        cached_apps.delete_overall_progress.assert_called_with(app.id)
+        cached_apps.delete_last_activity.assert_called_with(app.id)
+
@@ -0,0 +1,120 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from default import Test, with_context
+from pybossa.core import sentinel
+from pybossa.jobs import export_to_ckan
+from pybossa.progress import JobProgress
+from factories import AppFactory, TaskFactory, UserFactory
+from requests.exceptions import ConnectionError
+from mock import patch
+
+app_url = 'http://localhost/app/app/'
+
+
+@patch('pybossa.jobs.send_mail')
+@patch('pybossa.ckan.Ckan', autospec=True)
+class TestExportToCkanJob(Test):
+
+    def progress(self, app, ty='task'):
+        return JobProgress(sentinel.master, 'ckan_export',
+                           '%s:%s' % (app.id, ty)).get()
+
+    def upsert(self, name, records, resource_id=None, progress=None):
+        records = list(records)
+        if progress is not None:
+            progress(len(records))
+        self.upserted = records
+        return True
+
+    @with_context
+    def test_it_creates_the_package_and_uploads_the_tasks(self, Ckan, send_mail):
+        user = UserFactory.create(ckan_api='key')
+        app = AppFactory.create(owner=user)
+        TaskFactory.create_batch(3, app=app)
+        ckan = Ckan.return_value
+        ckan.package_exists.return_value = (None, None)
+        ckan.resource_create.return_value = dict(result=dict(id=3))
+        ckan.datastore_upsert.side_effect = self.upsert
+
+        with patch.dict(self.flask_app.config, {'CKAN_URL': 'http://ckan.com'}):
+            msg = export_to_ckan(app.id, 'task', user.id, app_url)
+
+        assert msg == 'Data exported to http://ckan.com', msg
+        Ckan.assert_called_once_with(url='http://ckan.com', api_key='key')
+        ckan.package_create.assert_called_once_with(app=app, user=user,
+                                                    url=app_url)
+        ckan.datastore_create.assert_called_once_with(name='task',
+                                                      resource_id=3)
+        assert len(self.upserted) == 3, self.upserted
+        progress = self.progress(app)
+        assert progress['state'] == 'done', progress
+        assert progress['exported'] == 3, progress
+        assert send_mail.called
+
+    @with_context
+    def test_it_replaces_an_existing_resource(self, Ckan, send_mail):
+        user = UserFactory.create(ckan_api='key')
+        app = AppFactory.create(owner=user)
+        TaskFactory.create(app=app)
+        package = dict(id=3, resources=[dict(name='task', id=1)])
+        ckan = Ckan.return_value
+        ckan.package_exists.return_value = (package, None)
+        ckan.get_resource_id.return_value = 1
+        ckan.datastore_upsert.side_effect = self.upsert
+
+        export_to_ckan(app.id, 'task', user.id, app_url)
+
+        ckan.datastore_delete.assert_called_once_with(name='task',
+                                                      resource_id=1)
+        ckan.datastore_create.assert_called_once_with(name='task',
+                                                      resource_id=1)
+        assert not ckan.resource_create.called
+        assert self.progress(app)['state'] == 'done'
+
+    @with_context
+    def test_it_records_connection_errors(self, Ckan, send_mail):
+        user = UserFactory.create(ckan_api='key')
+        app = AppFactory.create(owner=user)
+        Ckan.return_value.package_exists.return_value = (False,
+                                                         ConnectionError())
+
+        msg = export_to_ckan(app.id, 'task', user.id, app_url)
+
+        assert 'CKAN server seems to be down' in msg, msg
+        progress = self.progress(app)
+        assert progress['state'] == 'failed', progress
+        assert progress['error'] == msg, progress
+
+    @with_context
+    def test_it_sends_email_with_the_error(self, Ckan, send_mail):
+        user = UserFactory.create(ckan_api='key')
+        app = AppFactory.create(owner=user)
+        ckan = Ckan.return_value
+        ckan.package_exists.return_value = (None, None)
+        ckan.resource_create.return_value = dict(result=dict(id=3))
+        ckan.datastore_upsert.side_effect = Exception("CKAN: error",
+                                                      "error", 500)
+
+        export_to_ckan(app.id, 'task_run', user.id, app_url)
+
+        msg = 'Error: CKAN: error with status code: 500'
+        mail = send_mail.call_args[0][0]
+        assert mail['recipients'] == [user.email_addr], mail
+        assert msg in mail['body'], mail
+        assert self.progress(app, 'task_run')['error'] == msg
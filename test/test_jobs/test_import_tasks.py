@@ -16,20 +16,102 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+import tempfile
+
 from default import Test, db, with_context
-from pybossa.jobs import import_tasks
+from pybossa.core import sentinel
+from pybossa.jobs import import_tasks, import_tasks_chunk
+from pybossa.importers import remove_duplicates
+from pybossa.progress import JobProgress
 from pybossa.model.task import Task
 from factories import AppFactory, TaskFactory
-from mock import patch
+from mock import patch, Mock
+from requests.exceptions import ConnectionError
+
+
+def import_tasks_from(tasks_info, app_id, import_id=None):
+    # Chunks are inserted by the import job itself, instead of by workers
+    with patch('pybossa.importers.create_importer_for') as create_importer:
+        with patch('pybossa.jobs.IMPORT_MAX_PENDING_CHUNKS', 0):
+            create_importer.return_value.tasks.return_value = iter(tasks_info)
+            return import_tasks(app_id, import_id=import_id, type='csv',
+                                csv_url='http://fakecsv.com')
+
 
 class TestImportTasksJob(Test):
 
+    @with_context
+    @patch('pybossa.jobs.IMPORT_MAX_PENDING_CHUNKS', 0)
+    @patch('pybossa.jobs.send_mail')
+    @patch('pybossa.importers.requests.get')
+    def test_it_spools_and_parses_the_source(self, requests_get, send_mail):
+        app = AppFactory.create()
+        response = Mock(status_code=200, encoding=None,
+                        headers={'content-type': 'text/csv'})
+        response.iter_content.return_value = iter(['Foo,Bar\n1,', '2\n3,4\n'])
+        requests_get.return_value = response
+
+        import_tasks(app.id, type='csv', csv_url='http://fakecsv.com')
+
+        requests_get.assert_called_once_with('http://fakecsv.com', stream=True)
+        tasks = db.session.query(Task).order_by(Task.id).all()
+        assert [t.info for t in tasks] == [{'Foo': '1', 'Bar': '2'},
+                                           {'Foo': '3', 'Bar': '4'}], tasks
+
+
+    @with_context
+    @patch('pybossa.jobs.send_mail')
+    @patch('pybossa.importers.requests.get')
+    def test_sends_email_with_the_error_if_the_source_is_wrong(self, requests_get,
+                                                                send_mail):
+        app = AppFactory.create()
+        requests_get.return_value = Mock(status_code=403, encoding=None,
+                                         headers={'content-type': 'text/csv'})
+
+        msg = import_tasks(app.id, type='csv', csv_url='http://fakecsv.com')
+
+        assert "you don't have permission" in msg, msg
+        assert db.session.query(Task).count() == 0
+        assert send_mail.called
+
+    @with_context
+    @patch('pybossa.jobs.IMPORT_MAX_PENDING_CHUNKS', 0)
+    @patch('pybossa.jobs.send_mail')
+    def test_it_imports_and_removes_an_uploaded_file(self, send_mail):
+        app = AppFactory.create()
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write('{"Foo": 1}\n{"Foo": 2}\n')
+
+        import_tasks(app.id, type='upload', file_format='ndjson',
+                     file_path=path, uploaded=True)
+
+        tasks = db.session.query(Task).order_by(Task.id).all()
+        assert [t.info for t in tasks] == [{'Foo': 1}, {'Foo': 2}], tasks
+        assert not os.path.exists(path)
+
+    @with_context
+    @patch('pybossa.jobs.send_mail')
+    def test_it_removes_an_uploaded_file_that_is_wrong(self, send_mail):
+        app = AppFactory.create()
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write('not json\n')
+
+        msg = import_tasks(app.id, type='upload', file_format='ndjson',
+                           file_path=path, uploaded=True)
+
+        assert "Line 1 of the file is not a JSON object" in msg, msg
+        assert db.session.query(Task).count() == 0
+        assert not os.path.exists(path)
+
     @with_context
     def test_it_creates_the_new_tasks(self):
         app = AppFactory.create()
         tasks_info = [{'info': {'Bar': '2', 'Foo': '1', 'Baz': '3'}}]
 
-        import_tasks(tasks_info, app.id)
+        import_tasks_from(tasks_info, app.id)
 
         task = db.session.query(Task).first()
         assert task is not None, "No task was created"
@@ -42,12 +124,44 @@ class TestImportTasksJob(Test):
         app = AppFactory.create()
         task = TaskFactory.create(app=app, info=tasks_info[0]['info'])
 
-        import_tasks(tasks_info, app.id)
+        import_tasks_from(tasks_info, app.id)
 
         tasks = db.session.query(Task).all()
         assert len(tasks) == 1, tasks
 
 
+    @with_context
+    def test_it_does_not_create_duplicated_tasks_from_the_same_import(self):
+        tasks_info = [{'info': {'Foo': '1', 'Bar': '2'}},
+                      {'info': {'Bar': '2', 'Foo': '1'}},
+                      {'info': {'Foo': '3', 'Bar': '4'}}]
+        app = AppFactory.create()
+
+        msg = import_tasks_from(tasks_info, app.id)
+
+        tasks = db.session.query(Task).all()
+        assert len(tasks) == 2, tasks
+        assert '2 new tasks were imported successfully' in msg, msg
+
+
+    @with_context
+    def test_it_creates_the_tasks_in_batches(self):
+        from pybossa.core import task_repo
+        from pybossa.importers import create_tasks
+        tasks_info = [{'info': {'n': i}, 'n_answers': 2} for i in range(5)]
+        app = AppFactory.create()
+        TaskFactory.create(app=app, info={'n': 0})
+
+        with patch.object(task_repo, 'insert_tasks',
+                          wraps=task_repo.insert_tasks) as insert_tasks:
+            create_tasks(task_repo, tasks_info, app.id, batch_size=2)
+
+        assert insert_tasks.call_count == 3, insert_tasks.call_args_list
+        tasks = db.session.query(Task).filter_by(app_id=app.id).all()
+        assert len(tasks) == 5, tasks
+        assert all(t.info_hash for t in tasks), tasks
+
+
     @with_context
     @patch('pybossa.jobs.send_mail')
     def test_sends_email_to_user_with_result_on_success(self, send_mail):
@@ -58,7 +172,7 @@ class TestImportTasksJob(Test):
         email_data = dict(recipients=[app.owner.email_addr],
                           subject=subject, body=body)
 
-        import_tasks(tasks_info, app.id)
+        import_tasks_from(tasks_info, app.id)
 
         send_mail.assert_called_once_with(email_data)
 
@@ -74,6 +188,112 @@ class TestImportTasksJob(Test):
         email_data = dict(recipients=[app.owner.email_addr],
                           subject=subject, body=body)
 
-        import_tasks(tasks_info, app.id)
+        import_tasks_from(tasks_info, app.id)
 
         send_mail.assert_called_once_with(email_data)
+
+
+class TestImportTasksInChunks(Test):
+
+    def progress(self, import_id):
+        return JobProgress(sentinel.master, 'import', import_id).get()
+
+    @with_context
+    @patch('pybossa.jobs.send_mail')
+    @patch('pybossa.jobs.IMPORT_CHUNK_SIZE', 2)
+    def test_it_keeps_the_progress_of_the_import(self, send_mail):
+        app = AppFactory.create()
+        TaskFactory.create(app=app, info={'n': 0})
+        tasks_info = [{'info': {'n': i}} for i in range(5)] + [{'info': {'n': 4}}]
+
+        import_tasks_from(tasks_info, app.id, import_id='some-id')
+
+        progress = self.progress('some-id')
+        assert progress['state'] == 'done', progress
+        assert progress['n_parsed'] == 6, progress
+        assert progress['n_inserted'] == 4, progress
+        assert progress['n_skipped'] == 2, progress
+        assert progress['n_chunks'] == progress['n_chunks_done'] == 3, progress
+        assert send_mail.call_count == 1, send_mail.call_args_list
+
+    @with_context
+    @patch('pybossa.jobs.send_mail')
+    @patch('rq.Queue.enqueue')
+    def test_it_enqueues_the_chunks(self, enqueue, send_mail):
+        app = AppFactory.create()
+        tasks_info = [{'info': {'n': 1}}]
+
+        with patch('pybossa.importers.create_importer_for') as create_importer:
+            create_importer.return_value.tasks.return_value = iter(tasks_info)
+            msg = import_tasks(app.id, import_id='some-id', type='csv',
+                               csv_url='http://fakecsv.com')
+
+        assert msg is None, msg
+        args = enqueue.call_args[0]
+        assert args[0] == import_tasks_chunk, args
+        assert args[1:4] == (app.id, 'some-id', 0), args
+        assert db.session.query(Task).count() == 0
+        assert self.progress('some-id')['state'] == 'running'
+        assert not send_mail.called
+
+    @with_context
+    @patch('pybossa.jobs.send_mail')
+    @patch('pybossa.jobs.IMPORT_CHUNK_SIZE', 1)
+    def test_it_notifies_the_tasks_imported_before_an_error(self, send_mail):
+        app = AppFactory.create()
+
+        def tasks_info():
+            yield {'info': {'n': 1}}
+            raise ConnectionError('the source is down')
+
+        with self.assertRaises(ConnectionError):
+            import_tasks_from(tasks_info(), app.id, import_id='some-id')
+
+        progress = self.progress('some-id')
+        assert progress['state'] == 'failed', progress
+        assert 'the source is down' in progress['error'], progress
+        assert send_mail.call_count == 1, send_mail.call_args_list
+        body = send_mail.call_args[0][0]['body']
+        assert 'Only 1 new tasks were imported' in body, body
+
+    @with_context
+    @patch('pybossa.jobs.send_mail')
+    @patch('pybossa.importers.insert_new_tasks')
+    def test_a_failed_chunk_fails_the_import(self, insert_new_tasks,
+                                             send_mail):
+        app = AppFactory.create()
+        insert_new_tasks.side_effect = ValueError('wrong value')
+        JobProgress(sentinel.master, 'import', 'some-id').start(
+            app_id=app.id, n_parsed=2, n_inserted=0, n_skipped=0,
+            n_chunks_done=0)
+        tasks_data = remove_duplicates([{'info': {'n': 1}}], set())
+
+        with self.assertRaises(ValueError):
+            import_tasks_chunk(app.id, 'some-id', 0, tasks_data)
+        insert_new_tasks.side_effect = None
+        assert import_tasks_chunk(app.id, 'some-id', 1, tasks_data) == 0
+
+        progress = self.progress('some-id')
+        assert progress['state'] == 'failed', progress
+        assert send_mail.call_count == 1, send_mail.call_args_list
+        body = send_mail.call_args[0][0]['body']
+        assert 'Nothing was imported' in body, body
+        assert insert_new_tasks.call_count == 1, insert_new_tasks.call_count
+
+    @with_context
+    @patch('pybossa.jobs.send_mail')
+    def test_retried_chunks_are_not_inserted_twice(self, send_mail):
+        app = AppFactory.create()
+        JobProgress(sentinel.master, 'import', 'some-id').start(
+            app_id=app.id, n_parsed=1, n_inserted=0, n_skipped=0,
+            n_chunks_done=0)
+        tasks_data = remove_duplicates([{'info': {'n': 1}}], set())
+
+        import_tasks_chunk(app.id, 'some-id', 0, tasks_data)
+        import_tasks_chunk(app.id, 'some-id', 0, tasks_data)
+
+        assert db.session.query(Task).count() == 1
+        progress = self.progress('some-id')
+        assert progress['n_inserted'] == 1, progress
+        assert progress['n_chunks_done'] == 1, progress
+
@@ -0,0 +1,71 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from default import Test, db, with_context
+from pybossa.core import project_repo, sentinel
+from pybossa.jobs import rebuild_results
+from pybossa.progress import JobProgress
+from pybossa.model.result import Result
+from factories import AppFactory, TaskFactory, TaskRunFactory
+from mock import patch
+
+
+class TestRebuildResultsJob(Test):
+
+    @with_context
+    @patch('pybossa.jobs.RESULTS_BATCH_SIZE', 2)
+    def test_it_rebuilds_the_results_with_the_new_keys(self):
+        app = AppFactory.create(info={'result_keys': ['answer']})
+        tasks = TaskFactory.create_batch(3, app=app, n_answers=3)
+        TaskRunFactory.create(task=tasks[0], info={'answer': 'yes', 'n': 1})
+        TaskRunFactory.create(task=tasks[0], info={'answer': 'no', 'n': 1})
+        TaskRunFactory.create(task=tasks[2], info={'answer': 'yes', 'n': 2})
+        app.info = {'result_keys': ['n']}
+        project_repo.update(app)
+
+        n = rebuild_results(app.id)
+
+        assert n == 3, n
+        results = db.session.query(Result).order_by(Result.task_id).all()
+        assert [r.task_id for r in results] == [tasks[0].id, tasks[2].id]
+        assert [r.n_answers for r in results] == [2, 1], results
+        assert [r.info for r in results] == [{'n': {'1': 2}},
+                                             {'n': {'2': 1}}], results
+
+    @with_context
+    def test_it_deletes_the_results_without_keys(self):
+        app = AppFactory.create(info={'result_keys': ['answer']})
+        task = TaskFactory.create(app=app)
+        TaskRunFactory.create(task=task, info={'answer': 'yes'})
+        app.info = {}
+        project_repo.update(app)
+
+        rebuild_results(app.id)
+
+        assert db.session.query(Result).count() == 0
+
+    @with_context
+    def test_it_keeps_the_progress_of_the_rebuild(self):
+        app = AppFactory.create()
+        TaskFactory.create_batch(3, app=app)
+
+        rebuild_results(app.id)
+
+        progress = JobProgress(sentinel.master, 'results', app.id).get()
+        assert progress['state'] == 'done', progress
+        assert progress['n_tasks'] == 3, progress
@@ -0,0 +1,70 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from default import Test, db, with_context
+from pybossa.core import sentinel
+from pybossa.jobs import update_tasks_redundancy
+from pybossa.progress import JobProgress
+from pybossa.model.task import Task
+from factories import AppFactory, TaskFactory, TaskRunFactory
+from mock import patch
+
+
+class TestUpdateTasksRedundancyJob(Test):
+
+    @with_context
+    @patch('pybossa.jobs.REDUNDANCY_BATCH_SIZE', 2)
+    def test_it_updates_the_redundancy_and_state_of_the_tasks(self):
+        app = AppFactory.create()
+        tasks = TaskFactory.create_batch(3, app=app, n_answers=3)
+        TaskRunFactory.create(task=tasks[0])
+
+        n = update_tasks_redundancy(app.id, 1)
+
+        assert n == 3, n
+        tasks = db.session.query(Task).filter_by(app_id=app.id).order_by(
+            Task.id).all()
+        assert [t.n_answers for t in tasks] == [1, 1, 1], tasks
+        assert [t.state for t in tasks] == ['completed', 'ongoing',
+                                            'ongoing'], tasks
+
+    @with_context
+    @patch('pybossa.jobs.REDUNDANCY_BATCH_SIZE', 2)
+    def test_it_keeps_the_progress_of_the_update(self):
+        app = AppFactory.create()
+        TaskFactory.create_batch(3, app=app)
+
+        update_tasks_redundancy(app.id, 5)
+
+        progress = JobProgress(sentinel.master, 'redundancy', app.id).get()
+        assert progress['state'] == 'done', progress
+        assert progress['n_updated'] == 3, progress
+        assert progress['n_answers'] == 5, progress
+
+    @with_context
+    @patch('pybossa.cache.apps.delete_n_completed_tasks')
+    @patch('pybossa.cache.apps.delete_overall_progress')
+    def test_it_deletes_the_cached_progress_of_the_project(self,
+                                                           delete_progress,
+                                                           delete_completed):
+        app = AppFactory.create()
+
+        update_tasks_redundancy(app.id, 5)
+
+        delete_progress.assert_called_once_with(app.id)
+        delete_completed.assert_called_once_with(app.id)
@@ -18,6 +18,9 @@
 
 from default import Test, db, with_context
 from nose.tools import raises
+from mock import patch
+from factories import AppFactory, TaskFactory
+from pybossa.model import bulk_operation
 from pybossa.model.user import User
 from pybossa.model.app import App
 from pybossa.model.task import Task
@@ -98,3 +101,65 @@ class TestModelBase(Test):
         assert outrun.user.name == username, outrun
 
 
+
+
+@patch('pybossa.model.task.update_app_timestamp')
+@patch('pybossa.model.task.update_redis')
+class TestBulkOperation(Test):
+
+    @with_context
+    def test_task_events_are_collapsed_per_project(self, update_redis,
+                                                   update_app):
+        """Test bulk_operation fires the task events once per project"""
+        app = AppFactory.create()
+        other_app = AppFactory.create()
+        with bulk_operation():
+            TaskFactory.create_batch(3, app=app)
+            TaskFactory.create(app=other_app)
+            assert not update_redis.called
+            assert not update_app.called
+
+        assert update_redis.call_count == 2, update_redis.call_args_list
+        app_ids = sorted(c[0][2].app_id for c in update_app.call_args_list)
+        assert app_ids == [app.id, other_app.id], app_ids
+
+    @with_context
+    def test_events_are_fired_for_every_task_out_of_bulk_operation(
+            self, update_redis, update_app):
+        """Test task events are fired for every task outside bulk_operation"""
+        app = AppFactory.create()
+        TaskFactory.create_batch(3, app=app)
+
+        assert update_redis.call_count == 3, update_redis.call_args_list
+        assert update_app.call_count == 3, update_app.call_args_list
+
+    @with_context
+    def test_events_are_dropped_if_the_operation_fails(self, update_redis,
+                                                       update_app):
+        """Test bulk_operation does not fire the events after an error"""
+        app = AppFactory.create()
+        try:
+            with bulk_operation():
+                TaskFactory.create(app=app)
+                raise ValueError
+        except ValueError:
+            pass
+
+        assert not update_redis.called
+        assert not update_app.called
+
+    @with_context
+    def test_events_can_be_fired_if_the_operation_fails(self, update_redis,
+                                                        update_app):
+        """Test bulk_operation fires the events of the work committed before
+        an error if fire_on_error is set"""
+        app = AppFactory.create()
+        try:
+            with bulk_operation(fire_on_error=True):
+                TaskFactory.create(app=app)
+                raise ValueError
+        except ValueError:
+            pass
+
+        assert update_redis.call_count == 1, update_redis.call_args_list
+        assert update_app.call_count == 1, update_app.call_args_list
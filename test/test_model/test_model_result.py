@@ -0,0 +1,97 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from default import Test, db, with_context
+from factories import AppFactory, TaskFactory, TaskRunFactory
+from pybossa.core import task_repo
+from pybossa.model.result import Result, add_answer, remove_answer
+
+
+class TestModelResult(Test):
+
+    def test_add_answer_counts_the_configured_keys(self):
+        """Test add_answer only counts the values of the given keys"""
+        frequencies = add_answer({}, {'answer': 'yes', 'other': 1},
+                                 ['answer'])
+        frequencies = add_answer(frequencies, {'answer': 'yes'}, ['answer'])
+        frequencies = add_answer(frequencies, {'answer': 'no'}, ['answer'])
+
+        assert frequencies == {'answer': {'yes': 2, 'no': 1}}, frequencies
+
+    def test_add_answer_serializes_non_string_values(self):
+        """Test add_answer uses the JSON of non string values as keys"""
+        frequencies = add_answer({}, {'point': {'y': 2, 'x': 1}, 'n': 3},
+                                 ['point', 'n'])
+
+        assert frequencies == {'point': {'{"x": 1, "y": 2}': 1},
+                               'n': {'3': 1}}, frequencies
+
+    def test_add_answer_ignores_non_dict_answers(self):
+        """Test add_answer does nothing if the answer is not a dict"""
+        assert add_answer({}, 'yes', ['answer']) == {}
+
+    def test_remove_answer_removes_the_values_without_answers(self):
+        """Test remove_answer decrements the values of the given keys and
+        removes the ones that are no longer answered"""
+        frequencies = {'answer': {'yes': 2, 'no': 1}}
+        frequencies = remove_answer(frequencies, {'answer': 'yes'}, ['answer'])
+        assert frequencies == {'answer': {'yes': 1, 'no': 1}}, frequencies
+
+        frequencies = remove_answer(frequencies, {'answer': 'no'}, ['answer'])
+        frequencies = remove_answer(frequencies, {'answer': 'yes'}, ['answer'])
+        assert frequencies == {}, frequencies
+
+    @with_context
+    def test_result_is_updated_when_task_runs_are_created(self):
+        """Test a Result aggregates the answers of the task runs"""
+        app = AppFactory.create(info={'result_keys': ['answer']})
+        task = TaskFactory.create(app=app, n_answers=3)
+        TaskRunFactory.create(task=task, info={'answer': 'yes'})
+        TaskRunFactory.create(task=task, info={'answer': 'yes'})
+        TaskRunFactory.create(task=task, info={'answer': 'no'})
+
+        results = db.session.query(Result).all()
+        assert len(results) == 1, results
+        assert results[0].task_id == task.id, results[0]
+        assert results[0].n_answers == 3, results[0]
+        assert results[0].info == {'answer': {'yes': 2, 'no': 1}}
+
+    @with_context
+    def test_no_result_without_result_keys(self):
+        """Test no Result is created if the project has no result_keys"""
+        task = TaskFactory.create()
+        TaskRunFactory.create(task=task, info={'answer': 'yes'})
+
+        assert db.session.query(Result).count() == 0
+
+    @with_context
+    def test_result_is_updated_when_task_runs_are_deleted(self):
+        """Test the answer of a deleted task run is removed from the Result,
+        which is deleted with the last answer"""
+        app = AppFactory.create(info={'result_keys': ['answer']})
+        task = TaskFactory.create(app=app, n_answers=3)
+        yes = TaskRunFactory.create(task=task, info={'answer': 'yes'})
+        no = TaskRunFactory.create(task=task, info={'answer': 'no'})
+
+        task_repo.delete(yes)
+        result = db.session.query(Result).one()
+        assert result.n_answers == 1, result
+        assert result.info == {'answer': {'no': 1}}, result.info
+
+        task_repo.delete(no)
+        assert db.session.query(Result).count() == 0
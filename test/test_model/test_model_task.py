@@ -23,6 +23,7 @@ from pybossa.model.user import User
 from pybossa.model.app import App
 from pybossa.model.task import Task
 from pybossa.model.category import Category
+from factories import TaskFactory
 
 
 class TestModelTask(Test):
@@ -49,3 +50,18 @@ class TestModelTask(Test):
         db.session.add(task)
         assert_raises(IntegrityError, db.session.commit)
         db.session.rollback()
+
+
+    @with_context
+    def test_info_hash_is_updated_with_info(self):
+        """Test TASK info_hash does not depend on the order of the keys and
+        changes with the info"""
+        task = TaskFactory.create(info={'a': 1, 'b': 2})
+        same = TaskFactory.create(info={'b': 2, 'a': 1})
+        assert task.info_hash == same.info_hash, (task.info_hash, same.info_hash)
+
+        old_hash = task.info_hash
+        task.info = {'a': 3}
+        db.session.commit()
+        assert task.info_hash != old_hash, task.info_hash
+
@@ -0,0 +1,61 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from default import Test, sentinel
+from pybossa.progress import JobProgress
+
+
+class TestJobProgress(Test):
+
+    def setUp(self):
+        super(TestJobProgress, self).setUp()
+        self.progress = JobProgress(sentinel.master, 'import', 1)
+
+    def test_get_returns_none_if_not_started(self):
+        assert self.progress.get() is None
+
+    def test_start_incr_and_finish(self):
+        self.progress.start(total=10)
+        self.progress.incr('done', 4)
+        self.progress.incr('done', 2)
+        record = self.progress.get()
+        assert record['state'] == 'running', record
+        assert record['total'] == 10, record
+        assert record['done'] == 6, record
+
+        self.progress.finish()
+        assert self.progress.get()['state'] == 'done'
+
+    def test_finish_with_error(self):
+        self.progress.start()
+        self.progress.finish(error='boom')
+        record = self.progress.get()
+        assert record['state'] == 'failed', record
+        assert record['error'] == 'boom', record
+
+    def test_start_resets_the_record(self):
+        self.progress.start(done=3)
+        self.progress.start(state='queued')
+        record = self.progress.get()
+        assert 'done' not in record, record
+        assert record['state'] == 'queued', record
+
+    def test_records_expire(self):
+        self.progress.start()
+        ttl = sentinel.master.ttl(self.progress.key)
+        assert 0 < ttl <= JobProgress.expiration, ttl
@@ -23,10 +23,13 @@ API endpoints like userprogress or vmcp.
 
 """
 import json
+import time
 
 from default import flask_app, sentinel
 from factories import AppFactory, UserFactory
 from mock import patch
+from pybossa.core import ratelimits
+from pybossa.ratelimit import RateLimit, blocked_clients
 
 
 class TestAPI(object):
@@ -35,6 +38,7 @@ class TestAPI(object):
 
     def setUp(self):
         sentinel.connection.master_for('mymaster').flushall()
+        blocked_clients.clear()
 
     limit = flask_app.config.get('LIMIT')
 
@@ -138,3 +142,53 @@ class TestAPI(object):
 
         url = '/api/app/1/userprogress'
         self.check_limit(url, 'get', 'app')
+
+    def test_06_trusted_api_key(self):
+        """Test API rate limit uses the quota of trusted API keys."""
+        quota = {'trusted-key': (self.limit * 2, 15 * 60)}
+        with patch.dict(ratelimits['API_KEYS'], quota):
+            res = self.app.get('/api/vmcp?api_key=trusted-key')
+            assert res.headers['X-RateLimit-Limit'] == str(self.limit * 2)
+            remaining = int(res.headers['X-RateLimit-Remaining'])
+            assert remaining == self.limit * 2 - 1, remaining
+
+            res = self.app.get('/api/vmcp')
+            assert res.headers['X-RateLimit-Limit'] == str(self.limit)
+            remaining = int(res.headers['X-RateLimit-Remaining'])
+            assert remaining == self.limit - 1, remaining
+
+
+class TestRateLimit(object):
+
+    def setUp(self):
+        sentinel.connection.master_for('mymaster').flushall()
+        blocked_clients.clear()
+
+    def test_previous_window_counts_in_the_sliding_window(self):
+        """Test RateLimit weights the requests of the previous window."""
+        per = 15 * 60
+        window = (int(time.time()) // per) * per
+        sentinel.master.set('rate-limit/test/%s' % (window - per), 1000)
+
+        with patch('pybossa.ratelimit.time.time', return_value=window + 450):
+            limit = RateLimit('rate-limit/test/', 10, per, True)
+
+        assert limit.over_limit
+        assert limit.remaining == 0, limit.remaining
+        assert limit.reset == window + 891, limit.reset
+        assert sentinel.master.get('rate-limit/test/%s' % window) is None
+
+    def test_over_limit_clients_are_rejected_locally(self):
+        """Test RateLimit does not contact Redis for blocked clients."""
+        for i in range(3):
+            limit = RateLimit('rate-limit/test/', 3, 60, True)
+        assert limit.over_limit
+
+        with patch('pybossa.ratelimit._sliding_window_script') as script:
+            limit = RateLimit('rate-limit/test/', 3, 60, True)
+            assert limit.over_limit
+            assert not script.called
+
+        blocked_clients['rate-limit/test/'] = time.time() - 1
+        limit = RateLimit('rate-limit/test/', 3, 60, True)
+        assert limit.over_limit
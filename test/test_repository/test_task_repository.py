@@ -19,8 +19,10 @@
 
 from default import Test, db
 from nose.tools import assert_raises
+from mock import patch
 from factories import TaskFactory, TaskRunFactory, AppFactory
 from pybossa.repositories import TaskRepository
+from pybossa.model.task import make_info_hash
 from pybossa.exc import WrongObjectError, DBIntegrityError
 
 
@@ -136,6 +138,17 @@ class TestTaskRepositoryForTaskQueries(Test):
         assert last_two == all_tasks[2:]
 
 
+    def test_filter_tasks_by_last_id(self):
+        """Test that filter_tasks_by supports keyset pagination with the
+        last_id option"""
+
+        tasks = TaskFactory.create_batch(4)
+
+        retrieved_tasks = self.task_repo.filter_tasks_by(last_id=tasks[1].id)
+
+        assert retrieved_tasks == tasks[2:], retrieved_tasks
+
+
     def test_count_tasks_with_no_matches(self):
         """Test count_tasks_with returns 0 if no tasks match the query"""
 
@@ -171,6 +184,54 @@ class TestTaskRepositoryForTaskQueries(Test):
 
 
 
+    def test_get_info_hashes(self):
+        """Test get_info_hashes returns the given hashes that belong to tasks
+        of the project"""
+
+        task = TaskFactory.create(info={'foo': 'bar'})
+        other = TaskFactory.create(info={'foo': 'baz'})
+
+        hashes = self.task_repo.get_info_hashes(
+            task.app_id, [task.info_hash, other.info_hash, 'missing'])
+
+        assert hashes == set([task.info_hash]), hashes
+
+
+    def test_insert_tasks(self):
+        """Test insert_tasks creates the tasks of the project with their info
+        hash and the default values"""
+
+        app = AppFactory.create()
+
+        n = self.task_repo.insert_tasks(app.id, [{'info': {'a': 1}},
+                                                 {'info': {'a': 2},
+                                                  'n_answers': 5}])
+
+        tasks = sorted(self.task_repo.filter_tasks_by(app_id=app.id),
+                       key=lambda t: t.info['a'])
+        assert n == 2, n
+        assert [t.info for t in tasks] == [{'a': 1}, {'a': 2}], tasks
+        assert [t.n_answers for t in tasks] == [30, 5], tasks
+        assert tasks[0].info_hash == make_info_hash({'a': 1}), tasks[0]
+        assert tasks[0].state == 'ongoing', tasks[0]
+
+
+    def test_insert_tasks_returning_ids(self):
+        """Test insert_tasks_returning_ids returns the ids of the tasks in
+        the same order"""
+
+        app = AppFactory.create()
+        TaskFactory.create()
+
+        ids = self.task_repo.insert_tasks_returning_ids(
+            app.id, [{'info': {'a': 1}}, {'info': {'a': 2}}])
+
+        tasks = [self.task_repo.get_task(id) for id in ids]
+        assert [t.info for t in tasks] == [{'a': 1}, {'a': 2}], tasks
+        assert self.task_repo.insert_tasks_returning_ids(app.id, []) == []
+
+
+
 class TestTaskRepositoryForTaskrunQueries(Test):
 
     def setUp(self):
@@ -285,6 +346,30 @@ class TestTaskRepositoryForTaskrunQueries(Test):
         assert last_two == all_task_runs[2:]
 
 
+    def test_filter_task_runs_by_last_id(self):
+        """Test that filter_task_runs_by supports keyset pagination with the
+        last_id option"""
+
+        task_runs = TaskRunFactory.create_batch(4)
+
+        retrieved = self.task_repo.filter_task_runs_by(last_id=task_runs[1].id)
+
+        assert retrieved == task_runs[2:], retrieved
+
+
+    def test_get_last_task_run_id(self):
+        """Test get_last_task_run_id returns the highest id of the task runs
+        matching the filters, or None"""
+
+        task_runs = TaskRunFactory.create_batch(3)
+
+        last_id = self.task_repo.get_last_task_run_id(app_id=task_runs[0].app_id)
+        no_id = self.task_repo.get_last_task_run_id(app_id=1000)
+
+        assert last_id == task_runs[0].id, last_id
+        assert no_id is None, no_id
+
+
     def test_count_task_runs_with_no_matches(self):
         """Test count_task_runs_with returns 0 if no taskruns match the query"""
 
@@ -320,6 +405,46 @@ class TestTaskRepositoryForTaskrunQueries(Test):
 
 
 
+class TestTaskRepositoryForResultQueries(Test):
+
+    def setUp(self):
+        super(TestTaskRepositoryForResultQueries, self).setUp()
+        self.task_repo = TaskRepository(db)
+        self.app = AppFactory.create(info={'result_keys': ['answer']})
+
+
+    def test_get_result_by(self):
+        """Test get_result_by returns the Result of a task, or None"""
+
+        task = TaskFactory.create(app=self.app)
+        TaskRunFactory.create(task=task, info={'answer': 'yes'})
+
+        result = self.task_repo.get_result_by(task_id=task.id)
+        no_result = self.task_repo.get_result_by(task_id=1000)
+
+        assert result.info == {'answer': {'yes': 1}}, result
+        assert no_result is None, no_result
+
+
+    def test_filter_results_by_and_count_results_with(self):
+        """Test filter_results_by and count_results_with return the Results
+        of the project ordered by id"""
+
+        tasks = TaskFactory.create_batch(3, app=self.app)
+        for task in tasks:
+            TaskRunFactory.create(task=task, info={'answer': 'yes'})
+
+        results = self.task_repo.filter_results_by(app_id=self.app.id)
+        after = self.task_repo.filter_results_by(app_id=self.app.id,
+                                                 last_id=results[0].id)
+
+        assert [r.task_id for r in results] == [t.id for t in tasks], results
+        assert after == results[1:], after
+        assert self.task_repo.count_results_with(app_id=self.app.id) == 3
+        assert self.task_repo.get_last_result_id(app_id=self.app.id) == results[-1].id
+
+
+
 class TestTaskRepositorySaveDeleteUpdate(Test):
 
     def setUp(self):
@@ -433,6 +558,25 @@ class TestTaskRepositorySaveDeleteUpdate(Test):
         assert deleted is None, deleted
 
 
+    @patch('pybossa.model.task_run.update_app_timestamp')
+    @patch('pybossa.model.task.update_app_timestamp')
+    def test_delete_task_updates_the_project_once(self, task_update_app,
+                                                  task_run_update_app):
+        """Test delete updates the project once for the task and its task
+        runs"""
+
+        task = TaskFactory.create()
+        TaskRunFactory.create_batch(3, task=task)
+        task_update_app.reset_mock()
+        task_run_update_app.reset_mock()
+
+        self.task_repo.delete(task)
+
+        assert task_update_app.call_count == 1, task_update_app.call_count
+        assert task_run_update_app.call_count == 1, \
+            task_run_update_app.call_count
+
+
     def test_delete_taskrun(self):
         """Test delete removes the TaskRun instance"""
 
@@ -496,6 +640,98 @@ class TestTaskRepositorySaveDeleteUpdate(Test):
         assert_raises(WrongObjectError, self.task_repo.delete_all, bad_objects)
 
 
+    def test_delete_tasks_batch_deletes_tasks_and_taskruns_of_project(self):
+        """Test delete_tasks_batch deletes up to size tasks of the project,
+        with their taskruns"""
+
+        project = AppFactory.create()
+        tasks = TaskFactory.create_batch(3, app=project)
+        TaskRunFactory.create_batch(2, task=tasks[0])
+        other = TaskFactory.create()
+
+        deleted = self.task_repo.delete_tasks_batch(project.id, size=2)
+
+        assert deleted == (2, 2), deleted
+        remaining = self.task_repo.filter_tasks_by(app_id=project.id)
+        assert [t.id for t in remaining] == [tasks[2].id], remaining
+        assert self.task_repo.count_task_runs_with(app_id=project.id) == 0
+        assert self.task_repo.get_task(other.id) is not None
+
+
+    def test_delete_tasks_batch_returns_zero_if_no_tasks_left(self):
+        """Test delete_tasks_batch returns no deleted tasks once the project
+        has no tasks"""
+
+        project = AppFactory.create()
+
+        assert self.task_repo.delete_tasks_batch(project.id) == (0, 0)
+
+
+    def test_update_tasks_updates_the_given_tasks(self):
+        """Test update_tasks sets the values of the project tasks with the
+        given ids, in chunks"""
+
+        project = AppFactory.create()
+        tasks = TaskFactory.create_batch(3, app=project, priority_0=0.0)
+        other = TaskFactory.create(priority_0=0.0)
+        task_ids = [tasks[0].id, tasks[1].id, other.id]
+
+        n = self.task_repo.update_tasks(project, {'priority_0': 0.5},
+                                        task_ids=task_ids, chunk_size=1)
+
+        assert n == 2, n
+        priorities = [self.task_repo.get_task(t.id).priority_0
+                      for t in tasks + [other]]
+        assert priorities == [0.5, 0.5, 0.0, 0.0], priorities
+
+
+    def test_update_tasks_updates_the_filtered_tasks_and_state(self):
+        """Test update_tasks sets the values of the project tasks that match
+        the filters, and updates their state with the new n_answers"""
+
+        project = AppFactory.create()
+        tasks = TaskFactory.create_batch(2, app=project, n_answers=2)
+        tasks.append(TaskFactory.create(app=project, n_answers=2,
+                                        priority_0=1.0))
+        TaskRunFactory.create(task=tasks[0])
+
+        n = self.task_repo.update_tasks(project, {'n_answers': 1},
+                                        chunk_size=1, priority_0=0.0)
+
+        assert n == 2, n
+        states = [self.task_repo.get_task(t.id).state for t in tasks]
+        n_answers = [self.task_repo.get_task(t.id).n_answers for t in tasks]
+        assert states == ['completed', 'ongoing', 'ongoing'], states
+        assert n_answers == [1, 1, 2], n_answers
+
+
+    def test_update_tasks_raises_error_for_other_attributes(self):
+        """Test update_tasks raises a ValueError if the values are not
+        priority_0, n_answers or state"""
+
+        project = AppFactory.create()
+
+        assert_raises(ValueError, self.task_repo.update_tasks, project,
+                      {'info': {}})
+        assert_raises(ValueError, self.task_repo.update_tasks, project,
+                      {'state': 'wrong'})
+
+
+    def test_update_tasks_raises_error_for_wrong_values(self):
+        """Test update_tasks raises a ValueError before updating any task if
+        priority_0 is not a number or n_answers is not a positive integer"""
+
+        project = AppFactory.create()
+        task = TaskFactory.create(app=project, priority_0=0.0)
+
+        for values in ({'priority_0': 'high'}, {'n_answers': 'x'},
+                       {'n_answers': 1.5}, {'n_answers': 0},
+                       {'priority_0': 0.5, 'n_answers': None}):
+            assert_raises(ValueError, self.task_repo.update_tasks, project,
+                          values, task_ids=[task.id])
+        assert self.task_repo.get_task(task.id).priority_0 == 0.0
+
+
     def test_update_tasks_redundancy_changes_all_project_tasks_redundancy(self):
         """Test update_tasks_redundancy updates the n_answers value for every
         task in the project"""
@@ -530,6 +766,23 @@ class TestTaskRepositorySaveDeleteUpdate(Test):
             assert task.state == 'ongoing', task.state
 
 
+    def test_update_tasks_redundancy_updates_tasks_in_chunks(self):
+        """Test update_tasks_redundancy updates the tasks in chunks and
+        reports the progress of every chunk"""
+
+        project = AppFactory.create()
+        TaskFactory.create_batch(3, app=project, n_answers=1)
+        other = TaskFactory.create(n_answers=1)
+        progress = []
+
+        n = self.task_repo.update_tasks_redundancy(project, 2, chunk_size=2,
+                                                   progress=progress.append)
+
+        assert n == 3, n
+        assert progress == [2, 1], progress
+        assert self.task_repo.get_task(other.id).n_answers == 1
+
+
     def test_update_tasks_redundancy_updates_state_when_decrementing(self):
         """Test update_tasks_redundancy changes 'ongoing' tasks to 'completed'
         if n_answers is decremented enough"""
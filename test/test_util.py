@@ -222,3 +222,19 @@ class TestWithCacheDisabledDecorator(object):
         left_value = os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED')
 
         assert left_value == original_value, left_value
+
+
+    def test_project_fields_returns_item_if_no_fields(self):
+        item = {'id': 1, 'info': {'answer': 'yes'}}
+
+        assert util.project_fields(item) == item, util.project_fields(item)
+        assert util.project_fields(item, []) == item
+
+
+    def test_project_fields_selects_fields_and_info_keys(self):
+        item = {'id': 1, 'task_id': 2, 'info': {'answer': 'yes', 'foo': 'bar'}}
+
+        projected = util.project_fields(item, ['task_id', 'info.answer',
+                                               'info.missing', 'missing'])
+
+        assert projected == {'task_id': 2, 'info': {'answer': 'yes'}}, projected
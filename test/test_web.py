@@ -17,6 +17,7 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
 import json
+import os
 import StringIO
 
 from default import db, Fixtures, with_context
@@ -25,7 +26,8 @@ from mock import patch, Mock
 from flask import Response, redirect
 from itsdangerous import BadSignature
 from collections import namedtuple
-from pybossa.core import signer
+from pybossa.core import signer, sentinel
+from pybossa.progress import JobProgress
 from pybossa.util import unicode_csv_reader
 from pybossa.util import get_user_signup_method
 from pybossa.ckan import Ckan
@@ -33,6 +35,7 @@ from bs4 import BeautifulSoup
 from requests.exceptions import ConnectionError
 from werkzeug.exceptions import NotFound
 from pybossa.model.app import App
+from pybossa.model.auditlog import Auditlog
 from pybossa.model.category import Category
 from pybossa.model.task import Task
 from pybossa.model.task_run import TaskRun
@@ -41,7 +44,14 @@ from pybossa.jobs import send_mail, import_tasks
 from factories import AppFactory, CategoryFactory, TaskFactory, TaskRunFactory
 
 
-FakeRequest = namedtuple('FakeRequest', ['text', 'status_code', 'headers'])
+class FakeRequest(namedtuple('FakeRequest', ['text', 'status_code', 'headers'])):
+    encoding = None
+
+    def iter_content(self, chunk_size=1):
+        yield self.text
+
+    def close(self):
+        pass
 
 
 class TestWeb(web.Helper):
@@ -2310,6 +2320,93 @@ class TestWeb(web.Helper):
         content_disposition = 'attachment; filename=test-app_task_run.json'
         assert res.headers.get('Content-Disposition') == content_disposition, res.headers
 
+    def test_export_taskruns_ndjson(self):
+        """Test WEB export Task Runs to NDJSON returns one object per line"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app)
+        task_runs = TaskRunFactory.create_batch(3, app=app, task=task,
+                                                info={'answer': 'yes'})
+        uri = "/app/%s/tasks/export?type=task_run&format=ndjson" % app.short_name
+
+        res = self.app.get(uri, follow_redirects=True)
+        lines = res.data.splitlines()
+
+        assert len(lines) == 3, lines
+        assert [json.loads(l)['id'] for l in lines] == [tr.id for tr in task_runs]
+        content_disposition = 'attachment; filename=%s_task_run.ndjson' % app.short_name
+        assert res.headers.get('Content-Disposition') == content_disposition, res.headers
+
+    def test_export_taskruns_ndjson_fields_and_since(self):
+        """Test WEB export Task Runs to NDJSON supports fields and since"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app)
+        task_runs = TaskRunFactory.create_batch(3, app=app, task=task,
+                                                info={'answer': 'yes', 'a': 1})
+        uri = ("/app/%s/tasks/export?type=task_run&format=ndjson"
+               "&fields=task_id,info.answer&since=%s" % (app.short_name,
+                                                        task_runs[0].id))
+
+        res = self.app.get(uri, follow_redirects=True)
+        lines = [json.loads(l) for l in res.data.splitlines()]
+
+        assert len(lines) == 2, lines
+        for line in lines:
+            assert line == {'task_id': task.id, 'info': {'answer': 'yes'}}, line
+
+    def test_export_taskruns_json_since_returns_delta_and_next_cursor(self):
+        """Test WEB export Task Runs to JSON with a since cursor returns only
+        the newer task runs and the next cursor"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app)
+        task_runs = TaskRunFactory.create_batch(3, app=app, task=task)
+        uri = ("/app/%s/tasks/export?type=task_run&format=json&since=%s"
+               % (app.short_name, task_runs[0].id))
+
+        res = self.app.get(uri, follow_redirects=True)
+        exported = json.loads(res.data)
+
+        assert [tr['id'] for tr in exported] == [tr.id for tr in task_runs[1:]]
+        assert res.headers.get('X-Next-Cursor') == str(task_runs[-1].id), res.headers
+
+    def test_export_taskruns_csv_since_without_new_data(self):
+        """Test WEB export Task Runs to CSV with an up to date cursor returns
+        no rows and the same cursor"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app)
+        task_run = TaskRunFactory.create(app=app, task=task)
+        uri = ("/app/%s/tasks/export?type=task_run&format=csv&since=%s"
+               % (app.short_name, task_run.id))
+
+        res = self.app.get(uri, follow_redirects=True)
+
+        assert res.data == '', res.data
+        assert res.headers.get('X-Next-Cursor') == str(task_run.id), res.headers
+
+    def test_export_ndjson_invalid_since(self):
+        """Test WEB export to NDJSON returns 404 for a wrong since value"""
+        app = AppFactory.create()
+        uri = ("/app/%s/tasks/export?type=task&format=ndjson&since=abc"
+               % app.short_name)
+
+        res = self.app.get(uri, follow_redirects=True)
+
+        assert res.status_code == 404, res.status_code
+
+    @with_context
+    def test_export_results_json(self):
+        """Test WEB export Results to JSON returns one row per task"""
+        app = AppFactory.create(info={'result_keys': ['answer']})
+        task = TaskFactory.create(app=app)
+        TaskRunFactory.create_batch(3, task=task, info={'answer': 'yes'})
+        uri = "/app/%s/tasks/export?type=result&format=json" % app.short_name
+
+        res = self.app.get(uri, follow_redirects=True)
+        results = json.loads(res.data)
+
+        assert len(results) == 1, results
+        assert results[0]['task_id'] == task.id, results
+        assert results[0]['info'] == {'answer': {'yes': 3}}, results
+
     @with_context
     @patch('pybossa.view.applications.uploader.upload_file', return_value=True)
     def test_52_export_task_csv(self, mock):
@@ -2461,168 +2558,10 @@ class TestWeb(web.Helper):
         assert res.headers.get('Content-Disposition') == content_disposition, res.headers
 
     @with_context
-    @patch('pybossa.view.applications.Ckan', autospec=True)
-    def test_export_tasks_ckan_exception(self, mock1):
-        mocks = [Mock()]
-        from test_ckan import TestCkanModule
-        fake_ckn = TestCkanModule()
-        package = fake_ckn.pkg_json_found
-        package['id'] = 3
-        mocks[0].package_exists.return_value = (False,
-                                                Exception("CKAN: error",
-                                                          "error", 500))
-        # mocks[0].package_create.return_value = fake_ckn.pkg_json_found
-        # mocks[0].resource_create.return_value = dict(result=dict(id=3))
-        # mocks[0].datastore_create.return_value = 'datastore'
-        # mocks[0].datastore_upsert.return_value = 'datastore'
-
-        mock1.side_effect = mocks
-
-        """Test WEB Export CKAN Tasks works."""
-        Fixtures.create()
-        user = db.session.query(User).filter_by(name=Fixtures.name).first()
-        app = db.session.query(App).first()
-        user.ckan_api = 'ckan-api-key'
-        app.owner_id = user.id
-        db.session.add(user)
-        db.session.add(app)
-        db.session.commit()
-
-        self.signin(email=user.email_addr, password=Fixtures.password)
-        # Now with a real app
-        uri = '/app/%s/tasks/export' % Fixtures.app_short_name
-        res = self.app.get(uri, follow_redirects=True)
-        heading = "<strong>%s</strong>: Export All Tasks and Task Runs" % Fixtures.app_name
-        assert heading in res.data, "Export page should be available\n %s" % res.data
-        # Now get the tasks in CKAN format
-        uri = "/app/%s/tasks/export?type=task&format=ckan" % Fixtures.app_short_name
-        with patch.dict(self.flask_app.config, {'CKAN_URL': 'http://ckan.com'}):
-            # First time exporting the package
-            res = self.app.get(uri, follow_redirects=True)
-            msg = 'Error'
-            err_msg = "An exception should be raised"
-            assert msg in res.data, err_msg
-
-    @with_context
-    @patch('pybossa.view.applications.Ckan', autospec=True)
-    def test_export_tasks_ckan_connection_error(self, mock1):
-        mocks = [Mock()]
-        from test_ckan import TestCkanModule
-        fake_ckn = TestCkanModule()
-        package = fake_ckn.pkg_json_found
-        package['id'] = 3
-        mocks[0].package_exists.return_value = (False, ConnectionError)
-        # mocks[0].package_create.return_value = fake_ckn.pkg_json_found
-        # mocks[0].resource_create.return_value = dict(result=dict(id=3))
-        # mocks[0].datastore_create.return_value = 'datastore'
-        # mocks[0].datastore_upsert.return_value = 'datastore'
-
-        mock1.side_effect = mocks
-
-        """Test WEB Export CKAN Tasks works."""
-        Fixtures.create()
-        user = db.session.query(User).filter_by(name=Fixtures.name).first()
-        app = db.session.query(App).first()
-        user.ckan_api = 'ckan-api-key'
-        app.owner_id = user.id
-        db.session.add(user)
-        db.session.add(app)
-        db.session.commit()
-
-        self.signin(email=user.email_addr, password=Fixtures.password)
-        # Now with a real app
-        uri = '/app/%s/tasks/export' % Fixtures.app_short_name
-        res = self.app.get(uri, follow_redirects=True)
-        heading = "<strong>%s</strong>: Export All Tasks and Task Runs" % Fixtures.app_name
-        assert heading in res.data, "Export page should be available\n %s" % res.data
-        # Now get the tasks in CKAN format
-        uri = "/app/%s/tasks/export?type=task&format=ckan" % Fixtures.app_short_name
-        with patch.dict(self.flask_app.config, {'CKAN_URL': 'http://ckan.com'}):
-            # First time exporting the package
-            res = self.app.get(uri, follow_redirects=True)
-            msg = 'CKAN server seems to be down'
-            err_msg = "A connection exception should be raised"
-            assert msg in res.data, err_msg
-
-    @with_context
-    @patch('pybossa.view.applications.Ckan', autospec=True)
-    def test_task_export_tasks_ckan_first_time(self, mock1):
-        """Test WEB Export CKAN Tasks works without an existing package."""
-        # Second time exporting the package
-        mocks = [Mock()]
-        resource = dict(name='task', id=1)
-        package = dict(id=3, resources=[resource])
-        mocks[0].package_exists.return_value = (None, None)
-        mocks[0].package_create.return_value = package
-        #mocks[0].datastore_delete.return_value = None
-        mocks[0].datastore_create.return_value = None
-        mocks[0].datastore_upsert.return_value = None
-        mocks[0].resource_create.return_value = dict(result=dict(id=3))
-        mocks[0].datastore_create.return_value = 'datastore'
-        mocks[0].datastore_upsert.return_value = 'datastore'
-
-        mock1.side_effect = mocks
-
-        Fixtures.create()
-        user = db.session.query(User).filter_by(name=Fixtures.name).first()
-        app = db.session.query(App).first()
-        user.ckan_api = 'ckan-api-key'
-        app.owner_id = user.id
-        db.session.add(user)
-        db.session.add(app)
-        db.session.commit()
-
-        self.signin(email=user.email_addr, password=Fixtures.password)
-        # First test for a non-existant app
-        uri = '/app/somethingnotexists/tasks/export'
-        res = self.app.get(uri, follow_redirects=True)
-        assert res.status == '404 NOT FOUND', res.status
-        # Now get the tasks in CKAN format
-        uri = "/app/somethingnotexists/tasks/export?type=task&format=ckan"
-        res = self.app.get(uri, follow_redirects=True)
-        assert res.status == '404 NOT FOUND', res.status
-        # Now get the tasks in CKAN format
-        uri = "/app/somethingnotexists/tasks/export?type=other&format=ckan"
-        res = self.app.get(uri, follow_redirects=True)
-        assert res.status == '404 NOT FOUND', res.status
-
-
-        # Now with a real app
-        uri = '/app/%s/tasks/export' % Fixtures.app_short_name
-        res = self.app.get(uri, follow_redirects=True)
-        heading = "<strong>%s</strong>: Export All Tasks and Task Runs" % Fixtures.app_name
-        assert heading in res.data, "Export page should be available\n %s" % res.data
-        # Now get the tasks in CKAN format
-        uri = "/app/%s/tasks/export?type=task&format=ckan" % Fixtures.app_short_name
-        #res = self.app.get(uri, follow_redirects=True)
-        with patch.dict(self.flask_app.config, {'CKAN_URL': 'http://ckan.com'}):
-            # First time exporting the package
-            res = self.app.get(uri, follow_redirects=True)
-            msg = 'Data exported to http://ckan.com'
-            err_msg = "Tasks should be exported to CKAN"
-            assert msg in res.data, err_msg
-
-
-
-    @with_context
-    @patch('pybossa.view.applications.Ckan', autospec=True)
-    def test_task_export_tasks_ckan_second_time(self, mock1):
-        """Test WEB Export CKAN Tasks works with an existing package."""
-        # Second time exporting the package
-        mocks = [Mock()]
-        resource = dict(name='task', id=1)
-        package = dict(id=3, resources=[resource])
-        mocks[0].package_exists.return_value = (package, None)
-        mocks[0].package_update.return_value = package
-        mocks[0].datastore_delete.return_value = None
-        mocks[0].datastore_create.return_value = None
-        mocks[0].datastore_upsert.return_value = None
-        mocks[0].resource_create.return_value = dict(result=dict(id=3))
-        mocks[0].datastore_create.return_value = 'datastore'
-        mocks[0].datastore_upsert.return_value = 'datastore'
-
-        mock1.side_effect = mocks
-
+    @patch('pybossa.view.applications.exporter_queue.enqueue')
+    def test_export_tasks_ckan_enqueues_job(self, enqueue):
+        """Test WEB Export CKAN Tasks enqueues a background export job."""
+        from pybossa.jobs import export_to_ckan, HOUR
         Fixtures.create()
         user = db.session.query(User).filter_by(name=Fixtures.name).first()
         app = db.session.query(App).first()
@@ -2634,77 +2573,35 @@ class TestWeb(web.Helper):
 
         self.signin(email=user.email_addr, password=Fixtures.password)
         # First test for a non-existant app
-        uri = '/app/somethingnotexists/tasks/export'
-        res = self.app.get(uri, follow_redirects=True)
-        assert res.status == '404 NOT FOUND', res.status
-        # Now get the tasks in CKAN format
         uri = "/app/somethingnotexists/tasks/export?type=task&format=ckan"
         res = self.app.get(uri, follow_redirects=True)
         assert res.status == '404 NOT FOUND', res.status
 
-        # Now with a real app
-        uri = '/app/%s/tasks/export' % Fixtures.app_short_name
-        res = self.app.get(uri, follow_redirects=True)
-        heading = "<strong>%s</strong>: Export All Tasks and Task Runs" % Fixtures.app_name
-        assert heading in res.data, "Export page should be available\n %s" % res.data
-        # Now get the tasks in CKAN format
         uri = "/app/%s/tasks/export?type=task&format=ckan" % Fixtures.app_short_name
-        #res = self.app.get(uri, follow_redirects=True)
         with patch.dict(self.flask_app.config, {'CKAN_URL': 'http://ckan.com'}):
-            # First time exporting the package
             res = self.app.get(uri, follow_redirects=True)
-            msg = 'Data exported to http://ckan.com'
-            err_msg = "Tasks should be exported to CKAN"
+            msg = 'Exporting data to http://ckan.com'
+            err_msg = "Tasks should be exported to CKAN in the background"
             assert msg in res.data, err_msg
+        app_url = 'http://localhost/app/%s/' % Fixtures.app_short_name
+        enqueue.assert_called_once_with(export_to_ckan, app.id, 'task',
+                                        user.id, app_url, timeout=HOUR)
 
     @with_context
-    @patch('pybossa.view.applications.Ckan', autospec=True)
-    def test_task_export_tasks_ckan_without_resources(self, mock1):
-        """Test WEB Export CKAN Tasks works without resources ."""
-        mocks = [Mock()]
-        package = dict(id=3, resources=[])
-        mocks[0].package_exists.return_value = (package, None)
-        mocks[0].package_update.return_value = package
-        mocks[0].resource_create.return_value = dict(result=dict(id=3))
-        mocks[0].datastore_create.return_value = 'datastore'
-        mocks[0].datastore_upsert.return_value = 'datastore'
-
-
-        mock1.side_effect = mocks
-
+    @patch('pybossa.view.applications.exporter_queue.enqueue')
+    def test_export_ckan_unknown_type(self, enqueue):
+        """Test WEB Export CKAN returns 404 for unknown types."""
         Fixtures.create()
         user = db.session.query(User).filter_by(name=Fixtures.name).first()
-        app = db.session.query(App).first()
         user.ckan_api = 'ckan-api-key'
-        app.owner_id = user.id
         db.session.add(user)
-        db.session.add(app)
         db.session.commit()
 
         self.signin(email=user.email_addr, password=Fixtures.password)
-        # First test for a non-existant app
-        uri = '/app/somethingnotexists/tasks/export'
-        res = self.app.get(uri, follow_redirects=True)
-        assert res.status == '404 NOT FOUND', res.status
-        # Now get the tasks in CKAN format
-        uri = "/app/somethingnotexists/tasks/export?type=task&format=ckan"
+        uri = "/app/%s/tasks/export?type=other&format=ckan" % Fixtures.app_short_name
         res = self.app.get(uri, follow_redirects=True)
         assert res.status == '404 NOT FOUND', res.status
-
-        # Now with a real app
-        uri = '/app/%s/tasks/export' % Fixtures.app_short_name
-        res = self.app.get(uri, follow_redirects=True)
-        heading = "<strong>%s</strong>: Export All Tasks and Task Runs" % Fixtures.app_name
-        assert heading in res.data, "Export page should be available\n %s" % res.data
-        # Now get the tasks in CKAN format
-        uri = "/app/%s/tasks/export?type=task&format=ckan" % Fixtures.app_short_name
-        #res = self.app.get(uri, follow_redirects=True)
-        with patch.dict(self.flask_app.config, {'CKAN_URL': 'http://ckan.com'}):
-            # First time exporting the package
-            res = self.app.get(uri, follow_redirects=True)
-            msg = 'Data exported to http://ckan.com'
-            err_msg = "Tasks should be exported to CKAN"
-            assert msg in res.data, err_msg
+        assert not enqueue.called
 
     @with_context
     @patch('pybossa.view.applications.uploader.upload_file', return_value=True)
@@ -2780,11 +2677,72 @@ class TestWeb(web.Helper):
         assert task is not None, "Task was not imported"
         assert "1 new task was imported successfully" in res.data
 
+    def test_import_tasks_from_uploaded_csv_file(self):
+        """Test WEB import tasks from an uploaded CSV file works"""
+        self.register()
+        self.new_application()
+        app = db.session.query(App).first()
+        url = '/app/%s/tasks/import?template=upload' % app.short_name
+        upload = (StringIO.StringIO('Foo,Bar,priority_0\n1,2,0.5\n'),
+                  'tasks.csv')
+        res = self.app.post(url, data={'file': upload, 'file_format': 'csv',
+                                       'form_name': 'upload'},
+                            follow_redirects=True)
+        task = db.session.query(Task).first()
+
+        assert "1 new task was imported successfully" in res.data
+        assert task.info == {u'Foo': u'1', u'Bar': u'2'}, task.info
+        assert task.priority_0 == 0.5, task.priority_0
+
+    @patch('pybossa.importers.os.remove')
+    def test_import_tasks_from_uploaded_ndjson_file(self, remove):
+        """Test WEB import tasks from an uploaded JSON lines file works and
+        the file is removed afterwards"""
+        self.register()
+        self.new_application()
+        app = db.session.query(App).first()
+        url = '/app/%s/tasks/import?template=upload' % app.short_name
+        lines = '{"Foo": 1, "n_answers": 3}\n\n{"Foo": [2]}\n'
+        upload = (StringIO.StringIO(lines), 'tasks.json')
+        res = self.app.post(url, data={'file': upload,
+                                       'file_format': 'ndjson',
+                                       'form_name': 'upload'},
+                            follow_redirects=True)
+        tasks = db.session.query(Task).order_by(Task.id).all()
+
+        assert "2 new tasks were imported successfully" in res.data
+        assert [t.info for t in tasks] == [{'Foo': 1}, {'Foo': [2]}], tasks
+        assert tasks[0].n_answers == 3, tasks[0].n_answers
+        path = remove.call_args[0][0]
+        assert open(path).read() == lines
+        os.remove(path)
+
+    def test_import_tasks_from_file_in_the_server(self):
+        """Test WEB admins can import tasks from a file in the server, which
+        is not removed"""
+        import tempfile
+        self.register()
+        self.new_application()
+        app = db.session.query(App).first()
+        url = '/app/%s/tasks/import?template=upload' % app.short_name
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write('Foo\n1\n')
+        res = self.app.post(url, data={'file_path': path,
+                                       'file_format': 'csv',
+                                       'form_name': 'upload'},
+                            follow_redirects=True)
+
+        assert "1 new task was imported successfully" in res.data
+        assert os.path.exists(path)
+        os.remove(path)
+
     @patch('pybossa.view.applications.importer_queue', autospec=True)
     @patch('pybossa.view.applications.importers.create_importer_for')
     def test_import_tasks_as_background_job(self, create_importer, queue):
         """Test WEB importing a big amount of tasks is done in the background"""
         from pybossa.view.applications import MAX_NUM_SYNCHR_TASKS_IMPORT
+        from pybossa.jobs import HOUR
         number_tasks = MAX_NUM_SYNCHR_TASKS_IMPORT + 1
         importer = create_importer.return_value
         tasks_info = [{'info': {'Foo': i}} for i in range(number_tasks)]
@@ -2799,7 +2757,13 @@ class TestWeb(web.Helper):
         tasks = db.session.query(Task).all()
 
         assert tasks == [], "Tasks should not be immediately added"
-        queue.enqueue.assert_called_once_with(import_tasks, tasks_info, app.id)
+        args, kwargs = queue.enqueue.call_args
+        assert args == (import_tasks, app.id), args
+        import_id = kwargs.pop('import_id')
+        assert kwargs == dict(timeout=HOUR, type='csv',
+                              csv_url='http://myfakecsvurl.com'), kwargs
+        progress = JobProgress(sentinel.master, 'import', import_id).get()
+        assert progress['state'] == 'queued', progress
         msg = "You're trying to import a large amount of tasks, so please be patient.\
             You will receive an email when the tasks are ready."
         assert msg in res.data
@@ -2877,6 +2841,23 @@ class TestWeb(web.Helper):
         err_msg = "Admin should get 200 in POST"
         assert res.status_code == 200, err_msg
 
+    @with_context
+    @patch('pybossa.view.applications.MAX_NUM_SYNCHR_TASKS_DELETE', 0)
+    @patch('pybossa.view.applications.importer_queue', autospec=True)
+    def test_56_delete_tasks_as_background_job(self, queue):
+        """Test WEB delete tasks of a big project is done in the background"""
+        from pybossa.jobs import delete_tasks, HOUR
+        Fixtures.create()
+        self.signin(email=u'tester@tester.com', password=u'tester')
+
+        res = self.app.post('/app/test-app/tasks/delete', follow_redirects=True)
+
+        assert "are being deleted" in res.data, res.data
+        queue.enqueue.assert_called_once_with(delete_tasks, 1, timeout=HOUR)
+        assert db.session.query(Task).filter_by(app_id=1).count() > 0
+        progress = JobProgress(sentinel.master, 'delete_tasks', 1).get()
+        assert progress['state'] == 'queued', progress
+
     @with_context
     def test_57_reset_api_key(self):
         """Test WEB reset api key works"""
@@ -3338,6 +3319,27 @@ class TestWeb(web.Helper):
         err_msg = "There should be a %s section" % form_id
         assert dom.find(id=form_id) is not None, err_msg
 
+    @with_context
+    @patch('pybossa.view.applications.MAX_NUM_SYNCHR_TASKS_UPDATE', 0)
+    @patch('pybossa.view.applications.importer_queue', autospec=True)
+    def test_task_redundancy_update_as_background_job(self, queue):
+        """Test WEB updating the redundancy of a big project is done in the
+        background"""
+        from pybossa.jobs import update_tasks_redundancy, HOUR
+        self.register()
+        self.new_application()
+        self.new_task(1)
+
+        res = self.task_settings_redundancy(short_name="sampleapp",
+                                            n_answers=5)
+
+        assert "is being updated" in res.data, res.data
+        queue.enqueue.assert_called_once_with(update_tasks_redundancy, 1, 5,
+                                              timeout=HOUR)
+        assert db.session.query(Task).get(1).n_answers != 5
+        progress = JobProgress(sentinel.master, 'redundancy', 1).get()
+        assert progress['state'] == 'queued', progress
+
     @with_context
     def test_task_redundancy_update_updates_task_state(self):
         """Test WEB when updating the redundancy of the tasks in a project, the
@@ -3463,6 +3465,28 @@ class TestWeb(web.Helper):
         assert dom.find(id=form_id) is not None, err_msg
 
 
+    @with_context
+    @patch('pybossa.view.applications.uploader.upload_file', return_value=True)
+    def test_77_task_settings_priority_of_many_tasks(self, mock):
+        """Test WEB TASK SETTINGS priority stores the priority of all the
+        tasks and logs the update"""
+        self.register()
+        self.new_application()
+        self.new_task(1)
+        task_ids = [t.id for t in db.session.query(Task).all()]
+
+        res = self.task_settings_priority(
+            task_ids=','.join(str(_id) for _id in task_ids), priority_0=0.5)
+
+        dom = BeautifulSoup(res.data)
+        assert dom.find(id='msg_success') is not None, res.data
+        for task in db.session.query(Task).all():
+            assert task.priority_0 == 0.5, task.priority_0
+        log = db.session.query(Auditlog).filter_by(
+            attribute='task.priority_0').one()
+        assert json.loads(log.new_value) == {'priority_0': 0.5}, log.new_value
+
+
     @with_context
     def test_78_cookies_warning(self):
         """Test WEB cookies warning is displayed"""